@@ -1,10 +1,13 @@
 from flask import Flask
 from flask_compress import Compress
-from sqlalchemy import event
-from sqlalchemy.engine import Engine
-
 from app.config import AppConfig
 from app.extensions import sock, db
+from app import db_settings, realtime
+from app.serializers import user_cards
+from app.response_cache import response_cache
+from app.moderation import moderator
+from app.listing import count_cache
+from app.previews import previews
 from app.blueprints.backend import backend_bp
 from app.blueprints.frontend import frontend_bp
 from app.blueprints.game import game_bp
@@ -18,15 +21,16 @@ def create_app():
     Compress(app)
     
     sock.init_app(app)
+    # 连接池和只读引擎要在 db.init_app 建引擎之前配置，PRAGMA (WAL 等) 在之后按引擎注册
+    db_settings.configure(app)
     db.init_app(app)
-
-    # Enable Write-Ahead Logging (WAL) for SQLite to improve concurrency
-    if 'sqlite' in app.config['SQLALCHEMY_DATABASE_URI']:
-        @event.listens_for(Engine, "connect")
-        def set_sqlite_pragma(dbapi_connection, connection_record):
-            cursor = dbapi_connection.cursor()
-            cursor.execute("PRAGMA journal_mode=WAL")
-            cursor.close()
+    db_settings.init_app(app, db)
+    realtime.init_app(app)
+    user_cards.init_app(app)
+    response_cache.init_app(app)
+    moderator.init_app(app)
+    count_cache.init_app(app)
+    previews.init_app(app)
 
     app.register_blueprint(backend_bp, url_prefix="/admin")
     app.register_blueprint(frontend_bp, url_prefix="/")
@@ -0,0 +1,222 @@
+import os
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+from flask import current_app
+
+from app.extensions import db
+from app.models import Message, MessageArchive, Room
+
+COLUMNS = 'id, content, msg_type, timestamp, user_id, room_id'
+# 每个月一个归档库，表结构与热库 messages 相同
+ARCHIVE_SCHEMA = [
+    "CREATE TABLE IF NOT EXISTS arc.messages (id INTEGER PRIMARY KEY, content TEXT NOT NULL, "
+    "msg_type VARCHAR(20), timestamp DATETIME, user_id INTEGER, room_id INTEGER NOT NULL)",
+    "CREATE INDEX IF NOT EXISTS arc.idx_messages_room_id_id ON messages (room_id, id)",
+    "CREATE INDEX IF NOT EXISTS arc.idx_messages_room_id_timestamp ON messages (room_id, timestamp)",
+    "CREATE INDEX IF NOT EXISTS arc.idx_messages_timestamp ON messages (timestamp)",
+]
+# SQLAlchemy DateTime 在 SQLite 里的存储格式，原生 SQL 比较时间时用
+_TS_FORMAT = '%Y-%m-%d %H:%M:%S.%f'
+
+
+def archive_path(month):
+    return os.path.join(current_app.config['MESSAGE_ARCHIVE_DIR'], f'messages_{month}.db')
+
+
+@contextmanager
+def attached(path):
+    """借连接池的一个连接 ATTACH 归档库 (别名 arc)，用完 DETACH 再归还；path 为空时不 ATTACH
+
+    连接处于自动提交模式，需要事务时自己 BEGIN / COMMIT。
+    """
+    raw = db.engine.raw_connection()
+    conn = raw.driver_connection
+    isolation = conn.isolation_level
+    conn.isolation_level = None
+    try:
+        if path is None:
+            yield conn
+            return
+        conn.execute('ATTACH DATABASE ? AS arc', (path,))
+        try:
+            yield conn
+        finally:
+            conn.execute('DETACH DATABASE arc')
+    finally:
+        conn.isolation_level = isolation
+        raw.close()
+
+
+def archive_messages(older_than_days, batch=500, pause=0.05, progress=None):
+    """把 older_than_days 天前的消息按月移到归档库，每批一个短事务；返回移动的条数
+
+    每个群的最后一条消息留在热库 (侧边栏预览)。全表 id 最大的消息也不动：
+    messages.id 没有 AUTOINCREMENT，热库被清空后 id 会重新从 1 分配，和归档冲突。
+    """
+    cutoff = datetime.utcnow() - timedelta(days=older_than_days)
+    max_id = db.session.query(db.func.max(Message.id)).scalar()
+    if max_id is None:
+        return 0
+    os.makedirs(current_app.config['MESSAGE_ARCHIVE_DIR'], exist_ok=True)
+    keep = db.select(Room.last_message_id).where(Room.last_message_id.isnot(None))
+    moved = 0
+    while True:
+        rows = db.session.query(Message.id, Message.timestamp).filter(
+            Message.timestamp < cutoff, Message.id < max_id, Message.id.notin_(keep)
+        ).order_by(Message.timestamp).limit(batch).all()
+        db.session.rollback()
+        if not rows:
+            return moved
+        by_month = defaultdict(list)
+        for msg_id, timestamp in rows:
+            by_month[timestamp.strftime('%Y-%m')].append(msg_id)
+        for month, ids in sorted(by_month.items()):
+            _move_to_archive(month, ids)
+        moved += len(rows)
+        if progress:
+            progress(moved)
+        time.sleep(pause)
+
+
+def _move_to_archive(month, ids):
+    # 写归档、登记目录、删热库在一个事务里；WAL 模式下跨库提交不是原子的，
+    # 中途崩溃最多留下两边都有的行，重跑时 INSERT OR IGNORE 跳过
+    marks = ', '.join('?' * len(ids))
+    now = datetime.utcnow().strftime(_TS_FORMAT)
+    with attached(archive_path(month)) as conn:
+        for statement in ARCHIVE_SCHEMA:
+            conn.execute(statement)
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            conn.execute(
+                "INSERT INTO message_archives (month, room_id, min_id, max_id, message_count, updated_at) "
+                f"SELECT ?, room_id, MIN(id), MAX(id), COUNT(*), ? FROM main.messages WHERE id IN ({marks}) "
+                "GROUP BY room_id "
+                "ON CONFLICT (month, room_id) DO UPDATE SET min_id = MIN(min_id, excluded.min_id), "
+                "max_id = MAX(max_id, excluded.max_id), message_count = message_count + excluded.message_count, "
+                "updated_at = excluded.updated_at",
+                (month, now, *ids))
+            conn.execute(
+                f"INSERT OR IGNORE INTO arc.messages ({COLUMNS}) "
+                f"SELECT {COLUMNS} FROM main.messages WHERE id IN ({marks})", ids)
+            conn.execute(f"DELETE FROM main.messages WHERE id IN ({marks})", ids)
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+
+
+def load_archived(room_id, before_id, limit):
+    """按 id 倒序取该群归档中 id < before_id 的消息，按需 ATTACH 对应月份的归档库
+
+    返回不在 session 中的 Message 对象，可直接交给 serialize_messages。
+    """
+    archives = MessageArchive.query.filter(
+        MessageArchive.room_id == room_id, MessageArchive.min_id < before_id
+    ).order_by(MessageArchive.max_id.desc()).all()
+    messages = []
+    for archive in archives:
+        path = archive_path(archive.month)
+        if not os.path.exists(path):
+            continue
+        with attached(path) as conn:
+            rows = conn.execute(
+                f"SELECT {COLUMNS} FROM arc.messages WHERE room_id = ? AND id < ? ORDER BY id DESC LIMIT ?",
+                (room_id, before_id, limit - len(messages))).fetchall()
+        messages.extend(_to_message(row) for row in rows)
+        if len(messages) >= limit:
+            break
+        if rows:
+            before_id = rows[-1][0]
+    return messages
+
+
+def _to_message(row):
+    msg_id, content, msg_type, timestamp, user_id, room_id = row
+    if isinstance(timestamp, str):
+        timestamp = datetime.fromisoformat(timestamp)
+    return Message(id=msg_id, content=content, msg_type=msg_type, timestamp=timestamp,
+                   user_id=user_id, room_id=room_id)
+
+
+def purge_expired(default_days=0, batch=500, pause=0.05, progress=None):
+    """按群的保留天数删除过期消息 (热库和归档)，每批一个短事务；返回删除的条数
+
+    rooms.retention_days 为空时用 default_days，0 表示永久保留。
+    """
+    now = datetime.utcnow()
+    max_id = db.session.query(db.func.max(Message.id)).scalar()
+    rooms = db.session.query(Room.id, Room.retention_days).all()
+    total = 0
+    for room_id, days in rooms:
+        days = default_days if days is None else days
+        if not days:
+            continue
+        cutoff = now - timedelta(days=days)
+        removed = _purge_hot(room_id, cutoff, max_id, batch, pause)
+        removed += _purge_archives(room_id, cutoff, batch, pause)
+        total += removed
+        if progress and removed:
+            progress(room_id, removed)
+    return total
+
+
+def _purge_hot(room_id, cutoff, max_id, batch, pause):
+    removed = 0
+    while True:
+        ids = [msg_id for (msg_id,) in db.session.query(Message.id).filter(
+            Message.room_id == room_id, Message.timestamp < cutoff, Message.id != max_id
+        ).order_by(Message.timestamp).limit(batch)]
+        if not ids:
+            break
+        db.session.execute(db.delete(Message).where(Message.id.in_(ids)), execution_options={'synchronize_session': False})
+        db.session.commit()
+        removed += len(ids)
+        time.sleep(pause)
+    if removed:
+        # room_state 写入消息时会用到 rollups，rollups 又依赖本模块，这里延迟导入
+        from app.room_state import refresh_last_message
+        refresh_last_message(room_id)
+        db.session.commit()
+    return removed
+
+
+def _purge_archives(room_id, cutoff, batch, pause):
+    archives = MessageArchive.query.filter(
+        MessageArchive.room_id == room_id, MessageArchive.month <= cutoff.strftime('%Y-%m')
+    ).all()
+    cutoff = cutoff.strftime(_TS_FORMAT)
+    removed = 0
+    for archive in archives:
+        path = archive_path(archive.month)
+        if not os.path.exists(path):
+            db.session.delete(archive)
+            continue
+        with attached(path) as conn:
+            while True:
+                cursor = conn.execute(
+                    "DELETE FROM arc.messages WHERE id IN "
+                    "(SELECT id FROM arc.messages WHERE room_id = ? AND timestamp < ? LIMIT ?)",
+                    (room_id, cutoff, batch))
+                removed += cursor.rowcount
+                if cursor.rowcount < batch:
+                    break
+                time.sleep(pause)
+            min_id, max_id, count = conn.execute(
+                "SELECT MIN(id), MAX(id), COUNT(*) FROM arc.messages WHERE room_id = ?", (room_id,)).fetchone()
+        if count:
+            archive.min_id, archive.max_id, archive.message_count = min_id, max_id, count
+        else:
+            db.session.delete(archive)
+    db.session.commit()
+
+    # 已经没有任何群的归档文件直接删除
+    for month in {archive.month for archive in archives}:
+        if not MessageArchive.query.filter_by(month=month).first():
+            path = archive_path(month)
+            if os.path.exists(path):
+                os.remove(path)
+    return removed
@@ -0,0 +1,180 @@
+import hashlib
+import mimetypes
+import os
+import re
+import struct
+from datetime import datetime
+from urllib.parse import quote
+
+from app.extensions import db
+from app.models import Attachment, Message, Room, User
+
+CHUNK_SIZE = 64 * 1024
+# 聊天里以 URL 形式发送的附件消息类型
+ATTACHMENT_TYPES = ('image', 'file', 'audio')
+# 文件头识别的图片格式，扩展名不可信
+_MAGIC = [
+    (b'\x89PNG\r\n\x1a\n', 'image/png'),
+    (b'GIF87a', 'image/gif'),
+    (b'GIF89a', 'image/gif'),
+    (b'\xff\xd8\xff', 'image/jpeg'),
+    (b'BM', 'image/bmp'),
+]
+# 旧的上传文件名: 时间戳_原文件名
+_TIMESTAMPED = re.compile(r'^\d{14}_(.+)$')
+
+
+def sniff_mime(head, filename):
+    for magic, mime in _MAGIC:
+        if head.startswith(magic):
+            return mime
+    if head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+        return 'image/webp'
+    return mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+
+
+def image_size(path, mime):
+    """从文件头读取图片宽高 (PNG/GIF/JPEG/WebP/BMP)，不依赖 Pillow；读不出返回 (None, None)"""
+    try:
+        with open(path, 'rb') as f:
+            head = f.read(32)
+            if mime == 'image/png' and head[12:16] == b'IHDR':
+                return struct.unpack('>II', head[16:24])
+            if mime == 'image/gif':
+                return struct.unpack('<HH', head[6:10])
+            if mime == 'image/bmp':
+                width, height = struct.unpack('<ii', head[18:26])
+                return width, abs(height)
+            if mime == 'image/webp':
+                return _webp_size(head)
+            if mime == 'image/jpeg':
+                f.seek(2)
+                return _jpeg_size(f)
+    except (OSError, struct.error):
+        pass
+    return None, None
+
+
+def _webp_size(head):
+    chunk = head[12:16]
+    if chunk == b'VP8 ':
+        width, height = struct.unpack('<HH', head[26:30])
+        return width & 0x3fff, height & 0x3fff
+    if chunk == b'VP8L':
+        bits = int.from_bytes(head[21:25], 'little')
+        return (bits & 0x3fff) + 1, ((bits >> 14) & 0x3fff) + 1
+    if chunk == b'VP8X':
+        return int.from_bytes(head[24:27], 'little') + 1, int.from_bytes(head[27:30], 'little') + 1
+    return None, None
+
+
+def _jpeg_size(f):
+    # 逐个跳过 segment，直到 SOF 帧头
+    while True:
+        marker = f.read(2)
+        if len(marker) < 2 or marker[0] != 0xff:
+            return None, None
+        if marker[1] in (0xd8, 0x01) or 0xd0 <= marker[1] <= 0xd7:
+            continue
+        length = struct.unpack('>H', f.read(2))[0]
+        if 0xc0 <= marker[1] <= 0xcf and marker[1] not in (0xc4, 0xc8, 0xcc):
+            height, width = struct.unpack('>xHH', f.read(5))
+            return width, height
+        f.seek(length - 2, os.SEEK_CUR)
+
+
+def inspect_file(path, filename=None):
+    """文件大小、sha256、MIME 和图片宽高"""
+    digest = hashlib.sha256()
+    size = 0
+    head = b''
+    with open(path, 'rb') as f:
+        while True:
+            chunk = f.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            if not head:
+                head = chunk[:32]
+            digest.update(chunk)
+            size += len(chunk)
+    mime = sniff_mime(head, filename or path)
+    width, height = image_size(path, mime) if mime.startswith('image/') else (None, None)
+    return {'size': size, 'sha256': digest.hexdigest(), 'mime': mime, 'width': width, 'height': height}
+
+
+def kind_of(mime):
+    if mime.startswith('image/'):
+        return 'image'
+    if mime.startswith('audio/'):
+        return 'audio'
+    return 'file'
+
+
+def record_upload(path, url, original_name, uploader_id, room_id=None, kind=None):
+    """登记一个已保存的上传文件，返回 Attachment (已 add，由调用方提交)"""
+    info = inspect_file(path, original_name)
+    attachment = Attachment(url=url, original_name=original_name, kind=kind or kind_of(info['mime']),
+                            uploader_id=uploader_id, room_id=room_id, **info)
+    db.session.add(attachment)
+    return attachment
+
+
+def by_urls(urls):
+    """{url: Attachment}，一次 IN 查询"""
+    if not urls:
+        return {}
+    return {a.url: a for a in Attachment.query.filter(Attachment.url.in_(set(urls)))}
+
+
+def storage_usage(group='user', limit=20):
+    """按上传者或群汇总附件数和字节数，[{id, name, count, bytes}]，按字节数倒序"""
+    column = Attachment.uploader_id if group == 'user' else Attachment.room_id
+    total = db.func.sum(Attachment.size)
+    rows = db.session.query(column, db.func.count(), total).filter(column.isnot(None)).group_by(column)\
+        .order_by(total.desc()).limit(limit).all()
+    if not rows:
+        return []
+    if group == 'user':
+        names = dict(db.session.query(User.id, db.func.coalesce(User.nickname, User.username))
+                     .filter(User.id.in_([r[0] for r in rows])))
+    else:
+        names = dict(db.session.query(Room.id, Room.name).filter(Room.id.in_([r[0] for r in rows])))
+    return [{'id': key, 'name': names.get(key, 'Unknown'), 'count': count, 'bytes': size or 0}
+            for key, count, size in rows]
+
+
+def backfill(upload_dir, url_prefix='/static/uploads/', batch=200, progress=None):
+    """把 upload_dir 里还没登记的文件写入 attachments，返回新登记的个数
+
+    上传者、群、上传时间按引用该 URL 的第一条附件消息推断；头像按 users.avatar。
+    消息在归档库里的文件找不到来源，只登记文件本身。
+    """
+    known = {url for (url,) in db.session.query(Attachment.url)}
+    senders = {}
+    for content, user_id, room_id, timestamp in db.session.query(
+            Message.content, Message.user_id, Message.room_id, Message.timestamp
+    ).filter(Message.msg_type.in_(ATTACHMENT_TYPES)).order_by(Message.id):
+        senders.setdefault(content, (user_id, room_id, timestamp))
+    avatars = {avatar: user_id for user_id, avatar in db.session.query(User.id, User.avatar)
+               .filter(User.avatar.like(url_prefix + '%'))}
+
+    added = 0
+    for name in sorted(os.listdir(upload_dir)):
+        path = os.path.join(upload_dir, name)
+        # url_for 生成的 URL 会转义中文、空格，消息里存的是转义后的
+        url = next((u for u in (url_prefix + name, url_prefix + quote(name)) if u in senders or u in avatars),
+                   url_prefix + name)
+        if url in known or not os.path.isfile(path):
+            continue
+        user_id, room_id, created_at = senders.get(url, (avatars.get(url), None, None))
+        match = _TIMESTAMPED.match(name)
+        attachment = record_upload(path, url, match.group(1) if match else name, user_id, room_id,
+                                   kind='avatar' if url in avatars and url not in senders else None)
+        attachment.created_at = created_at or datetime.utcfromtimestamp(os.path.getmtime(path))
+        added += 1
+        if added % batch == 0:
+            db.session.commit()
+            if progress:
+                progress(added)
+    db.session.commit()
+    return added
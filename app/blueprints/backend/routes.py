@@ -2,10 +2,28 @@ from flask import render_template, session, redirect, url_for, request, jsonify,
 
 from app.blueprints.backend import backend_bp
 
-from app.models import User, Room, Message, Admin, RoomMember, Friendship, ServerConfig, AIModel, ThirdPartyAPI, Menu, Role
+from app.models import User, Room, Message, Attachment, Admin, RoomMember, Friendship, ServerConfig, AIModel, ThirdPartyAPI, Menu, Role
 
 from app.extensions import db
 
+from app.serializers import serialize_messages, user_cards
+
+from app.db_settings import readonly_db, pool_stats
+
+from app.room_state import refresh_last_message
+
+from app import rollups
+
+from app.response_cache import response_cache
+from app.moderation import moderator, recent_flags
+from app.listing import KeysetPager, count_cache
+from app.previews import previews
+from app import attachments, storage
+
+from app.realtime import registry, heartbeat, presence, hub, frames, persister, ratelimiter
+
+from app.realtime.streaming import stream_stats
+
 from sqlalchemy import text, func
 
 from functools import wraps
@@ -118,11 +136,13 @@ def inject_menus():
 
 def backend_index():
 
-    user_count = User.query.count()
+    counts = rollups.totals()
+
+    user_count = counts['users']
 
     room_count = Room.query.filter(Room.code != None).count()
 
-    message_count = Message.query.count()
+    message_count = counts['messages']
 
     
 
@@ -152,25 +172,51 @@ def user_list():
 
 
 
-@backend_bp.route("/api/users")
+# 后台列表 keyset 分页 (app/listing.py)：按 id 倒序，id 自增与创建时间同序
+users_pager = KeysetPager('users', (User.id,))
 
-@admin_required
+rooms_pager = KeysetPager('rooms', (Room.id,))
 
-def get_users():
+room_messages_pager = KeysetPager('room_messages', (Message.id,))
+
+# 文件列表按类型拆成三个查询，各自走 (msg_type, timestamp) 索引
+files_pager = KeysetPager('files', (Message.timestamp, Message.id))
+
+interfaces_pager = KeysetPager('interfaces', (ThirdPartyAPI.id,), desc=False)
+
+attachments_pager = KeysetPager('attachments', (Attachment.id,))
+
+FILE_TYPES = ('image', 'file', 'audio')
 
+
+
+def list_page(pager, queries, scope=None):
+    # 读取 page/limit 以及 after/before 游标，游标无效时从第一页开始
     page = request.args.get('page', 1, type=int)
+    limit = min(request.args.get('limit', 20, type=int), 200)
+    try:
+        return pager.page(queries, page, limit, scope=scope,
+                          after=request.args.get('after'), before=request.args.get('before'))
+    except ValueError:
+        return pager.page(queries, 1, limit, scope=scope)
 
-    limit = request.args.get('limit', 20, type=int)
 
-    
 
-    pagination = User.query.order_by(User.created_at.desc()).paginate(page=page, per_page=limit, error_out=False)
+@backend_bp.route("/api/users")
+
+@admin_required
+
+@readonly_db
+
+def get_users():
+
+    items, cursor = list_page(users_pager, User.query)
 
     
 
     users = []
 
-    for u in pagination.items:
+    for u in items:
 
         users.append(u.to_dict())
 
@@ -182,9 +228,11 @@ def get_users():
 
         'msg': '',
 
-        'count': pagination.total,
+        'count': rollups.totals()['users'],
 
-        'data': users
+        'data': users,
+
+        'cursor': cursor
 
     })
 
@@ -212,6 +260,12 @@ def delete_user():
 
         db.session.commit()
 
+        hub.forget_user(user.id)
+
+        hub.user_changed(user.id)
+
+        invalidate_dashboard_cache()
+
         return jsonify({'success': True})
 
     return jsonify({'success': False, 'message': '用户不存在'})
@@ -242,6 +296,8 @@ def update_user():
 
         db.session.commit()
 
+        hub.user_changed(user.id)
+
         return jsonify({'success': True})
 
     return jsonify({'success': False, 'message': '用户不存在'})
@@ -296,23 +352,39 @@ def room_list():
 
 @admin_required
 
+@readonly_db
+
 def get_rooms():
 
-    page = request.args.get('page', 1, type=int)
+    rooms_query = Room.query.filter(Room.code != None)
 
-    limit = request.args.get('limit', 20, type=int)
+    items, cursor = list_page(rooms_pager, rooms_query)
 
     
 
-    pagination = Room.query.filter(Room.code != None).order_by(Room.created_at.desc()).paginate(page=page, per_page=limit, error_out=False)
-
-    
+    # 一页的成员数、被封禁成员数各一次分组查询
+    room_ids = [r.id for r in items]
+    member_counts = dict(db.session.query(RoomMember.room_id, func.count(RoomMember.id))
+                         .filter(RoomMember.room_id.in_(room_ids)).group_by(RoomMember.room_id).all())
+    banned_counts = dict(db.session.query(RoomMember.room_id, func.count(RoomMember.id))
+                         .join(User, User.id == RoomMember.user_id)
+                         .filter(RoomMember.room_id.in_(room_ids), User.is_banned == True)
+                         .group_by(RoomMember.room_id).all())
 
     data = []
 
-    for r in pagination.items:
-
-        d = r.to_dict()
+    for r in items:
+
+        d = {
+            'id': r.id,
+            'name': r.name,
+            'code': r.code,
+            'is_banned': r.is_banned,
+            'retention_days': r.retention_days,
+            'member_count': member_counts.get(r.id, 0),
+            'banned_member_count': banned_counts.get(r.id, 0),
+            'created_at': r.created_at.strftime('%Y-%m-%d %H:%M') if r.created_at else '',
+        }
 
         d['owner_name'] = r.owner.nickname if r.owner else 'Unknown'
 
@@ -326,9 +398,10 @@ def get_rooms():
 
         'msg': '',
 
-        'count': pagination.total,
+        'count': count_cache.get('rooms', lambda: Room.query.filter(Room.code != None).count()),
 
-        'data': data
+        'data': data,
+        'cursor': cursor
 
     })
 
@@ -352,6 +425,12 @@ def delete_room():
 
         db.session.commit()
 
+        hub.forget_room(room.id)
+
+        invalidate_dashboard_cache()
+
+        count_cache.invalidate('rooms')
+
         return jsonify({'success': True})
 
     return jsonify({'success': False})
@@ -384,10 +463,56 @@ def ban_room():
 
 
 
+@backend_bp.route("/api/room/retention", methods=['POST'])
+
+@admin_required
+
+def update_room_retention():
+
+    # 消息保留天数：空表示使用全局 MESSAGE_RETENTION_DAYS，0 表示永久保留；由 archive_messages.py 清理
+
+    data = request.get_json()
+
+    room = Room.query.get(data.get('id'))
+
+    if not room:
+
+        return jsonify({'success': False, 'message': '群不存在'})
+
+    days = data.get('retention_days')
+
+    if days in (None, ''):
+
+        room.retention_days = None
+
+    else:
+
+        try:
+
+            days = int(days)
+
+        except (TypeError, ValueError):
+
+            return jsonify({'success': False, 'message': '保留天数必须是整数'})
+
+        if days < 0:
+
+            return jsonify({'success': False, 'message': '保留天数不能小于 0'})
+
+        room.retention_days = days
+
+    db.session.commit()
+
+    return jsonify({'success': True})
+
+
+
 @backend_bp.route("/api/room/members")
 
 @admin_required
 
+@readonly_db
+
 def get_room_members():
 
     room_id = request.args.get('room_id')
@@ -472,17 +597,15 @@ def update_room_announcement():
 
 @admin_required
 
-def get_room_messages():
-
-    room_id = request.args.get('room_id')
+@readonly_db
 
-    page = request.args.get('page', 1, type=int)
+def get_room_messages():
 
-    limit = request.args.get('limit', 20, type=int)
+    room_id = request.args.get('room_id', type=int)
 
-    
+    messages_query = Message.query.filter_by(room_id=room_id)
 
-    pagination = Message.query.filter_by(room_id=room_id).order_by(Message.timestamp.desc()).paginate(page=page, per_page=limit, error_out=False)
+    items, cursor = list_page(room_messages_pager, messages_query, scope=room_id)
 
     
 
@@ -492,9 +615,10 @@ def get_room_messages():
 
         'msg': '', 
 
-        'count': pagination.total,
+        'count': count_cache.get(f'room_messages:{room_id}', lambda: Message.query.filter_by(room_id=room_id).count()),
 
-        'data': [m.to_dict() for m in pagination.items]
+        'data': serialize_messages(items),
+        'cursor': cursor
 
     })
 
@@ -516,27 +640,39 @@ def file_list():
 
 @admin_required
 
-def get_files():
+@readonly_db
 
-    page = request.args.get('page', 1, type=int)
+def get_files():
 
-    limit = request.args.get('limit', 20, type=int)
+    items, cursor = list_page(files_pager, [Message.query.filter(Message.msg_type == t) for t in FILE_TYPES])
 
     
 
-    pagination = Message.query.filter(Message.msg_type.in_(['image', 'file', 'audio'])).order_by(Message.timestamp.desc()).paginate(page=page, per_page=limit, error_out=False)
+    # 大小、类型等从 attachments 表按 URL 一次取出
 
-    
+    found = attachments.by_urls([m.content for m in items])
 
     data = []
 
-    for m in pagination.items:
+    for m, d in zip(items, serialize_messages(items)):
 
-        d = m.to_dict()
+        d['sender_name'] = d['user'] if m.user_id else 'Unknown'
 
-        d['sender_name'] = m.sender.nickname if m.sender else 'Unknown'
+        d['room_name'] = d['room'] or 'Unknown'
 
-        d['room_name'] = m.room.name if m.room else 'Unknown'
+        d['timestamp'] = m.timestamp.strftime('%Y-%m-%d %H:%M') if m.timestamp else ''
+
+        attachment = found.get(m.content)
+
+        d['filename'] = attachment.original_name if attachment else m.content.rsplit('/', 1)[-1]
+
+        d['url'] = m.content
+
+        d['size'] = format_size(attachment.size) if attachment else '-'
+
+        d['format'] = attachment.mime if attachment else (os.path.splitext(m.content)[1].lstrip('.') or '-')
+
+        d['dimensions'] = f'{attachment.width}x{attachment.height}' if attachment and attachment.width else ''
 
         data.append(d)
 
@@ -548,9 +684,144 @@ def get_files():
 
         'msg': '',
 
-        'count': pagination.total,
+        'count': count_cache.get('files', lambda: Message.query.filter(Message.msg_type.in_(FILE_TYPES)).count()),
 
-        'data': data
+        'data': data,
+        'cursor': cursor
+
+    })
+
+
+
+def format_size(size):
+
+    for unit in ('B', 'KB', 'MB', 'GB'):
+
+        if size < 1024 or unit == 'GB':
+
+            return f'{size:.0f} {unit}' if unit == 'B' else f'{size:.1f} {unit}'
+
+        size /= 1024
+
+
+
+@backend_bp.route("/api/attachments")
+
+@admin_required
+
+@readonly_db
+
+def get_attachments():
+
+    # 按类型/上传者/群筛选附件，id 倒序 keyset 分页
+
+    kind = request.args.get('kind')
+
+    user_id = request.args.get('user_id', type=int)
+
+    room_id = request.args.get('room_id', type=int)
+
+    conditions = []
+
+    if kind:
+
+        conditions.append(Attachment.kind == kind)
+
+    if user_id:
+
+        conditions.append(Attachment.uploader_id == user_id)
+
+    if room_id:
+
+        conditions.append(Attachment.room_id == room_id)
+
+    query = Attachment.query.filter(*conditions)
+
+    scope = (kind, user_id, room_id)
+
+    items, cursor = list_page(attachments_pager, query, scope=scope)
+
+    return jsonify({
+
+        'code': 0,
+
+        'msg': '',
+
+        'count': count_cache.get(f'attachments:{scope}', lambda: Attachment.query.filter(*conditions).count()),
+
+        'data': [{
+
+            'id': a.id,
+
+            'url': a.url,
+
+            'filename': a.original_name,
+
+            'kind': a.kind,
+
+            'mime': a.mime,
+
+            'size': a.size,
+
+            'sha256': a.sha256,
+
+            'width': a.width,
+
+            'height': a.height,
+
+            'uploader_id': a.uploader_id,
+
+            'room_id': a.room_id,
+
+            'created_at': a.created_at.strftime('%Y-%m-%d %H:%M') if a.created_at else '',
+
+        } for a in items],
+
+        'cursor': cursor
+
+    })
+
+
+
+@backend_bp.route("/api/attachments/usage")
+
+@admin_required
+
+@readonly_db
+
+def get_attachment_usage():
+
+    # 存储用量排行：group=user 按上传者，group=room 按群
+
+    group = 'room' if request.args.get('group') == 'room' else 'user'
+
+    limit = min(request.args.get('limit', 20, type=int), 100)
+
+    rows = attachments.storage_usage(group, limit)
+
+    total = db.session.query(func.count(Attachment.id), func.coalesce(func.sum(Attachment.size), 0)).one()
+
+    dedup = storage.dedup_stats()
+
+    for row in rows:
+
+        row['size'] = format_size(row['bytes'])
+
+    return jsonify({
+
+        'code': 0,
+
+        'msg': '',
+
+        'count': len(rows),
+
+        'data': rows,
+
+        'total': {'count': total[0], 'bytes': total[1], 'size': format_size(total[1])},
+
+        # 按内容去重：实际占用和省下的空间
+
+        'dedup': dict(dedup, stored_size=format_size(dedup['stored_bytes']), saved_size=format_size(dedup['saved_bytes']))
 
     })
 
@@ -572,7 +843,29 @@ def delete_file():
 
         db.session.delete(msg)
 
-        db.session.commit()
+        room = Room.query.get(msg.room_id)
+
+        if room and room.last_message_id == msg.id:
+
+            db.session.flush()
+
+            refresh_last_message(msg.room_id)
+
+        # 附件引用数 -1，内容没有其他引用时删除文件 (一并提交)
+
+        attachment = Attachment.query.filter_by(url=msg.content, room_id=msg.room_id).order_by(Attachment.id).first()
+
+        if attachment:
+
+            storage.release(attachment)
+
+        else:
+
+            db.session.commit()
+
+        count_cache.invalidate('files')
+
+        count_cache.invalidate(f'room_messages:{msg.room_id}')
 
         return jsonify({'success': True})
 
@@ -692,17 +985,14 @@ def interface_list():
 
 def get_interfaces():
 
-    page = request.args.get('page', 1, type=int)
-
-    limit = request.args.get('limit', 20, type=int)
-
-    pagination = ThirdPartyAPI.query.paginate(page=page, per_page=limit, error_out=False)
+    items, cursor = list_page(interfaces_pager, ThirdPartyAPI.query)
 
     return jsonify({
 
-        'code': 0, 'msg': '', 'count': pagination.total,
+        'code': 0, 'msg': '', 'count': count_cache.get('interfaces', lambda: ThirdPartyAPI.query.count()),
 
-        'data': [item.to_dict() for item in pagination.items]
+        'data': [item.to_dict() for item in items],
+        'cursor': cursor
 
     })
 
@@ -760,6 +1050,8 @@ def save_interface():
 
     db.session.commit()
 
+    count_cache.invalidate('interfaces')
+
     return jsonify({'success': True})
 
 
@@ -782,6 +1074,8 @@ def delete_interface():
 
         db.session.commit()
 
+        count_cache.invalidate('interfaces')
+
         return jsonify({'success': True})
 
     return jsonify({'success': False})
@@ -1060,56 +1354,62 @@ def test_ai_model():
 def dashboard():
     return render_template('admin/dashboard.html')
 
+# 仪表盘缓存 key，都以 DASHBOARD_CACHE 开头，便于一起失效
+DASHBOARD_CACHE = 'dashboard:'
+
+def invalidate_dashboard_cache(key=DASHBOARD_CACHE):
+    # 本 worker 立即失效，其他 worker 经 hub 通知
+    response_cache.invalidate(key)
+    hub.cache_invalidated(key)
+
 @backend_bp.route("/api/dashboard/data")
 @admin_required
+@readonly_db
 def get_dashboard_data():
-    # 1. Basic Stats
-    total_users = User.query.count()
-    total_rooms = Room.query.count()
+    # 多个管理员同时轮询时共享一次计算
+    return jsonify(response_cache.get_or_compute(DASHBOARD_CACHE + 'data', build_dashboard_data))
+
+def build_dashboard_data():
+    # 1. Basic Stats (读汇总表，不扫 messages)
+    counts = rollups.totals()
+    total_users = counts['users']
+    total_rooms = counts['rooms']
     
     today = datetime.utcnow().date()
     today_start = datetime(today.year, today.month, today.day)
     
-    today_messages = Message.query.filter(Message.timestamp >= today_start).count()
+    today_messages = rollups.message_count(today_start)
     
     # Active users today
-    active_users_count = db.session.query(func.count(func.distinct(Message.user_id))).filter(Message.timestamp >= today_start, Message.user_id.isnot(None)).scalar()
+    active_users_count = rollups.active_user_count(today)
     
     # 2. Charts Data
     # Room Member Distribution (Top 5 rooms)
-    top_rooms = db.session.query(Room.name, func.count(RoomMember.id)).join(RoomMember).group_by(Room.id).order_by(func.count(RoomMember.id).desc()).limit(5).all()
-    room_stats = [{'name': r[0], 'value': r[1]} for r in top_rooms]
+    # 先在 room_members 的 room_id 索引上分组取前 5，再查群名
+    member_count = func.count(RoomMember.room_id)
+    top_rooms = db.session.query(RoomMember.room_id, member_count).group_by(RoomMember.room_id).order_by(member_count.desc()).limit(5).all()
+    room_names = dict(db.session.query(Room.id, Room.name).filter(Room.id.in_([r[0] for r in top_rooms])).all())
+    room_stats = [{'name': room_names[r[0]], 'value': r[1]} for r in top_rooms if r[0] in room_names]
     
     # Message Trend (Last 7 days) - Simplified for now (just hours of today or similar)
     # Let's do messages per hour for today
-    msgs_by_hour = db.session.query(func.strftime('%H', Message.timestamp), func.count(Message.id)).filter(Message.timestamp >= today_start).group_by(func.strftime('%H', Message.timestamp)).all()
+    msgs_by_hour = rollups.hourly_counts(today_start)
     # Fill gaps
     hours = [f"{i:02d}" for i in range(24)]
     msg_counts = {h: 0 for h in hours}
-    for h, count in msgs_by_hour:
-        msg_counts[h] = count
+    for hour, count in msgs_by_hour.items():
+        msg_counts[hour.strftime('%H')] = count
     
     line_chart_data = {'categories': hours, 'data': [msg_counts[h] for h in hours]}
 
-    # 3. Warnings (Simple keyword filter on recent messages)
-    keywords = ['fuck', 'shit', 'die', 'hack', 'stupid', 'admin', 'root', 'error', 'fail', 'warning'] # Example keywords
-    recent_msgs = Message.query.order_by(Message.timestamp.desc()).limit(100).all()
-    warnings = []
-    for m in recent_msgs:
-        if m.content and any(k in m.content.lower() for k in keywords):
-            warnings.append({
-                'user': m.user.nickname if m.user else 'Unknown',
-                'content': m.content[:20] + '...' if len(m.content) > 20 else m.content,
-                'room': m.room.name,
-                'time': m.timestamp.strftime('%H:%M:%S'),
-                'level': 'High' 
-            })
+    # 3. Warnings (写入时审核命中的消息，见 app/moderation.py)
+    warnings = recent_flags(limit=5)
     
     # 4. Room Activity List
-    active_rooms_query = db.session.query(Room.name, func.count(Message.id)).join(Message).filter(Message.timestamp >= today_start).group_by(Room.id).order_by(func.count(Message.id).desc()).limit(10).all()
+    active_rooms_query = rollups.top_rooms(today_start, limit=10)
     active_rooms = [{'name': r[0], 'msg_count': r[1]} for r in active_rooms_query]
 
-    return jsonify({
+    return {
         'stats': {
             'total_users': total_users,
             'total_rooms': total_rooms,
@@ -1120,18 +1420,39 @@ def get_dashboard_data():
             'room_distribution': room_stats,
             'message_trend': line_chart_data
         },
-        'warnings': warnings[:5], # Top 5 recent
+        'warnings': warnings, # Top 5 recent
         'active_rooms': active_rooms
+    }
+
+@backend_bp.route("/api/moderation/flags")
+@admin_required
+@readonly_db
+def get_message_flags():
+    # 预警列表翻页：before_id 为上一页最后一条的 id
+    before_id = request.args.get('before_id', type=int)
+    room_id = request.args.get('room_id', type=int)
+    limit = min(request.args.get('limit', 20, type=int), 100)
+    flags = recent_flags(before_id=before_id, limit=limit, room_id=room_id)
+    return jsonify({
+        'code': 0,
+        'msg': '',
+        'data': flags,
+        'next_before_id': flags[-1]['id'] if len(flags) == limit else None
     })
 
 @backend_bp.route("/api/dashboard/ai-report")
 @admin_required
+@readonly_db
 def dashboard_ai_report():
-    total_users = User.query.count()
+    # refresh=1 丢弃缓存的报告重新生成
+    if request.args.get('refresh'):
+        invalidate_dashboard_cache(DASHBOARD_CACHE + 'ai-report')
+
+    total_users = rollups.totals()['users']
     today = datetime.utcnow().date()
     today_start = datetime(today.year, today.month, today.day)
-    today_msgs = Message.query.filter(Message.timestamp >= today_start).count()
-    active_users = db.session.query(func.count(func.distinct(Message.user_id))).filter(Message.timestamp >= today_start, Message.user_id.isnot(None)).scalar() or 0
+    today_msgs = rollups.message_count(today_start)
+    active_users = rollups.active_user_count(today)
     
     prompt = f"""
     You are the 'TeamChat Sentinel', an AI system monitor for a sci-fi dashboard.
@@ -1147,28 +1468,32 @@ def dashboard_ai_report():
     3. Generate a "System Status Report" (max 80 words) formatted with HTML (use <span style="color:#00ff00"> for good, #ff0000 for alert).
     4. Style it like a futuristic computer log.
     """
-    
-    def generate():
-        client = OpenAI(
-            api_key=current_app.config.get('OPENAI_API_KEY'),
-            base_url=current_app.config.get('OPENAI_BASE_URL')
+
+    api_key = current_app.config.get('OPENAI_API_KEY')
+    base_url = current_app.config.get('OPENAI_BASE_URL')
+    # Determine model
+    model_name = "gpt-3.5-turbo" 
+    default_model = AIModel.query.filter_by(is_default=True).first()
+    if default_model:
+        model_name = default_model.model_name
+    ttl = current_app.config['AI_REPORT_CACHE_TTL']
+
+    def produce():
+        # 在缓存的后台线程里运行，所有并发请求共享这一次大模型调用
+        client = OpenAI(api_key=api_key, base_url=base_url)
+        stream = client.chat.completions.create(
+            model=model_name,
+            messages=[{"role": "system", "content": prompt}],
+            stream=True
         )
-        
-        # Determine model
-        model_name = "gpt-3.5-turbo" 
-        default_model = AIModel.query.filter_by(is_default=True).first()
-        if default_model:
-            model_name = default_model.model_name
-            
+        for chunk in stream:
+            if chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+
+    def generate():
         try:
-            stream = client.chat.completions.create(
-                model=model_name,
-                messages=[{"role": "system", "content": prompt}],
-                stream=True
-            )
-            for chunk in stream:
-                if chunk.choices[0].delta.content:
-                    yield f"data: {json.dumps({'text': chunk.choices[0].delta.content})}\n\n"
+            for text in response_cache.stream(DASHBOARD_CACHE + 'ai-report', produce, ttl=ttl):
+                yield f"data: {json.dumps({'text': text})}\n\n"
             yield "data: [DONE]\n\n"
         except Exception as e:
             yield f"data: {json.dumps({'error': str(e)})}\n\n"
@@ -1184,6 +1509,7 @@ def ai_analysis():
 
 @backend_bp.route("/api/ai-analysis/chat", methods=['POST'])
 @admin_required
+@readonly_db
 def ai_analysis_chat():
     data = request.get_json()
     user_message = data.get('message')
@@ -1507,3 +1833,27 @@ def delete_admin():
         db.session.commit()
         return jsonify({'success': True})
     return jsonify({'success': False})
+
+# Realtime (WebSocket) monitoring
+@backend_bp.route("/api/realtime/stats")
+@admin_required
+def get_realtime_stats():
+    return jsonify({
+        'success': True,
+        'data': {
+            'heartbeat': heartbeat.snapshot(),
+            'outbound': registry.outbound_stats(),
+            'json_encoder': frames.encoder_name(),
+            'ai_stream': stream_stats.snapshot(),
+            'presence': presence.snapshot_stats(),
+            'broker': hub.stats(),
+            'persister': persister.snapshot_stats(),
+            'ratelimit': ratelimiter.snapshot_stats(),
+            'user_cards': user_cards.snapshot_stats(),
+            'db_pools': pool_stats(db),
+            'response_cache': response_cache.snapshot_stats(),
+            'moderation': moderator.snapshot_stats(),
+            'admin_counts': count_cache.snapshot_stats(),
+            'previews': previews.snapshot_stats()
+        }
+    })
@@ -1,9 +1,17 @@
 from flask import Blueprint, render_template, request, redirect, url_for, flash, session, current_app, jsonify, Response, stream_with_context
 from app.extensions import db, sock
+from app.realtime import registry, heartbeat, presence, hub, persister, ratelimiter, PersistError
+from app.realtime.frames import FrameTemplate, encode
+from app.realtime.streaming import StreamCoalescer
 from app.models import User, Room, RoomMember, Friendship, Message, AIModel, ServerConfig
+from app.serializers import serialize_messages
+from app.room_state import mark_read
+from app.search import search_messages, SearchError
+from app.archive import load_archived
+from app import storage
+from app.previews import previews
 from sqlalchemy import or_
 from datetime import datetime
-from werkzeug.utils import secure_filename
 import json
 import os
 import threading
@@ -13,9 +21,6 @@ import random
 import string
 from app.blueprints.frontend import frontend_bp
 
-# Global dictionary to store connected clients: {ws: nickname}
-connected_clients = {}
-
 @frontend_bp.route('/')
 def index():
     if 'user_id' in session:
@@ -107,7 +112,8 @@ def chat():
         session.clear()
         return redirect(url_for('frontend.login'))
         
-    return render_template('chat.html', user=user, ws_server=session.get('ws_server'))
+    return render_template('chat.html', user=user, ws_server=session.get('ws_server'),
+                           presence_mode=current_app.config.get('WS_PRESENCE_SCOPE', 'global'))
 
 @frontend_bp.route('/logout')
 def logout():
@@ -121,27 +127,55 @@ def get_rooms():
         return jsonify({'success': False, 'message': 'Unauthorized'}), 401
     
     user_id = session['user_id']
-    # Get joined rooms
-    memberships = RoomMember.query.filter_by(user_id=user_id).all()
+    # 侧边栏一条查询：成员关系(未读数) + 群 + 最后一条消息及发送者，按最近活跃排序
+    sender = db.aliased(User)
+    rows = db.session.query(
+        Room.id, Room.name, Room.code, RoomMember.unread_count, RoomMember.last_read_message_id,
+        db.func.coalesce(Room.last_activity_at, Room.created_at), Message.msg_type,
+        db.func.substr(Message.content, 1, PREVIEW_CHARS), db.func.coalesce(sender.nickname, sender.username)
+    ).join(RoomMember, RoomMember.room_id == Room.id)\
+        .outerjoin(Message, Message.id == Room.last_message_id)\
+        .outerjoin(sender, sender.id == Message.user_id)\
+        .filter(RoomMember.user_id == user_id)\
+        .order_by(db.func.coalesce(Room.last_activity_at, Room.created_at).desc(), Room.id.desc()).all()
+
+    today = datetime.now().date()
     rooms_data = []
-    
-    # Always include public room if exists, or create it? 
-    # Logic: User should be added to public room on creation/login if not there.
-    # For now, just return what they are in.
-    
-    for m in memberships:
-        room = Room.query.get(m.room_id)
-        if room:
-            rooms_data.append({
-                'id': room.id,
-                'name': room.name,
-                'code': room.code,
-                'type': 'group',
-                'unread': 0 # TODO: Implement unread count
-            })
+    for room_id, name, code, unread, last_read, active_at, msg_type, content, sender_name in rows:
+        rooms_data.append({
+            'id': room_id,
+            'name': name,
+            'code': code,
+            'type': 'group',
+            'unread': unread or 0,
+            'last_read_message_id': last_read or 0,
+            'last_msg': message_preview(msg_type, content, sender_name),
+            'time': format_activity_time(active_at, today)
+        })
             
     return jsonify({'success': True, 'data': rooms_data})
 
+PREVIEW_CHARS = 40
+
+def message_preview(msg_type, content, sender_name=None):
+    """侧边栏的一行消息预览"""
+    if msg_type is None:
+        return ''
+    if msg_type == 'image':
+        text = '[图片]'
+    elif msg_type == 'file':
+        text = '[文件]'
+    else:
+        text = ' '.join((content or '').split())[:PREVIEW_CHARS]
+    if msg_type == 'ai':
+        sender_name = '趣聊小助手'
+    return f'{sender_name}: {text}' if sender_name else text
+
+def format_activity_time(value, today):
+    if not value:
+        return ''
+    return value.strftime('%H:%M') if value.date() == today else value.strftime('%m-%d')
+
 @frontend_bp.route('/api/friends')
 def get_friends():
     if 'user_id' not in session:
@@ -163,7 +197,7 @@ def get_friends():
             'username': friend_user.username,
             'nickname': friend_user.nickname,
             'avatar': friend_user.avatar or '/static/images/default_avatar.svg',
-            'status': 'offline' # WebSocket status would be better
+            'status': 'online' if presence.is_online(friend_user.id) else 'offline'
         })
         
     return jsonify({'success': True, 'data': friends_data})
@@ -178,9 +212,71 @@ def get_room_messages(room_id):
     if not is_member:
         return jsonify({'success': False, 'message': 'Not a member'}), 403
         
-    messages = Message.query.filter_by(room_id=room_id).order_by(Message.timestamp.asc()).all()
-    
-    return jsonify({'success': True, 'data': [m.to_dict() for m in messages]})
+    # 按 id 做 keyset 分页：默认取最新一页，before_id 往前翻，after_id 补拉断线期间的新消息
+    limit = min(max(request.args.get('limit', 50, type=int), 1), 200)
+    before_id = request.args.get('before_id', type=int)
+    after_id = request.args.get('after_id', type=int)
+
+    query = Message.query.filter(Message.room_id == room_id)
+    if after_id is not None:
+        query = query.filter(Message.id > after_id)
+        if before_id is not None:
+            query = query.filter(Message.id < before_id)
+        messages = query.order_by(Message.id.asc()).limit(limit + 1).all()
+        has_more = len(messages) > limit
+        messages = messages[:limit]
+    else:
+        if before_id is not None:
+            query = query.filter(Message.id < before_id)
+        messages = query.order_by(Message.id.desc()).limit(limit + 1).all()
+        if len(messages) <= limit:
+            # 热库翻到头了，继续从月归档里取更早的消息
+            upper = messages[-1].id if messages else (before_id or (1 << 62))
+            messages += load_archived(room_id, upper, limit + 1 - len(messages))
+        has_more = len(messages) > limit
+        messages = messages[:limit][::-1]
+
+    # data 始终按 id 升序
+    return jsonify({'success': True, 'data': serialize_messages(messages), 'has_more': has_more})
+
+@frontend_bp.route('/api/room/<int:room_id>/read', methods=['POST'])
+def mark_room_read(room_id):
+    if 'user_id' not in session:
+        return jsonify({'success': False, 'message': 'Unauthorized'}), 401
+
+    data = request.get_json(silent=True) or {}
+    message_id = data.get('message_id')
+    state = ack_room_read(session['user_id'], room_id, int(message_id) if message_id else None)
+    if state is None:
+        return jsonify({'success': False, 'message': 'Not a member'}), 403
+    return jsonify({'success': True, 'data': state})
+
+def ack_room_read(user_id, room_id, message_id=None):
+    """更新已读位置，并同步给该用户的其他在线端"""
+    result = mark_read(user_id, room_id, message_id)
+    if result is None:
+        return None
+    state = {'room_id': room_id, 'last_read_message_id': result[0], 'unread': result[1]}
+    hub.publish_user(user_id, dict(state, type='read_state'))
+    return state
+
+@frontend_bp.route('/api/search/messages')
+def search_room_messages():
+    if 'user_id' not in session:
+        return jsonify({'success': False, 'message': 'Unauthorized'}), 401
+
+    limit = min(max(request.args.get('limit', 20, type=int), 1), 50)
+    try:
+        result = search_messages(
+            session['user_id'],
+            request.args.get('q', '').strip(),
+            room_id=request.args.get('room_id', type=int),
+            before_id=request.args.get('before_id', type=int),
+            limit=limit
+        )
+    except SearchError as e:
+        return jsonify({'success': False, 'message': str(e)})
+    return jsonify({'success': True, **result})
 
 @frontend_bp.route('/api/upload', methods=['POST'])
 def upload_file():
@@ -196,18 +292,20 @@ def upload_file():
         
     if file:
         filename = file.filename
-        # Save to static/uploads
-        upload_folder = os.path.join(current_app.root_path, 'static', 'uploads')
-        if not os.path.exists(upload_folder):
-            os.makedirs(upload_folder)
-            
-        # Generate safe filename
-        timestamp = datetime.now().strftime('%Y%m%d%H%M%S')
-        safe_filename = f"{timestamp}_{filename}"
-        file.save(os.path.join(upload_folder, safe_filename))
-        
-        url = url_for('static', filename=f'uploads/{safe_filename}')
-        return jsonify({'success': True, 'url': url, 'filename': filename})
+        # 按内容存储 (app/storage.py)：边写边算 sha256，重复的内容只存一份
+        # 群取发送到的群 (需是成员)
+        room_id = request.form.get('room_id', type=int)
+        if room_id and not registry.is_room_member(room_id, session['user_id']):
+            room_id = None
+        attachment = storage.save_upload(file, filename, session['user_id'], room_id)
+        db.session.commit()
+        # 图片在后台生成缩略图和中图，发送消息时大多已经生成好
+        if attachment.kind == 'image':
+            previews.submit(storage.path_of(attachment.url))
+        return jsonify({'success': True, 'url': attachment.url, 'filename': filename,
+                        'size': attachment.size, 'mime': attachment.mime,
+                        'width': attachment.width, 'height': attachment.height,
+                        **previews.urls(attachment.url)})
 
 @frontend_bp.route('/api/friend/request', methods=['POST'])
 def send_friend_request():
@@ -243,7 +341,7 @@ def send_friend_request():
     
     # Notify target user via WebSocket
     sender = User.query.get(session['user_id'])
-    send_personal_message(target_user.nickname, {
+    send_personal_message(target_user.id, {
         'type': 'friend_request',
         'message': f'{sender.nickname} 请求添加你为好友'
     })
@@ -316,6 +414,7 @@ def create_group():
     member = RoomMember(user_id=session['user_id'], room_id=room.id)
     db.session.add(member)
     db.session.commit()
+    hub.add_room_member(room.id, session['user_id'])
     
     return jsonify({'success': True, 'message': '创建成功', 'room': {'id': room.id, 'name': room.name, 'code': code}})
 
@@ -344,6 +443,7 @@ def join_group():
     member = RoomMember(user_id=session['user_id'], room_id=room.id)
     db.session.add(member)
     db.session.commit()
+    hub.add_room_member(room.id, session['user_id'])
     
     return jsonify({'success': True, 'message': '加入成功', 'room_id': room.id})
 
@@ -364,23 +464,12 @@ def update_avatar():
         return jsonify({'success': False, 'message': 'No selected file'}), 400
         
     if file:
-        filename = secure_filename(file.filename)
-        # Unique filename
-        timestamp = datetime.now().strftime('%Y%m%d%H%M%S')
-        new_filename = f"{timestamp}_{filename}"
-        
-        # Ensure directory exists
-        upload_folder = os.path.join(current_app.static_folder, 'uploads')
-        if not os.path.exists(upload_folder):
-            os.makedirs(upload_folder)
-            
-        file_path = os.path.join(upload_folder, new_filename)
-        file.save(file_path)
-        
+        attachment = storage.save_upload(file, file.filename, user.id, kind='avatar')
         # Update user avatar URL
-        avatar_url = f"/static/uploads/{new_filename}"
+        avatar_url = attachment.url
         user.avatar = avatar_url
         db.session.commit()
+        hub.user_changed(user.id)
         
         return jsonify({'success': True, 'avatar_url': avatar_url})
         
@@ -446,34 +535,79 @@ def stream_ai_chat():
 
 @sock.route('/ws')
 def websocket(ws):
-    # Initial connection - wait for join message to map nickname
-    connected_clients[ws] = "Anonymous"
+    # Initial connection - wait for join message to bind the user
+    conn = registry.add(ws)
+    hub.ensure_started()
+    heartbeat.ensure_started()
     try:
-        while True:
-            data = ws.receive()
+        while not conn.closed:
+            # 定时醒来，连接被心跳回收后能及时退出
+            data = ws.receive(timeout=heartbeat.interval)
             if data:
+                conn.touch()
                 try:
                     msg_data = json.loads(data)
                     msg_type = msg_data.get('type')
-                    
-                    if msg_type == 'join':
-                        # Update nickname mapping
-                        nickname = msg_data.get('user')
-                        connected_clients[ws] = nickname
-                        # Broadcast join message
-                        broadcast_message(msg_data)
-                        # Broadcast updated user list
-                        broadcast_user_list()
+
+                    # 限流在查库和广播之前；心跳帧不计入
+                    if msg_type not in ('ping', 'pong'):
+                        # 只有群成员发到群里的消息计入群的令牌桶，否则未登录或非成员的连接能耗尽别人群的额度
+                        # (成员关系在内存里，不查库)
+                        limit_room = None
+                        if msg_type in ('message', 'image', 'file') and conn.is_authenticated and msg_data.get('room_id'):
+                            target_room = int(msg_data['room_id'])
+                            if registry.is_room_member(target_room, conn.user_id):
+                                limit_room = target_room
+                        limited = ratelimiter.check(conn.user_id or conn, limit_room)
+                        if limited:
+                            conn.send(encode({
+                                'type': 'rate_limited',
+                                'scope': limited[0],
+                                'retry_after_ms': limited[1],
+                                'ref_type': msg_type
+                            }))
+                            continue
+
+                    if msg_type == 'ping':
+                        heartbeat.handle_ping(conn, msg_data)
+
+                    elif msg_type == 'pong':
+                        heartbeat.handle_pong(conn, msg_data)
+
+                    elif msg_type == 'presence_sync':
+                        if conn.is_authenticated:
+                            presence.handle_sync(conn, msg_data)
+
+                    elif msg_type == 'join':
+                        # Bind connection to user (prefer the login session over client-sent names)
+                        user = None
+                        if session.get('user_id'):
+                            user = User.query.get(session['user_id'])
+                        if not user and msg_data.get('user'):
+                            nickname = msg_data.get('user')
+                            user = User.query.filter((User.nickname == nickname) | (User.username == nickname)).first()
+                        if not user:
+                            continue
+                            
+                        registry.bind(conn, user.id, user.nickname or user.username,
+                                      user.avatar or '/static/images/default_avatar.svg')
+                        # 在线状态增量推送 (presence_diff)，新连接先收到一份 snapshot
+                        hub.user_online(conn)
                         
                         # Send current announcement to the new user
                         room = Room.query.filter_by(name='公共聊天室').first()
                         if room and room.announcement:
-                            ws.send(json.dumps({
+                            conn.send(encode({
                                 'type': 'announcement',
                                 'content': room.announcement,
                                 'time': room.announcement_time.strftime('%Y-%m-%d %H:%M') if room.announcement_time else ''
                             }))
 
+                    elif msg_type == 'read':
+                        if conn.is_authenticated and msg_data.get('room_id'):
+                            message_id = msg_data.get('message_id')
+                            ack_room_read(conn.user_id, int(msg_data['room_id']), int(message_id) if message_id else None)
+
                     elif msg_type == 'update_announcement':
                         content = msg_data.get('content')
                         # Save to public room
@@ -490,156 +624,83 @@ def websocket(ws):
                             })
 
                     elif msg_type in ['message', 'image', 'file']:
-                        # Validate session/user
-                        # Since WebSocket is long-lived, we might not have request context with session every time?
-                        # Flask-Sock runs in app context. request.session might be available if cookie is sent.
-                        # But for safety, let's rely on the user info sent in message or mapped in connected_clients.
-                        
-                        nickname = connected_clients.get(ws)
-                        if not nickname or nickname == "Anonymous":
+                        if not conn.is_authenticated:
                             continue
                             
-                        # Save message to DB
                         room_id = msg_data.get('room_id')
                         if room_id:
-                            # WebSocket doesn't share session context easily in all setups, but Flask-Sock might.
-                            # Let's try to find user by nickname (fallback)
-                            user = User.query.filter((User.nickname == nickname) | (User.username == nickname)).first()
-                            
-                            room = Room.query.get(room_id)
-                            
-                            if user and room:
-                                # Check membership
-                                is_member = RoomMember.query.filter_by(user_id=user.id, room_id=room.id).first()
-                                if not is_member:
-                                    continue
-
-                                msg_entry = Message(
+                            room_id = int(room_id)
+                            # Check membership (cached in registry, no SQL on the hot path)
+                            if not registry.is_room_member(room_id, conn.user_id):
+                                continue
+
+                            # id 先分配好，group 模式等批量提交完成，async 模式直接广播
+                            try:
+                                msg_data['id'] = persister.submit(
                                     content=msg_data.get('content'),
                                     msg_type=msg_type,
-                                    user_id=user.id,
-                                    room_id=room.id,
-                                    timestamp=datetime.now()
+                                    user_id=conn.user_id,
+                                    room_id=room_id
                                 )
-                                if msg_type == 'file':
-                                    msg_entry.filename = msg_data.get('filename')
-                                    
-                                db.session.add(msg_entry)
-                                db.session.commit()
-                                
-                                # Prepare data for broadcast
-                                msg_data['user'] = nickname # Display name
-                                msg_data['avatar'] = user.avatar or '/static/images/default_avatar.svg'
-                                msg_data['nickname'] = user.nickname or user.username
-                                msg_data['room_id'] = room_id
-                                
-                                # Broadcast to room members only
-                                broadcast_room_message(room_id, msg_data)
-                                
-                                # Check for AI command
-                                content = msg_data.get('content', '')
-                                trigger = None
-                                if content.startswith('@趣冰'):
-                                    trigger = '@趣冰'
-                                elif content.startswith('@趣聊小助手'):
-                                    trigger = '@趣聊小助手'
-                                    
-                                if msg_type == 'message' and trigger:
-                                    query = content.replace(trigger, '', 1).strip()
-                                    if query:
-                                        # Use current_app._get_current_object() to pass app context
-                                        app = current_app._get_current_object()
-                                        threading.Thread(target=handle_ai_response_ws, args=(app, query, room_id, msg_data['nickname'])).start()
+                            except PersistError as e:
+                                print(f"Message not saved, not broadcasting: {e}")
+                                continue
+                            
+                            # Prepare data for broadcast
+                            msg_data['user'] = conn.nickname # Display name
+                            msg_data['avatar'] = conn.avatar
+                            msg_data['nickname'] = conn.nickname
+                            msg_data['room_id'] = room_id
+                            # 图片带上预览图 URL，不信任客户端传来的
+                            msg_data.pop('thumb', None)
+                            msg_data.pop('medium', None)
+                            if msg_type == 'image':
+                                msg_data.update(previews.urls(msg_data.get('content')))
+                            
+                            # Broadcast to room members only
+                            broadcast_room_message(room_id, msg_data)
+                            
+                            # Check for AI command
+                            content = msg_data.get('content', '')
+                            trigger = None
+                            if content.startswith('@趣冰'):
+                                trigger = '@趣冰'
+                            elif content.startswith('@趣聊小助手'):
+                                trigger = '@趣聊小助手'
                                 
-
+                            if msg_type == 'message' and trigger:
+                                query = content.replace(trigger, '', 1).strip()
+                                if query:
+                                    # Use current_app._get_current_object() to pass app context
+                                    app = current_app._get_current_object()
+                                    threading.Thread(target=handle_ai_response_ws, args=(app, query, room_id, msg_data['nickname'])).start()
 
                     else:
                         broadcast_message(msg_data)
                 except Exception as e:
                     print(f"Error processing message: {e}")
+                finally:
+                    # 长连接不能一直占着连接池里的数据库连接（默认只有 15 个）
+                    db.session.close()
     except Exception:
         pass
     finally:
-        if ws in connected_clients:
-            nickname = connected_clients.pop(ws)
-            # Broadcast leave message
-            if nickname and nickname != "Anonymous":
-                leave_msg = {'type': 'leave', 'user': nickname}
-                broadcast_message(leave_msg)
-                broadcast_user_list()
+        conn.close()
+        ratelimiter.forget(conn)
+        conn = registry.remove(ws)
+        if conn and conn.is_authenticated:
+            hub.user_offline(conn)
 
 def broadcast_room_message(room_id, data):
-    msg = json.dumps(data)
-    dead_clients = set()
-    
-    # 获取该房间的所有成员ID
-    room_members = [m.user_id for m in RoomMember.query.filter_by(room_id=room_id).all()]
-    
-    for client, nickname in connected_clients.items():
-        try:
-            # 找到 client 对应的 user_id
-            # 这里效率较低，实际生产环境应该在 connected_clients 里存 user_id
-            user = User.query.filter((User.nickname == nickname) | (User.username == nickname)).first()
-            if user and user.id in room_members:
-                client.send(msg)
-        except:
-            dead_clients.add(client)
-    
-    for client in dead_clients:
-        if client in connected_clients:
-            connected_clients.pop(client)
+    """广播给房间内在线成员；帧只编码一次，经 hub 投递到各 worker"""
+    hub.publish_room(room_id, data)
 
 def broadcast_message(data):
-    msg = json.dumps(data)
-    dead_clients = set()
-    for client in connected_clients:
-        try:
-            client.send(msg)
-        except:
-            dead_clients.add(client)
-    
-    for client in dead_clients:
-        if client in connected_clients:
-            connected_clients.pop(client)
+    hub.publish_all(data)
 
-def send_personal_message(target_nickname, data):
+def send_personal_message(user_id, data):
     """发送私聊/系统消息给指定用户"""
-    print(f"DEBUG: Sending personal message to '{target_nickname}'. Connected: {list(connected_clients.values())}")
-    msg = json.dumps(data)
-    dead_clients = set()
-    sent = False
-    
-    for client, nickname in connected_clients.items():
-        if nickname == target_nickname:
-            try:
-                client.send(msg)
-                sent = True
-            except:
-                dead_clients.add(client)
-    
-    for client in dead_clients:
-        if client in connected_clients:
-            connected_clients.pop(client)
-            
-    if not sent:
-        print(f"DEBUG: Failed to send to '{target_nickname}'. User not found in connected clients.")
-        
-    return sent
-
-def broadcast_user_list():
-    # Filter out anonymous or None
-    users = [name for name in connected_clients.values() if name and name != "Anonymous"]
-    msg = json.dumps({'type': 'user_list', 'users': users})
-    dead_clients = set()
-    for client in connected_clients:
-        try:
-            client.send(msg)
-        except:
-            dead_clients.add(client)
-            
-    for client in dead_clients:
-        if client in connected_clients:
-            connected_clients.pop(client)
+    hub.publish_user(user_id, data)
 
 def handle_ai_response_ws(app, query, room_id, user_nickname=None):
     with app.app_context():
@@ -663,8 +724,22 @@ def handle_ai_response_ws(app, query, room_id, user_nickname=None):
             avatar = '/static/images/default_avatar.svg'
             timestamp = datetime.now().strftime('%H:%M')
             
+            # 接收者只解析一次，整个流式回答期间复用
+            chunk_template = FrameTemplate({
+                'type': 'ai_stream_chunk',
+                'id': msg_id,
+                'content': '',
+                'room_id': room_id
+            }, 'content')
+            coalescer = StreamCoalescer(
+                hub.room_sink(room_id),
+                chunk_template,
+                flush_ms=app.config.get('WS_AI_FLUSH_MS', 50),
+                flush_chars=app.config.get('WS_AI_FLUSH_CHARS', 64)
+            )
+            
             # Broadcast Start
-            broadcast_room_message(room_id, {
+            coalescer.send({
                 'type': 'ai_stream_start',
                 'id': msg_id,
                 'user': '趣聊小助手',
@@ -695,14 +770,8 @@ def handle_ai_response_ws(app, query, room_id, user_nickname=None):
             mention_text = f"@{user_nickname} " if user_nickname else ""
             full_content = mention_text
             
-            # Send mention first if exists
-            if mention_text:
-                broadcast_room_message(room_id, {
-                    'type': 'ai_stream_chunk',
-                    'id': msg_id,
-                    'content': mention_text,
-                    'room_id': room_id
-                })
+            # Send mention first if exists (merged into the first chunk)
+            coalescer.push(mention_text)
             
             accumulated_usage = 0
             
@@ -710,12 +779,7 @@ def handle_ai_response_ws(app, query, room_id, user_nickname=None):
                 if chunk.choices and chunk.choices[0].delta.content:
                     content = chunk.choices[0].delta.content
                     full_content += content
-                    broadcast_room_message(room_id, {
-                        'type': 'ai_stream_chunk',
-                        'id': msg_id,
-                        'content': content,
-                        'room_id': room_id
-                    })
+                    coalescer.push(content)
                 
                 if hasattr(chunk, 'usage') and chunk.usage:
                     accumulated_usage = chunk.usage.total_tokens
@@ -726,23 +790,22 @@ def handle_ai_response_ws(app, query, room_id, user_nickname=None):
                 db.session.commit()
                 
             # 5. Broadcast Done
-            broadcast_room_message(room_id, {
+            frames = coalescer.close()
+            coalescer.send({
                 'type': 'ai_stream_done',
                 'id': msg_id,
-                'room_id': room_id
+                'room_id': room_id,
+                'frames': frames + 1
             })
             
             # 6. Save Message to DB
             if full_content:
-                msg_entry = Message(
+                persister.submit(
                     content=full_content,
                     msg_type='ai',
                     user_id=None, # System/AI
-                    room_id=room_id,
-                    timestamp=datetime.now()
+                    room_id=room_id
                 )
-                db.session.add(msg_entry)
-                db.session.commit()
                 
         except Exception as e:
             print(f"AI Stream Error: {e}")
@@ -7,10 +7,85 @@ class AppConfig:
     DB_PATH = os.path.join(BASE_DIR, 'database', 'quliao.db')
     SQLALCHEMY_DATABASE_URI = f'sqlite:///{DB_PATH}'
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+    # SQLite 连接参数，每个新连接执行一次 (app/db_settings.py)
+    SQLITE_PRAGMAS = {
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',  # WAL 下进程崩溃不丢数据，断电可能丢最后几个事务；要求更严设为 FULL
+        'busy_timeout': 5000,  # 毫秒，等待写锁
+        'cache_size': -32000,  # 负数单位 KiB，每个连接约 32MB 页缓存
+        'mmap_size': 268435456,  # 256MB
+        'temp_store': 'MEMORY',
+    }
+    # 写连接池：聊天写入、普通接口
+    DB_POOL_SIZE = 10
+    DB_MAX_OVERFLOW = 20
+    DB_POOL_TIMEOUT = 10  # 秒，借不到连接时报错
+    # 只读连接池 (mode=ro)：后台统计、列表和 AI 分析，连接数单独限制，不和写入抢连接
+    DB_READONLY_ENABLED = True
+    DB_READONLY_POOL_SIZE = 4
+    DB_READONLY_MAX_OVERFLOW = 4
     
     # 上传配置
     UPLOAD_FOLDER = os.path.join(BASE_DIR, 'app', 'static', 'uploads')
     MAX_CONTENT_LENGTH = 16 * 1024 * 1024  # 16MB max limit
+    # 聊天图片预览 (app/previews.py，需要安装 Pillow)：上传后后台生成缩略图和中图，点开才加载原图
+    PREVIEW_WORKERS = 2  # 生成线程数，0 表示关闭
+    PREVIEW_QUEUE_SIZE = 200  # 排队上限，超过的丢弃 (客户端显示原图，可用 backfill_previews.py 补齐)
+    PREVIEW_THUMB_SIZE = 320  # 长边像素，消息列表里显示
+    PREVIEW_MEDIUM_SIZE = 1280  # 点开预览时先显示
+    PREVIEW_QUALITY = 80
+    PREVIEW_WEBP = True  # Pillow 不支持 WebP 时用 JPEG
+
+    # WebSocket 心跳 (秒)
+    WS_HEARTBEAT_INTERVAL = 30  # 超过该时间无任何帧则下发探测 ping
+    WS_IDLE_TIMEOUT = 90  # 超过该时间无任何帧则关闭连接
+    # 每个连接的发送队列长度及溢出策略: drop_oldest / coalesce / disconnect
+    WS_OUTBOUND_QUEUE_SIZE = 256
+    WS_OUTBOUND_OVERFLOW = 'drop_oldest'
+    # 广播帧 JSON 编码器: auto (安装了 orjson 则使用) / orjson / json
+    WS_JSON_ENCODER = 'auto'
+    # AI 流式回复合并窗口：攒够字符数或等待超过毫秒数就发送一帧
+    WS_AI_FLUSH_MS = 50
+    WS_AI_FLUSH_CHARS = 64
+    # 在线状态: global (全站一个在线列表) / room (按群推送)
+    WS_PRESENCE_SCOPE = 'global'
+    WS_PRESENCE_BATCH_MS = 200  # 上下线变化合并窗口
+    WS_PRESENCE_MAX_ROOM_SIZE = 500  # room 模式下超过该人数的群只响应客户端拉取
+    # 跨进程广播总线: inprocess (单进程) / unix (多 worker，本机 Unix domain socket)
+    WS_BROKER = os.getenv("WS_BROKER", "inprocess")
+    WS_BROKER_PATH = os.getenv("WS_BROKER_PATH")  # unix 模式的 socket 目录，默认系统临时目录下 teamchat-bus
+    # 聊天消息写入: sync (每条一个事务) / group (合并提交后再广播) / async (先广播，后台合并提交)
+    MESSAGE_DURABILITY = os.getenv("MESSAGE_DURABILITY", "group")
+    MESSAGE_FLUSH_MS = 10  # 合并提交窗口
+    MESSAGE_FLUSH_ROWS = 200  # 每批最多行数
+    MESSAGE_QUEUE_MAX = 10000  # 待写入队列上限，超过时发送方等待
+    # /ws 入站限流 (token bucket)：每秒补充的令牌数 / 最多攒的令牌数，0 表示不限制
+    WS_RATE_USER_PER_SEC = 5  # 每个用户（心跳帧不计）
+    WS_RATE_USER_BURST = 10
+    WS_RATE_ROOM_PER_SEC = 50  # 每个群的聊天消息合计
+    WS_RATE_ROOM_BURST = 100
+
+    # 冷热分层：超过天数的消息移到按月的归档库 (archive_messages.py)，0 表示不归档
+    MESSAGE_ARCHIVE_DIR = os.path.join(BASE_DIR, 'database', 'archive')
+    MESSAGE_ARCHIVE_AFTER_DAYS = 180
+    # 消息保留天数，群单独设置 (rooms.retention_days) 优先，0 表示永久保留
+    MESSAGE_RETENTION_DAYS = 0
+    MESSAGE_TIERING_BATCH = 500  # 归档/清理每个事务处理的条数
+
+    # 关键词审核：写入消息时匹配，命中的记到 message_flags；文件修改后自动生效，不存在时不审核
+    MODERATION_KEYWORDS_FILE = os.path.join(BASE_DIR, 'moderation_keywords.txt')
+    MODERATION_RELOAD_INTERVAL = 5  # 秒，检查文件修改时间的间隔
+
+    # 后台接口响应缓存 (秒)：多个管理员同时打开仪表盘时共享一次计算，0 表示不缓存（并发请求仍合并）
+    RESPONSE_CACHE_TTL = 10  # 仪表盘数据
+    AI_REPORT_CACHE_TTL = 300  # AI 态势报告，每次生成都要调用大模型
+
+    # 后台列表总数缓存 (秒)：过期后先返回旧值，后台重新 COUNT
+    ADMIN_COUNT_CACHE_TTL = 60
+
+    # 消息列表序列化用的用户名片缓存 (昵称/头像)
+    USER_CARD_CACHE_SIZE = 5000
+    USER_CARD_CACHE_TTL = 300  # 秒
 
     # Compression
     COMPRESS_MIMETYPES = ['text/html', 'text/css', 'text/xml', 'application/json', 'application/javascript']
@@ -0,0 +1,160 @@
+import os
+import threading
+import time
+from functools import wraps
+
+from flask import g, has_app_context
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event, exc
+from sqlalchemy.engine import make_url
+from sqlalchemy.pool import QueuePool
+
+READONLY_BIND = 'readonly'
+# 只读连接不能改 journal_mode，也用不到 synchronous
+_WRITER_ONLY_PRAGMAS = ('journal_mode', 'synchronous')
+
+
+class PoolStats:
+    """连接池借出统计：等待耗时 (包括新建连接)、超时次数"""
+
+    SLOW_MS = 10
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.checkouts = 0
+        self.slow = 0
+        self.timeouts = 0
+        self.wait_total_ms = 0.0
+        self.wait_max_ms = 0.0
+
+    def record(self, wait_ms):
+        with self._lock:
+            self.checkouts += 1
+            self.wait_total_ms += wait_ms
+            if wait_ms > self.wait_max_ms:
+                self.wait_max_ms = wait_ms
+            if wait_ms >= self.SLOW_MS:
+                self.slow += 1
+
+    def record_timeout(self):
+        with self._lock:
+            self.timeouts += 1
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'checkouts': self.checkouts,
+                'slow_checkouts': self.slow,
+                'timeouts': self.timeouts,
+                'wait_avg_ms': round(self.wait_total_ms / self.checkouts, 3) if self.checkouts else 0,
+                'wait_max_ms': round(self.wait_max_ms, 3),
+            }
+
+
+class TimedQueuePool(QueuePool):
+    """记录每次借出连接等待时间的 QueuePool"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.stats = PoolStats()
+
+    def recreate(self):
+        pool = super().recreate()
+        pool.stats = self.stats
+        return pool
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            conn = super()._do_get()
+        except exc.TimeoutError:
+            self.stats.record_timeout()
+            raise
+        self.stats.record((time.perf_counter() - start) * 1000)
+        return conn
+
+    def snapshot(self):
+        data = self.stats.snapshot()
+        data.update({
+            'size': self.size(),
+            'checked_out': self.checkedout(),
+            'overflow': max(self.overflow(), 0),
+            'max_overflow': self._max_overflow,
+        })
+        return data
+
+
+class RoutingSession(Session):
+    """db.session：视图标记了 readonly_db 时，没有指定 bind 的查询走只读引擎"""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and has_app_context() and g.get('db_readonly'):
+            engine = self._db.engines.get(READONLY_BIND)
+            if engine is not None:
+                return engine
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+def readonly_db(view):
+    """视图内的查询使用只读连接池：后台统计等长查询不占用聊天写入的连接，误写直接报错"""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        g.db_readonly = True
+        return view(*args, **kwargs)
+    return wrapper
+
+
+def configure(app):
+    """db.init_app 之前调用：按配置生成连接池参数，SQLite 文件库另建只读引擎 (mode=ro)"""
+    config = app.config
+    options = config.setdefault('SQLALCHEMY_ENGINE_OPTIONS', {})
+    url = make_url(config['SQLALCHEMY_DATABASE_URI'])
+    if not url.drivername.startswith('sqlite') or url.database in (None, '', ':memory:'):
+        return
+    options.setdefault('poolclass', TimedQueuePool)
+    options.setdefault('pool_size', config['DB_POOL_SIZE'])
+    options.setdefault('max_overflow', config['DB_MAX_OVERFLOW'])
+    options.setdefault('pool_timeout', config['DB_POOL_TIMEOUT'])
+
+    if not config['DB_READONLY_ENABLED']:
+        return
+    path = url.database
+    if not os.path.isabs(path):
+        path = os.path.join(app.instance_path, path)
+    config.setdefault('SQLALCHEMY_BINDS', {}).setdefault(READONLY_BIND, {
+        'url': f'sqlite:///file:{path}?mode=ro&uri=true',
+        'poolclass': TimedQueuePool,
+        'pool_size': config['DB_READONLY_POOL_SIZE'],
+        'max_overflow': config['DB_READONLY_MAX_OVERFLOW'],
+        'pool_timeout': config['DB_POOL_TIMEOUT'],
+    })
+
+
+def init_app(app, db):
+    """db.init_app 之后调用：给每个 SQLite 引擎注册各自的连接 PRAGMA"""
+    with app.app_context():
+        engines = dict(db.engines)
+    for key, engine in engines.items():
+        if engine.dialect.name != 'sqlite':
+            continue
+        pragmas = dict(app.config['SQLITE_PRAGMAS'])
+        if key == READONLY_BIND:
+            for name in _WRITER_ONLY_PRAGMAS:
+                pragmas.pop(name, None)
+            pragmas['query_only'] = 1
+        event.listen(engine, 'connect', _pragma_listener(pragmas))
+
+
+def _pragma_listener(pragmas):
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute(f'PRAGMA {name}={value}')
+        cursor.close()
+    return set_sqlite_pragmas
+
+
+def pool_stats(db):
+    """各引擎连接池的借出统计，给后台 /admin/api/realtime/stats"""
+    return {key or 'default': engine.pool.snapshot()
+            for key, engine in db.engines.items() if isinstance(engine.pool, TimedQueuePool)}
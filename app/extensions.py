@@ -1,5 +1,7 @@
 from flask_sock import Sock
 from flask_sqlalchemy import SQLAlchemy
 
+from app.db_settings import RoutingSession
+
 sock = Sock()
-db = SQLAlchemy()
+db = SQLAlchemy(session_options={'class_': RoutingSession})
@@ -0,0 +1,230 @@
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+
+from flask import current_app, g
+
+from app.extensions import db
+
+
+class CountCache:
+    """后台列表总数的近似缓存：过期后先返回旧值，后台线程重新数 (stale-while-revalidate)
+
+    只有第一次请求同步 COUNT(*)，翻页不再每次数全表。由计数器维护的总数 (rollups.totals) 不经过这里。
+    compute 要在调用时自己建查询 (如 lambda: Model.query.filter(...).count())，后台线程里执行时
+    用的是线程自己的 session，不能传绑定在请求 session 上的 query.count。
+    """
+
+    def __init__(self, ttl=60, max_size=1000):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._lock = threading.Lock()
+        self._counts = OrderedDict()  # key -> (expires, value)
+        self._refreshing = set()
+        self.stats = {'hits': 0, 'stale': 0, 'misses': 0, 'refreshes': 0, 'errors': 0}
+
+    def init_app(self, app):
+        self.ttl = app.config.get('ADMIN_COUNT_CACHE_TTL', self.ttl)
+
+    def get(self, key, compute):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._counts.get(key)
+            if entry is not None and entry[0] > now:
+                self.stats['hits'] += 1
+                return entry[1]
+            refresh = entry is not None and key not in self._refreshing
+            if entry is not None:
+                self.stats['stale'] += 1
+                self._refreshing.add(key)
+            else:
+                self.stats['misses'] += 1
+        if entry is None:
+            value = compute()
+            self._store(key, value)
+            return value
+        if refresh:
+            app = current_app._get_current_object()
+            threading.Thread(target=self._refresh, args=(app, key, compute),
+                             name=f'count-cache-{key}', daemon=True).start()
+        return entry[1]
+
+    def invalidate(self, prefix=None):
+        """标记过期 (不删除)：下一次请求仍返回旧值，同时后台重新数"""
+        with self._lock:
+            for key, (expires, value) in list(self._counts.items()):
+                if prefix is None or key.startswith(prefix):
+                    self._counts[key] = (0, value)
+
+    def clear(self):
+        """丢弃全部缓存，下一次请求同步重新数"""
+        with self._lock:
+            self._counts.clear()
+
+    def snapshot_stats(self):
+        with self._lock:
+            data = dict(self.stats)
+            data['size'] = len(self._counts)
+        data['ttl'] = self.ttl
+        return data
+
+    def _refresh(self, app, key, compute):
+        try:
+            with app.app_context():
+                g.db_readonly = True
+                try:
+                    value = compute()
+                finally:
+                    db.session.remove()
+            self._store(key, value)
+            with self._lock:
+                self.stats['refreshes'] += 1
+        except Exception:
+            app.logger.exception('count refresh failed: %s', key)
+            with self._lock:
+                self.stats['errors'] += 1
+        finally:
+            with self._lock:
+                self._refreshing.discard(key)
+
+    def _store(self, key, value):
+        with self._lock:
+            self._counts[key] = (time.monotonic() + self.ttl, value)
+            self._counts.move_to_end(key)
+            while len(self._counts) > self.max_size:
+                self._counts.popitem(last=False)
+
+
+class KeysetPager:
+    """后台列表的 keyset 分页，兼容 Layui 的 page/limit 参数
+
+    记住每个列表最近请求过的页的首尾排序键 (按 scope、每页条数区分)：请求相邻页 (上一页/下一页、刷新当前页)
+    时用排序键定位，走索引直接取 limit 行，与页码深浅无关。跳页时从最近的已知页往后 OFFSET，
+    都没有才从头 OFFSET。也可以直接传响应里的 cursor.next / cursor.prev (after / before 参数)。
+
+    columns 为排序列，最后一列必须唯一 (一般是 id)。一个列表可以由多个查询合并 (如按 msg_type 拆开，
+    每个查询各自走索引)，UNION ALL 后由 SQLite 按排序键归并，跳过的行不取出。
+    """
+
+    def __init__(self, name, columns, desc=True, ttl=300, max_pages=1000):
+        self.name = name
+        self.columns = columns
+        self.desc = desc
+        self.ttl = ttl
+        self.max_pages = max_pages
+        self._lock = threading.Lock()
+        self._anchors = OrderedDict()  # (scope, limit) -> {page: (expires, first_key, last_key)}
+        self.stats = {'keyset': 0, 'offset': 0}
+
+    def page(self, queries, page=1, limit=20, scope=None, after=None, before=None):
+        """返回 (rows, cursor)，cursor 为 {'next': ..., 'prev': ...} 编码后的排序键"""
+        if not isinstance(queries, (list, tuple)):
+            queries = [queries]
+        page = max(page, 1)
+        if after:
+            rows = self._fetch(queries, self._beyond(self.decode(after)), limit)
+        elif before:
+            rows = self._fetch(queries, self._beyond(self.decode(before), backward=True), limit, backward=True)
+        else:
+            rows = self._by_page(queries, page, limit, scope)
+        cursor = {
+            'next': self.encode(self.key(rows[-1])) if len(rows) == limit else None,
+            'prev': self.encode(self.key(rows[0])) if rows and (page > 1 or after or before) else None,
+        }
+        return rows, cursor
+
+    def _by_page(self, queries, page, limit, scope):
+        if page == 1:
+            # 第一页总是从头取，新数据立即可见
+            rows = self._fetch(queries, None, limit)
+        else:
+            anchors = self._known_pages(scope, limit)
+            if page - 1 in anchors:
+                rows = self._fetch(queries, self._beyond(anchors[page - 1][1]), limit)
+            elif page + 1 in anchors:
+                rows = self._fetch(queries, self._beyond(anchors[page + 1][0], backward=True), limit, backward=True)
+            elif page in anchors:
+                rows = self._fetch(queries, self._beyond(anchors[page][0], inclusive=True), limit)
+            else:
+                known = [p for p in anchors if p < page]
+                if known:
+                    start = max(known)
+                    rows = self._fetch(queries, self._beyond(anchors[start][1]), limit, offset=(page - start - 1) * limit)
+                else:
+                    rows = self._fetch(queries, None, limit, offset=(page - 1) * limit)
+        if rows:
+            self._remember(scope, limit, page, self.key(rows[0]), self.key(rows[-1]))
+        return rows
+
+    def _fetch(self, queries, condition, limit, offset=0, backward=False):
+        # backward: 往前翻 (比 condition 更靠前的行)，反向排序取完再翻转
+        ascending = self.desc == backward
+        order = [column.asc() if ascending else column.desc() for column in self.columns]
+        with self._lock:
+            self.stats['offset' if offset else 'keyset'] += 1
+        if condition is not None:
+            queries = [query.filter(condition) for query in queries]
+        if len(queries) == 1:
+            rows = queries[0].order_by(*order).offset(offset).limit(limit).all()
+        else:
+            rows = self._fetch_merged(queries, ascending, offset, limit)
+        return rows[::-1] if backward else rows
+
+    def _fetch_merged(self, queries, ascending, offset, limit):
+        # 多个查询 UNION ALL 后排序：SQLite 按各自的索引顺序归并，OFFSET 在 SQL 里跳过，
+        # 只取这一页的排序键，再按唯一列 (最后一列) 取这一页的行
+        compound = db.union_all(*[query.with_entities(*self.columns).order_by(None).statement for query in queries])
+        compound = compound.order_by(*[column.asc() if ascending else column.desc()
+                                       for column in compound.selected_columns]).offset(offset).limit(limit)
+        ids = [key[-1] for key in db.session.execute(compound)]
+        if not ids:
+            return []
+        unique = self.columns[-1]
+        entity = queries[0].column_descriptions[0]['entity']
+        found = {getattr(row, unique.key): row for row in db.session.query(entity).filter(unique.in_(ids))}
+        return [found[i] for i in ids if i in found]
+
+    def _beyond(self, key, backward=False, inclusive=False):
+        # 排在 key 之后 (backward 时之前) 的行
+        left = self.columns[0] if len(self.columns) == 1 else db.tuple_(*self.columns)
+        right = key[0] if len(self.columns) == 1 else db.tuple_(*key)
+        if self.desc != backward:
+            return left <= right if inclusive else left < right
+        return left >= right if inclusive else left > right
+
+    def key(self, row):
+        return tuple(getattr(row, column.key) for column in self.columns)
+
+    def encode(self, key):
+        return '|'.join(value.isoformat() if isinstance(value, datetime) else str(value) for value in key)
+
+    def decode(self, cursor):
+        parts = cursor.split('|')
+        if len(parts) != len(self.columns):
+            raise ValueError('invalid cursor')
+        key = []
+        for column, part in zip(self.columns, parts):
+            python_type = column.type.python_type
+            key.append(datetime.fromisoformat(part) if python_type is datetime else python_type(part))
+        return tuple(key)
+
+    def _known_pages(self, scope, limit):
+        now = time.monotonic()
+        with self._lock:
+            pages = self._anchors.get((scope, limit), {})
+            return {page: entry[1:] for page, entry in pages.items() if entry[0] > now}
+
+    def _remember(self, scope, limit, page, first, last):
+        with self._lock:
+            pages = self._anchors.setdefault((scope, limit), {})
+            self._anchors.move_to_end((scope, limit))
+            pages[page] = (time.monotonic() + self.ttl, first, last)
+            if len(pages) > self.max_pages:
+                # 丢掉离当前页最远的
+                del pages[max(pages, key=lambda p: abs(p - page))]
+            while len(self._anchors) > self.max_pages:
+                self._anchors.popitem(last=False)
+
+
+count_cache = CountCache()
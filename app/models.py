@@ -12,6 +12,11 @@ class User(db.Model):
     password_hash = db.Column(db.String(128))
     is_banned = db.Column(db.Boolean, default=False) # 是否封禁
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        db.Index('idx_users_nickname', 'nickname'),  # /ws join 按昵称查找
+        db.Index('idx_users_created_at', 'created_at'),  # 后台用户列表排序
+    )
     
     def set_password(self, password):
         self.password_hash = generate_password_hash(password)
@@ -41,6 +46,12 @@ class Friendship(db.Model):
     user = db.relationship('User', foreign_keys=[user_id], backref='friend_requests_sent')
     friend = db.relationship('User', foreign_keys=[friend_id], backref='friend_requests_received')
 
+    # 好友列表 / 好友申请按 (user_id|friend_id, status) 过滤
+    __table_args__ = (
+        db.Index('idx_friendships_user_id_status', 'user_id', 'status'),
+        db.Index('idx_friendships_friend_id_status', 'friend_id', 'status'),
+    )
+
 class Room(db.Model):
     __tablename__ = 'rooms'
     id = db.Column(db.Integer, primary_key=True)
@@ -51,19 +62,32 @@ class Room(db.Model):
     announcement = db.Column(db.Text, nullable=True)
     announcement_time = db.Column(db.DateTime, nullable=True)
     is_banned = db.Column(db.Boolean, default=False) # 是否封禁
+    last_message_id = db.Column(db.Integer, nullable=True) # 最后一条消息，写入消息时维护
+    last_activity_at = db.Column(db.DateTime, nullable=True) # 最后一条消息的时间，侧边栏排序
+    retention_days = db.Column(db.Integer, nullable=True) # 消息保留天数，空则用 MESSAGE_RETENTION_DAYS
 
     owner = db.relationship('User', foreign_keys=[owner_id])
 
+    __table_args__ = (
+        db.Index('idx_rooms_name', 'name'),  # 公共聊天室按名称查找
+    )
+
 class RoomMember(db.Model):
     __tablename__ = 'room_members'
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False, index=True)
     room_id = db.Column(db.Integer, db.ForeignKey('rooms.id'), nullable=False, index=True)
     joined_at = db.Column(db.DateTime, default=datetime.utcnow)
+    last_read_message_id = db.Column(db.Integer, default=0) # 已读到的消息 id
+    unread_count = db.Column(db.Integer, default=0) # 未读数，写入消息时批量累加
     
     user = db.relationship('User', backref=db.backref('room_memberships', lazy='dynamic'))
     room = db.relationship('Room', backref=db.backref('members', lazy='dynamic'))
 
+    __table_args__ = (
+        db.Index('idx_room_members_user_id_room_id', 'user_id', 'room_id'),  # 成员校验
+    )
+
 
 class Message(db.Model):
     __tablename__ = 'messages'
@@ -78,22 +102,112 @@ class Message(db.Model):
     user = db.relationship('User', backref=db.backref('messages', lazy=True))
     room = db.relationship('Room', backref=db.backref('messages', lazy=True))
 
+    # 聊天记录按 (room_id, id) 分页，id 自增且唯一，时间戳相同也能稳定排序
+    __table_args__ = (
+        db.Index('idx_messages_room_id_id', 'room_id', 'id'),
+        db.Index('idx_messages_room_id_timestamp', 'room_id', 'timestamp'),  # 后台群消息列表
+        db.Index('idx_messages_msg_type_timestamp', 'msg_type', 'timestamp'),  # 后台文件列表
+    )
+
     def to_dict(self):
-        user_name = 'System'
-        if self.user:
-            user_name = self.user.nickname or self.user.username
-        elif self.msg_type == 'ai':
-            user_name = '趣唠AI'
-            
-        return {
-            'id': self.id,
-            'content': self.content,
-            'msg_type': self.msg_type,
-            'timestamp': self.timestamp.strftime('%H:%M'), # 简化时间格式
-            'user': user_name,
-            'avatar': self.user.avatar if self.user else ('/static/images/default_avatar.svg' if self.msg_type == 'ai' else ''),
-            'room': self.room.name
-        }
+        # 列表请用 serializers.serialize_messages，一页只查一次用户和群
+        from app.serializers import serialize_messages
+        return serialize_messages([self])[0]
+
+class MessageArchive(db.Model):
+    """冷数据归档目录：每个 (月份, 群) 一行，记录该群在月归档文件里的 id 范围"""
+    __tablename__ = 'message_archives'
+    id = db.Column(db.Integer, primary_key=True)
+    month = db.Column(db.String(7), nullable=False) # 2024-05，对应 messages_2024-05.db
+    room_id = db.Column(db.Integer, nullable=False)
+    min_id = db.Column(db.Integer, nullable=False)
+    max_id = db.Column(db.Integer, nullable=False)
+    message_count = db.Column(db.Integer, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        db.UniqueConstraint('month', 'room_id', name='uq_message_archives_month_room_id'),
+        db.Index('idx_message_archives_room_id_max_id', 'room_id', 'max_id'),  # 翻到归档时按群查找
+    )
+
+class MessageHourlyStat(db.Model):
+    """每个群每小时的消息数 (UTC)，写入消息时累加，后台统计用"""
+    __tablename__ = 'message_stats_hourly'
+    id = db.Column(db.Integer, primary_key=True)
+    hour = db.Column(db.DateTime, nullable=False) # 整点
+    room_id = db.Column(db.Integer, nullable=False)
+    message_count = db.Column(db.Integer, default=0)
+
+    __table_args__ = (
+        db.UniqueConstraint('hour', 'room_id', name='uq_message_stats_hourly_hour_room_id'),
+    )
+
+class DailyActiveUser(db.Model):
+    """每天发过消息的用户 (UTC)，统计当日活跃人数"""
+    __tablename__ = 'daily_active_users'
+    day = db.Column(db.Date, primary_key=True)
+    user_id = db.Column(db.Integer, primary_key=True)
+
+class StatCounter(db.Model):
+    """总数计数器 (users / rooms)，由 app/rollups.py 建的触发器维护"""
+    __tablename__ = 'stat_counters'
+    name = db.Column(db.String(32), primary_key=True)
+    value = db.Column(db.Integer, default=0)
+
+class Attachment(db.Model):
+    """上传的文件 (聊天附件、头像)，记录大小、类型、哈希，后台按用户/群统计存储用量"""
+    __tablename__ = 'attachments'
+    id = db.Column(db.Integer, primary_key=True)
+    url = db.Column(db.String(500), nullable=False) # 消息 content / users.avatar 中的 URL，内容相同的上传共用一个 URL
+    original_name = db.Column(db.String(255))
+    kind = db.Column(db.String(20), default='file') # image / file / audio / avatar
+    mime = db.Column(db.String(100))
+    size = db.Column(db.Integer, default=0) # 字节
+    sha256 = db.Column(db.String(64))
+    width = db.Column(db.Integer)
+    height = db.Column(db.Integer)
+    uploader_id = db.Column(db.Integer, nullable=True)
+    room_id = db.Column(db.Integer, nullable=True) # 头像为空
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        db.Index('idx_attachments_uploader_id_size', 'uploader_id', 'size'),  # 按用户统计用量
+        db.Index('idx_attachments_room_id_size', 'room_id', 'size'),  # 按群统计用量
+        db.Index('idx_attachments_sha256', 'sha256'),
+        db.Index('idx_attachments_kind_id', 'kind', 'id'),  # 后台按类型浏览
+        db.Index('idx_attachments_url', 'url'),
+    )
+
+class UploadBlob(db.Model):
+    """按内容存储的上传文件 (app/storage.py)，每个 sha256 一份，ref_count 为引用它的附件数"""
+    __tablename__ = 'upload_blobs'
+    id = db.Column(db.Integer, primary_key=True)
+    sha256 = db.Column(db.String(64), unique=True, nullable=False)
+    path = db.Column(db.String(200), nullable=False) # 相对上传目录: ab/cd/<sha256>.<扩展名>
+    size = db.Column(db.Integer, default=0)
+    mime = db.Column(db.String(100))
+    ref_count = db.Column(db.Integer, default=0, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        db.Index('idx_upload_blobs_ref_count_size', 'ref_count', 'size'),  # 去重统计 (覆盖索引)
+    )
+
+class MessageFlag(db.Model):
+    """写入时关键词审核命中的消息 (app/moderation.py)，每条消息一行，后台预警列表按 id 倒序分页"""
+    __tablename__ = 'message_flags'
+    id = db.Column(db.Integer, primary_key=True)
+    message_id = db.Column(db.Integer, nullable=False, index=True)
+    room_id = db.Column(db.Integer, nullable=False)
+    user_id = db.Column(db.Integer, nullable=True)
+    keywords = db.Column(db.String(255)) # 命中的关键词，逗号分隔
+    level = db.Column(db.String(10), default='high') # low / medium / high
+    excerpt = db.Column(db.String(100)) # 消息开头，消息归档或删除后仍可查看
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        db.Index('idx_message_flags_room_id_id', 'room_id', 'id'),  # 按群筛选
+    )
 
 class ServerConfig(db.Model):
     __tablename__ = 'server_configs'
@@ -245,3 +359,7 @@ class SnakeGameScore(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
     user = db.relationship('User', backref='game_scores')
+
+    __table_args__ = (
+        db.Index('idx_snake_game_scores_score', 'score'),  # 排行榜
+    )
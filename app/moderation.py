@@ -0,0 +1,203 @@
+import os
+import threading
+import time
+from collections import deque
+
+from flask import current_app
+
+from app.extensions import db
+from app.models import MessageFlag, Room, User
+
+# 级别从低到高，一条消息命中多个关键词时取最高的
+LEVELS = ('low', 'medium', 'high')
+DEFAULT_LEVEL = 'high'
+# 图片/文件/语音的 content 是 URL，不检查
+UNCHECKED_TYPES = ('image', 'file', 'audio')
+EXCERPT_CHARS = 100
+
+
+class Automaton:
+    """Aho-Corasick 多模式匹配：一遍扫描找出所有命中的关键词，耗时与关键词数量无关
+
+    按字符建 trie，中英文一样处理；匹配前统一转小写。
+    """
+
+    def __init__(self, keywords):
+        # keywords: {关键词: 级别}
+        self.keywords = {}
+        self._goto = [{}]
+        self._fail = [0]
+        self._out = [()]
+        for word, level in keywords.items():
+            word = word.lower()
+            if not word:
+                continue
+            self.keywords[word] = level
+            state = 0
+            for ch in word:
+                nxt = self._goto[state].get(ch)
+                if nxt is None:
+                    nxt = self._goto[state][ch] = len(self._goto)
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._out.append(())
+                state = nxt
+            self._out[state] = (word,)
+        self._link()
+
+    def _link(self):
+        # BFS 建失败指针，并把失败链上的输出合并到每个状态，匹配时不用再沿链找输出
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for ch, nxt in self._goto[state].items():
+                queue.append(nxt)
+                fail = self._fail[state]
+                while fail and ch not in self._goto[fail]:
+                    fail = self._fail[fail]
+                fail = self._goto[fail].get(ch, 0)
+                self._fail[nxt] = fail
+                if self._out[fail]:
+                    self._out[nxt] = self._out[nxt] + self._out[fail]
+
+    def find(self, text):
+        """返回命中的关键词集合"""
+        goto, fail, out = self._goto, self._fail, self._out
+        hits = set()
+        state = 0
+        for ch in text.lower():
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            if out[state]:
+                hits.update(out[state])
+        return hits
+
+    def __len__(self):
+        return len(self.keywords)
+
+
+def parse_keywords(lines):
+    """关键词文件：每行一个关键词，可用 | 接级别 (low / medium / high，默认 high)，# 开头为注释"""
+    keywords = {}
+    for line in lines:
+        line = line.strip()
+        if not line or line.startswith('#'):
+            continue
+        word, sep, level = line.rpartition('|')
+        if not sep:
+            word, level = line, ''
+        word, level = word.strip(), level.strip().lower() or DEFAULT_LEVEL
+        if word:
+            keywords[word] = level if level in LEVELS else DEFAULT_LEVEL
+    return keywords
+
+
+class Moderator:
+    """写入消息时的关键词审核，关键词文件修改后自动重新加载 (按修改时间，最多每 reload_interval 秒检查一次)"""
+
+    def __init__(self):
+        self.path = None
+        self.reload_interval = 5
+        self.automaton = Automaton({})
+        self._mtime = None
+        self._checked_at = 0
+        self._lock = threading.Lock()
+        self.stats = {'checked': 0, 'flagged': 0, 'reloads': 0, 'match_ns_total': 0}
+
+    def init_app(self, app):
+        self.path = app.config.get('MODERATION_KEYWORDS_FILE')
+        self.reload_interval = app.config.get('MODERATION_RELOAD_INTERVAL', self.reload_interval)
+        self.reload()
+
+    def reload(self):
+        """重新读取关键词文件；文件不存在时不审核"""
+        with self._lock:
+            self._checked_at = time.monotonic()
+            try:
+                mtime = os.stat(self.path).st_mtime if self.path else None
+            except OSError:
+                mtime = None
+            if mtime == self._mtime:
+                return False
+            if mtime is None:
+                keywords = {}
+            else:
+                with open(self.path, encoding='utf-8') as f:
+                    keywords = parse_keywords(f)
+            # 构建完再整体替换，正在匹配的线程继续用旧的
+            self.automaton = Automaton(keywords)
+            self._mtime = mtime
+            self.stats['reloads'] += 1
+            return True
+
+    def check(self, rows):
+        """返回需要记录的审核结果，每条命中的消息一行"""
+        if time.monotonic() - self._checked_at >= self.reload_interval:
+            try:
+                self.reload()
+            except OSError as e:
+                # 读不到新文件时继续用旧关键词
+                current_app.logger.warning('moderation keywords reload failed: %s', e)
+        automaton = self.automaton
+        if not len(automaton):
+            return []
+        start = time.perf_counter_ns()
+        flags = []
+        for row in rows:
+            if row['msg_type'] in UNCHECKED_TYPES or not row['content']:
+                continue
+            hits = automaton.find(row['content'])
+            if hits:
+                flags.append({
+                    'message_id': row['id'],
+                    'room_id': row['room_id'],
+                    'user_id': row['user_id'],
+                    'keywords': ','.join(sorted(hits)),
+                    'level': max((automaton.keywords[k] for k in hits), key=LEVELS.index),
+                    'excerpt': row['content'][:EXCERPT_CHARS],
+                    'created_at': row['timestamp'],
+                })
+        self.stats['checked'] += len(rows)
+        self.stats['flagged'] += len(flags)
+        self.stats['match_ns_total'] += time.perf_counter_ns() - start
+        return flags
+
+    def snapshot_stats(self):
+        data = dict(self.stats)
+        data['keywords'] = len(self.automaton)
+        data['match_us_avg'] = round(data['match_ns_total'] / data['checked'] / 1000, 2) if data['checked'] else 0
+        data['file'] = self.path
+        return data
+
+
+moderator = Moderator()
+
+
+def flag_ingest(rows):
+    """写入消息时审核，命中的记录到 message_flags (与消息同一事务)"""
+    flags = moderator.check(rows)
+    if flags:
+        db.session.execute(db.insert(MessageFlag), flags)
+
+
+def recent_flags(before_id=None, limit=20, room_id=None):
+    """按 id 倒序分页取审核记录，before_id 为上一页最后一条的 id"""
+    query = db.session.query(MessageFlag, User.nickname, Room.name).outerjoin(
+        User, User.id == MessageFlag.user_id).outerjoin(Room, Room.id == MessageFlag.room_id)
+    if room_id:
+        query = query.filter(MessageFlag.room_id == room_id)
+    if before_id:
+        query = query.filter(MessageFlag.id < before_id)
+    rows = query.order_by(MessageFlag.id.desc()).limit(limit).all()
+    return [{
+        'id': flag.id,
+        'message_id': flag.message_id,
+        'user': nickname or 'Unknown',
+        'room': room_name or 'Unknown',
+        'keywords': flag.keywords,
+        'level': flag.level,
+        'content': flag.excerpt,
+        'time': flag.created_at.strftime('%H:%M:%S') if flag.created_at else '',
+        'date': flag.created_at.strftime('%Y-%m-%d %H:%M:%S') if flag.created_at else '',
+    } for flag, nickname, room_name in rows]
@@ -0,0 +1,178 @@
+import os
+import re
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import request
+
+try:
+    from PIL import Image, ImageOps, features
+except ImportError:  # 可选依赖，未安装时不生成预览图，聊天里直接显示原图
+    Image = None
+
+from app.storage import URL_PREFIX
+
+# 按内容存储的原图 (app/storage.py)，动图 (GIF) 不生成预览
+_SOURCE = re.compile(r'^([0-9a-f]{2}/[0-9a-f]{2}/[0-9a-f]{64})\.(png|jpe?g|webp|bmp)$')
+# 按内容存储的原图和预览图，内容不会变，可以长期缓存
+_IMMUTABLE = re.compile(re.escape(URL_PREFIX) + r'[0-9a-f]{2}/[0-9a-f]{2}/[0-9a-f]{64}(\.\w+)*$')
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
+
+class PreviewPipeline:
+    """聊天图片的缩略图 (thumb) 和中图 (medium)，上传后交给有界线程池在后台生成
+
+    预览图与原图放在同一目录：ab/cd/<sha256>.thumb.webp、<sha256>.medium.webp，路径由原图决定，
+    消息里直接带上 URL，不用查库。还没生成好 (或排队满了被丢弃) 时客户端回退到原图，
+    之后可以用 backfill_previews.py 补齐。没有安装 Pillow 时整个功能关闭，消息里不带预览 URL。
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.sizes = {'thumb': 320, 'medium': 1280}
+        self.format = 'jpg'
+        self.quality = 80
+        self.upload_dir = None
+        self.workers = 2
+        self.logger = None
+        self._slots = None
+        self._executor = None
+        self._executor_pid = None
+        self._pending = set()
+        self._lock = threading.Lock()
+        self.stats = {'queued': 0, 'generated': 0, 'dropped': 0, 'errors': 0, 'generate_ms_total': 0}
+
+    def init_app(self, app):
+        self.upload_dir = app.config['UPLOAD_FOLDER']
+        self.sizes = {'thumb': app.config.get('PREVIEW_THUMB_SIZE', 320),
+                      'medium': app.config.get('PREVIEW_MEDIUM_SIZE', 1280)}
+        self.quality = app.config.get('PREVIEW_QUALITY', self.quality)
+        self.workers = app.config.get('PREVIEW_WORKERS', self.workers)
+        self.enabled = Image is not None and self.workers > 0
+        self.logger = app.logger
+        if Image is None and self.workers > 0:
+            app.logger.warning('Pillow is not installed, chat image previews are disabled (pip install Pillow)')
+        webp = self.enabled and app.config.get('PREVIEW_WEBP', True) and features.check('webp')
+        self.format = 'webp' if webp else 'jpg'
+        # 正在生成 + 排队的总数上限，超过的直接丢弃，不让上传高峰堆积内存
+        self._slots = threading.BoundedSemaphore(self.workers + app.config.get('PREVIEW_QUEUE_SIZE', 200))
+        app.after_request(immutable_cache_headers)
+
+    def derivative_paths(self, path):
+        """{尺寸名: 相对上传目录的路径}，不是可生成预览的原图时返回 {}"""
+        match = _SOURCE.match(path or '')
+        if not match:
+            return {}
+        return {name: f'{match.group(1)}.{name}.{self.format}' for name in self.sizes}
+
+    def urls(self, url):
+        """消息里带的预览图 URL: {'thumb': ..., 'medium': ...}"""
+        if not self.enabled or not url or not url.startswith(URL_PREFIX):
+            return {}
+        return {name: URL_PREFIX + path for name, path in self.derivative_paths(url[len(URL_PREFIX):]).items()}
+
+    def submit(self, path):
+        """把原图 (相对上传目录的路径) 加入生成队列，返回是否已排队"""
+        targets = self.derivative_paths(path) if self.enabled else {}
+        if not targets or all(os.path.exists(os.path.join(self.upload_dir, t)) for t in targets.values()):
+            return False
+        with self._lock:
+            if path in self._pending:
+                return True
+            if not self._slots.acquire(blocking=False):
+                self.stats['dropped'] += 1
+                return False
+            self._pending.add(path)
+            self.stats['queued'] += 1
+            # fork 出来的 worker 进程没有父进程的线程，按 pid 各建各的
+            if self._executor is None or self._executor_pid != os.getpid():
+                self._executor = ThreadPoolExecutor(self.workers, thread_name_prefix='preview')
+                self._executor_pid = os.getpid()
+            executor = self._executor
+        executor.submit(self._run, path)
+        return True
+
+    def _run(self, path):
+        try:
+            self.generate(path)
+        except Exception:
+            self.logger.exception('preview generation failed: %s', path)
+            with self._lock:
+                self.stats['errors'] += 1
+        finally:
+            with self._lock:
+                self._pending.discard(path)
+            self._slots.release()
+
+    def generate(self, path):
+        """同步生成缺少的预览图，返回生成的个数"""
+        targets = {name: target for name, target in self.derivative_paths(path).items()
+                   if not os.path.exists(os.path.join(self.upload_dir, target))}
+        if not self.enabled or not targets:
+            return 0
+        start = time.perf_counter()
+        with Image.open(os.path.join(self.upload_dir, path)) as source:
+            # 手机照片按 EXIF 方向转正
+            image = ImageOps.exif_transpose(source)
+            image.load()
+        if self.format == 'jpg':
+            image = _flatten(image)
+        elif image.mode not in ('RGB', 'RGBA'):
+            image = image.convert('RGBA' if 'A' in image.getbands() or 'transparency' in image.info else 'RGB')
+        for name, target in targets.items():
+            size = self.sizes[name]
+            resized = image.copy()
+            resized.thumbnail((size, size), Image.LANCZOS)
+            self._save(resized, os.path.join(self.upload_dir, target))
+        with self._lock:
+            self.stats['generated'] += len(targets)
+            self.stats['generate_ms_total'] += int((time.perf_counter() - start) * 1000)
+        return len(targets)
+
+    def _save(self, image, full_path):
+        # 先写临时文件再改名，不会被请求到写了一半的图
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(full_path), suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as out:
+                if self.format == 'webp':
+                    image.save(out, 'WEBP', quality=self.quality, method=4)
+                else:
+                    image.save(out, 'JPEG', quality=self.quality, optimize=True, progressive=True)
+            os.replace(tmp_path, full_path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+
+    def snapshot_stats(self):
+        with self._lock:
+            data = dict(self.stats)
+            data['pending'] = len(self._pending)
+        data['enabled'] = self.enabled
+        data['format'] = self.format
+        data['workers'] = self.workers
+        data['generate_ms_avg'] = round(data['generate_ms_total'] / data['generated'], 1) if data['generated'] else 0
+        return data
+
+
+def _flatten(image):
+    # JPEG 没有透明通道，透明部分铺白底
+    if image.mode in ('RGBA', 'LA') or (image.mode == 'P' and 'transparency' in image.info):
+        image = image.convert('RGBA')
+        background = Image.new('RGB', image.size, (255, 255, 255))
+        background.paste(image, mask=image.getchannel('A'))
+        return background
+    return image.convert('RGB') if image.mode != 'RGB' else image
+
+
+def immutable_cache_headers(response):
+    """按内容寻址的上传文件 (原图、预览图) 内容不会变，浏览器和 CDN 缓存一年、不再验证"""
+    if response.status_code in (200, 206, 304) and _IMMUTABLE.match(request.path):
+        response.headers['Cache-Control'] = IMMUTABLE_CACHE_CONTROL
+        response.expires = None
+    return response
+
+
+previews = PreviewPipeline()
@@ -0,0 +1,35 @@
+from app.realtime.registry import Connection, ConnectionRegistry
+from app.realtime.heartbeat import HeartbeatMonitor
+from app.realtime.outbound import OutboundQueue
+from app.realtime.frames import Frame, FrameTemplate
+from app.realtime.presence import PresenceService
+from app.realtime.broker import Broker, InProcessBroker, UnixSocketBroker
+from app.realtime.hub import Hub
+from app.realtime.persister import MessagePersister, PersistError
+from app.realtime.ratelimit import RateLimiter
+from app.realtime import frames
+
+# 全局连接注册表 (/ws 聊天)
+registry = ConnectionRegistry()
+heartbeat = HeartbeatMonitor(registry)
+presence = PresenceService(registry)
+hub = Hub(registry, presence)
+# 聊天消息写入 (group commit)
+persister = MessagePersister()
+# 入站帧限流 (按用户 / 按群)
+ratelimiter = RateLimiter()
+
+
+def init_app(app):
+    frames.configure(app.config.get('WS_JSON_ENCODER', 'auto'))
+    registry.init_app(app)
+    heartbeat.init_app(app)
+    presence.init_app(app)
+    hub.init_app(app)
+    persister.init_app(app)
+    ratelimiter.init_app(app)
+
+
+__all__ = ["Connection", "ConnectionRegistry", "HeartbeatMonitor", "OutboundQueue", "Frame", "FrameTemplate", "PresenceService",
+           "Broker", "InProcessBroker", "UnixSocketBroker", "Hub", "MessagePersister", "PersistError", "RateLimiter",
+           "registry", "heartbeat", "presence", "hub", "persister", "ratelimiter", "init_app"]
@@ -0,0 +1,165 @@
+import json
+import os
+import socket
+import threading
+import time
+
+
+class Broker:
+    """WebSocket 扇出总线接口
+
+    publish() 把一个 envelope 发给所有 worker（包括自己），每个 worker 收到后
+    由 deliver 回调只投递给本进程内的连接。envelope 是可 JSON 序列化的 dict。
+    """
+
+    name = 'base'
+
+    def __init__(self):
+        self.deliver = None
+
+    def start(self, deliver):
+        self.deliver = deliver
+
+    def publish(self, envelope):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+    def stats(self):
+        return {'name': self.name}
+
+
+class InProcessBroker(Broker):
+    """单进程部署：直接本地投递"""
+
+    name = 'inprocess'
+
+    def publish(self, envelope):
+        self.deliver(envelope)
+
+
+class UnixSocketBroker(Broker):
+    """多进程部署：基于 Unix domain datagram socket 的本机总线，不依赖外部服务
+
+    每个 worker 在 bus_dir 下绑定 <pid>.sock；publish 时本进程直接投递，
+    其他 worker 通过 sendto 逐个发送。对端 socket 文件失效（进程已退出）时自动清理。
+    单个 envelope 受内核 datagram 上限限制（Linux 默认约 200KB）。
+    发送不阻塞：某个 worker 卡住、接收缓冲区满时，发给它的 envelope 直接丢弃并计入 dropped，
+    不会拖住其他 worker 的 /ws 收消息循环。
+    """
+
+    name = 'unix'
+    MAX_DATAGRAM = 200 * 1024
+    PEER_REFRESH = 1.0
+
+    def __init__(self, bus_dir):
+        super().__init__()
+        self.bus_dir = bus_dir
+        self.path = None
+        self._sock = None
+        self._peers = []
+        self._peers_at = 0
+        self._thread = None
+        self._closed = False
+        self.published = 0
+        self.received = 0
+        self.errors = 0
+        self.dropped = 0
+
+    def start(self, deliver):
+        if not hasattr(socket, 'AF_UNIX'):
+            raise RuntimeError("UnixSocketBroker requires AF_UNIX sockets (use WS_BROKER='inprocess')")
+        super().start(deliver)
+        os.makedirs(self.bus_dir, exist_ok=True)
+        self.path = os.path.join(self.bus_dir, f"{os.getpid()}.sock")
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+        self._sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self._sock.bind(self.path)
+        self._out = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self._out.setblocking(False)
+        self._thread = threading.Thread(target=self._run, name='ws-broker', daemon=True)
+        self._thread.start()
+
+    def publish(self, envelope):
+        data = json.dumps(envelope, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+        self.published += 1
+        self.deliver(envelope)
+        if len(data) > self.MAX_DATAGRAM:
+            self.errors += 1
+            print(f"Broker envelope too large ({len(data)} bytes), delivered locally only")
+            return
+        for peer in self._get_peers():
+            try:
+                self._out.sendto(data, peer)
+            except BlockingIOError:
+                # 对端接收缓冲区满 (进程卡住或处理不过来)
+                self.dropped += 1
+            except (ConnectionRefusedError, FileNotFoundError):
+                self._drop_peer(peer)
+            except OSError as e:
+                self.errors += 1
+                print(f"Broker send to {peer} failed: {e}")
+
+    def close(self):
+        self._closed = True
+        if self._sock is not None:
+            self._sock.close()
+            self._out.close()
+        if self.path and os.path.exists(self.path):
+            os.unlink(self.path)
+
+    def stats(self):
+        return {
+            'name': self.name,
+            'path': self.path,
+            'peers': len(self._get_peers()),
+            'published': self.published,
+            'received': self.received,
+            'errors': self.errors,
+            'dropped': self.dropped,
+        }
+
+    def _get_peers(self):
+        now = time.monotonic()
+        if now - self._peers_at > self.PEER_REFRESH:
+            try:
+                names = os.listdir(self.bus_dir)
+            except FileNotFoundError:
+                names = []
+            self._peers = [os.path.join(self.bus_dir, n) for n in names
+                           if n.endswith('.sock') and os.path.join(self.bus_dir, n) != self.path]
+            self._peers_at = now
+        return self._peers
+
+    def _drop_peer(self, peer):
+        try:
+            os.unlink(peer)
+        except OSError:
+            pass
+        self._peers = [p for p in self._peers if p != peer]
+
+    def _run(self):
+        while not self._closed:
+            try:
+                data = self._sock.recv(self.MAX_DATAGRAM)
+            except OSError:
+                if self._closed:
+                    return
+                self.errors += 1
+                continue
+            try:
+                self.received += 1
+                self.deliver(json.loads(data))
+            except Exception as e:
+                self.errors += 1
+                print(f"Broker deliver error: {e}")
+
+
+def create_broker(name, bus_dir=None):
+    if name == 'inprocess':
+        return InProcessBroker()
+    if name == 'unix':
+        return UnixSocketBroker(bus_dir)
+    raise ValueError(f"Unknown WS_BROKER: {name}")
@@ -0,0 +1,87 @@
+import json
+import threading
+
+try:
+    import orjson
+except ImportError:  # 可选依赖，未安装时使用标准库 json
+    orjson = None
+
+_use_orjson = orjson is not None
+
+
+def configure(encoder='auto'):
+    """选择 JSON 编码器: auto (有 orjson 就用) / orjson / json"""
+    global _use_orjson
+    if encoder == 'json':
+        _use_orjson = False
+    elif encoder in ('auto', 'orjson'):
+        _use_orjson = orjson is not None
+        if encoder == 'orjson' and orjson is None:
+            print("WS_JSON_ENCODER=orjson but orjson is not installed, falling back to json")
+    else:
+        raise ValueError(f"Unknown JSON encoder: {encoder}")
+
+
+def encoder_name():
+    return 'orjson' if _use_orjson else 'json'
+
+
+def encode(data):
+    """序列化为 str (WebSocket 文本帧)"""
+    if _use_orjson:
+        try:
+            return orjson.dumps(data).decode('utf-8')
+        except TypeError:
+            pass
+    return json.dumps(data, ensure_ascii=False, separators=(',', ':'))
+
+
+class Frame:
+    """预序列化的消息帧
+
+    同一条广播只编码一次，所有接收者共享同一个字符串。
+    """
+
+    __slots__ = ('payload', 'coalesce_key', '_data', '_lock')
+
+    def __init__(self, payload, coalesce_key=None):
+        self.payload = payload
+        self.coalesce_key = coalesce_key
+        self._data = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def of(cls, data):
+        return data if isinstance(data, cls) else cls(data)
+
+    @property
+    def data(self):
+        if self._data is None:
+            with self._lock:
+                if self._data is None:
+                    self._data = encode(self.payload)
+        return self._data
+
+    def __repr__(self):
+        return f"Frame({self.payload.get('type') if isinstance(self.payload, dict) else self.payload!r})"
+
+
+class FrameTemplate:
+    """只有一个字段会变化的帧（如 AI 流式 chunk）
+
+    固定部分提前编码一次，每次只编码变化的那个值再拼接。
+    """
+
+    _PLACEHOLDER = '\x00__frame_slot__\x00'
+
+    def __init__(self, payload, field):
+        base = dict(payload)
+        base[field] = self._PLACEHOLDER
+        encoded = encode(base)
+        slot = encode(self._PLACEHOLDER)
+        self._prefix, self._suffix = encoded.split(slot, 1)
+
+    def render(self, value):
+        frame = Frame(None)
+        frame._data = self._prefix + encode(value) + self._suffix
+        return frame
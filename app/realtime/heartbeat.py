@@ -0,0 +1,105 @@
+import threading
+import time
+
+from app.realtime.frames import encode
+
+
+class HeartbeatMonitor:
+    """/ws 心跳与空闲连接回收
+
+    - 客户端 ping 只回 pong 给发送者本人
+    - 每个连接记录 last_seen，后台线程定时扫描：
+      空闲超过 interval 的连接下发一次探测 ping（用于测 RTT），
+      空闲超过 idle_timeout 的连接直接关闭回收
+    """
+
+    def __init__(self, registry, interval=30, idle_timeout=90):
+        self.registry = registry
+        self.interval = interval
+        self.idle_timeout = idle_timeout
+        self._thread = None
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self.stats = {
+            'heartbeats': 0,
+            'probes': 0,
+            'pongs': 0,
+            'reaped': 0,
+            'rtt_samples': 0,
+            'rtt_last_ms': 0.0,
+            'rtt_avg_ms': 0.0,
+            'rtt_max_ms': 0.0,
+        }
+
+    def init_app(self, app):
+        self.interval = app.config.get('WS_HEARTBEAT_INTERVAL', self.interval)
+        self.idle_timeout = app.config.get('WS_IDLE_TIMEOUT', self.idle_timeout)
+
+    def ensure_started(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._stop.clear()
+                self._thread = threading.Thread(target=self._run, name='ws-heartbeat', daemon=True)
+                self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def handle_ping(self, conn, msg_data):
+        self._incr('heartbeats')
+        # 客户端在 ping 里带上它上一次测得的 RTT
+        rtt = msg_data.get('rtt')
+        if isinstance(rtt, (int, float)):
+            self._record_rtt(rtt)
+        conn.send(encode({'type': 'pong', 'ts': msg_data.get('ts'), 'server_time': int(time.time() * 1000)}))
+
+    def handle_pong(self, conn, msg_data):
+        self._incr('pongs')
+        ts = msg_data.get('ts')
+        if isinstance(ts, (int, float)):
+            self._record_rtt(time.time() * 1000 - ts)
+
+    def snapshot(self):
+        with self._lock:
+            data = dict(self.stats)
+        data['connections'] = len(self.registry)
+        data['interval'] = self.interval
+        data['idle_timeout'] = self.idle_timeout
+        return data
+
+    def sweep(self, now=None):
+        now = now or time.monotonic()
+        for conn in self.registry.connections():
+            if conn.closed:
+                continue
+            idle = conn.idle_for(now)
+            if idle > self.idle_timeout:
+                conn.close()
+                self._incr('reaped')
+            elif idle > self.interval:
+                if conn.send(encode({'type': 'ping', 'ts': int(time.time() * 1000)})):
+                    self._incr('probes')
+
+    def _run(self):
+        # 扫描间隔取心跳周期的一半，保证空闲连接最迟 idle_timeout + interval/2 被回收
+        while not self._stop.wait(max(self.interval / 2, 1)):
+            try:
+                self.sweep()
+            except Exception as e:
+                print(f"Heartbeat sweep error: {e}")
+
+    def _incr(self, key, n=1):
+        with self._lock:
+            self.stats[key] += n
+
+    def _record_rtt(self, rtt):
+        if rtt < 0:
+            return
+        with self._lock:
+            s = self.stats
+            s['rtt_samples'] += 1
+            s['rtt_last_ms'] = round(rtt, 1)
+            s['rtt_max_ms'] = round(max(s['rtt_max_ms'], rtt), 1)
+            s['rtt_avg_ms'] = round(s['rtt_avg_ms'] + (rtt - s['rtt_avg_ms']) / s['rtt_samples'], 1)
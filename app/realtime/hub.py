@@ -0,0 +1,171 @@
+import os
+import tempfile
+import threading
+
+from flask import has_app_context
+
+from app.realtime.broker import InProcessBroker, create_broker
+from app.realtime.frames import Frame
+from app.serializers import user_cards
+from app.response_cache import response_cache
+
+
+class Hub:
+    """/ws 扇出入口：所有广播、成员变化和上下线事件都经过 broker
+
+    单进程时 broker 直接本地投递；多 worker 时每条 envelope 发给所有 worker，
+    各自只投递给本进程的连接，并同步各自的群成员缓存和在线状态。
+    """
+
+    def __init__(self, registry, presence):
+        self.registry = registry
+        self.presence = presence
+        self.broker = InProcessBroker()
+        self.app = None
+        self._broker_name = 'inprocess'
+        self._bus_dir = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    @property
+    def worker_id(self):
+        return os.getpid()
+
+    def init_app(self, app):
+        self.app = app
+        self._broker_name = app.config.get('WS_BROKER', 'inprocess')
+        self._bus_dir = app.config.get('WS_BROKER_PATH') or os.path.join(tempfile.gettempdir(), 'teamchat-bus')
+
+    def ensure_started(self):
+        # fork 出来的 worker 需要各自绑定自己的 socket
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid != os.getpid():
+                self.broker = create_broker(self._broker_name, self._bus_dir)
+                self.broker.start(self._deliver)
+                self._pid = os.getpid()
+
+    def close(self):
+        self.broker.close()
+        self._pid = None
+
+    # --- fanout ---
+
+    def publish_room(self, room_id, data):
+        self._publish('room', int(room_id), data)
+
+    def publish_user(self, user_id, data):
+        self._publish('user', user_id, data)
+
+    def publish_all(self, data):
+        self._publish('all', None, data)
+
+    def room_sink(self, room_id):
+        """返回一个向房间发送帧的函数（用于 AI 流式回复）
+
+        单进程时接收者只解析一次；多 worker 时每帧经 broker 由各 worker 本地解析。
+        """
+        self.ensure_started()
+        if isinstance(self.broker, InProcessBroker):
+            conns = self.registry.connections_for_room(int(room_id))
+
+            def sink(frame):
+                for conn in conns:
+                    conn.send(frame.data)
+            return sink
+        return lambda frame: self.publish_room(room_id, frame)
+
+    # --- membership / presence ---
+
+    def add_room_member(self, room_id, user_id):
+        self._control('member_add', room_id=room_id, user_id=user_id)
+
+    def remove_room_member(self, room_id, user_id):
+        self._control('member_remove', room_id=room_id, user_id=user_id)
+
+    def forget_room(self, room_id):
+        self._control('room_forget', room_id=room_id)
+
+    def forget_user(self, user_id):
+        self._control('user_forget', user_id=user_id)
+
+    def user_changed(self, user_id):
+        # 昵称/头像变化，所有 worker 的用户名片缓存失效
+        self._control('user_card', user_id=user_id)
+
+    def cache_invalidated(self, prefix=None):
+        # 后台响应缓存失效，通知所有 worker
+        self._control('response_cache', prefix=prefix)
+
+    def user_online(self, conn):
+        card = {'id': conn.user_id, 'nickname': conn.nickname, 'avatar': conn.avatar}
+        self._control('online', card=card, worker=self.worker_id)
+        self.presence.send_initial(conn)
+
+    def user_offline(self, conn):
+        # 本 worker 上还有该用户的其他连接时不算下线
+        if conn.user_id is None or self.registry.connections_for_user(conn.user_id):
+            return
+        self._control('offline', user_id=conn.user_id, worker=self.worker_id)
+
+    def stats(self):
+        data = self.broker.stats()
+        data['worker'] = self.worker_id
+        return data
+
+    # --- internals ---
+
+    def _publish(self, kind, target, data):
+        self.ensure_started()
+        frame = Frame.of(data)
+        self.broker.publish({'kind': kind, 'target': target, 'data': frame.data, 'key': frame.coalesce_key})
+
+    def _control(self, op, **fields):
+        self.ensure_started()
+        fields['kind'] = 'control'
+        fields['op'] = op
+        self.broker.publish(fields)
+
+    def _deliver(self, env):
+        # broker 接收线程里没有 app context，群成员缓存未命中时需要查库
+        if self.app is not None and not has_app_context():
+            with self.app.app_context():
+                self._dispatch(env)
+        else:
+            self._dispatch(env)
+
+    def _dispatch(self, env):
+        kind = env['kind']
+        if kind == 'control':
+            self._apply_control(env)
+            return
+        if kind == 'room':
+            conns = self.registry.connections_for_room(env['target'])
+        elif kind == 'user':
+            conns = self.registry.connections_for_user(env['target'])
+        else:
+            conns = self.registry.connections()
+        msg, key = env['data'], env.get('key')
+        for conn in conns:
+            conn.send(msg, key)
+
+    def _apply_control(self, env):
+        op = env['op']
+        if op == 'member_add':
+            self.registry.add_room_member(env['room_id'], env['user_id'])
+            self.presence.member_added(env['room_id'], env['user_id'])
+        elif op == 'member_remove':
+            self.registry.remove_room_member(env['room_id'], env['user_id'])
+        elif op == 'room_forget':
+            self.registry.forget_room(env['room_id'])
+        elif op == 'user_forget':
+            self.registry.forget_user(env['user_id'])
+        elif op == 'user_card':
+            user_cards.invalidate(env['user_id'])
+        elif op == 'response_cache':
+            response_cache.invalidate(env['prefix'])
+        elif op == 'online':
+            self.presence.apply_online(env['card'], env['worker'])
+        elif op == 'offline':
+            self.presence.apply_offline(env['user_id'], env['worker'])
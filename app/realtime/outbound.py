@@ -0,0 +1,106 @@
+import threading
+from collections import deque
+
+DROP_OLDEST = 'drop_oldest'
+COALESCE = 'coalesce'
+DISCONNECT = 'disconnect'
+OVERFLOW_POLICIES = (DROP_OLDEST, COALESCE, DISCONNECT)
+
+
+class OutboundQueue:
+    """单个连接的有界发送队列，由独立的写线程负责 ws.send
+
+    广播方只做入队，慢客户端只会堆积自己的队列，不会拖慢其他人。
+    队列满时按 policy 处理：
+    - drop_oldest: 丢弃最早的一帧
+    - coalesce: 带 coalesce_key 的帧（如在线状态快照）只保留最新一份，仍然满则丢最早的
+    - disconnect: 直接断开这个慢连接
+    """
+
+    def __init__(self, conn, maxsize=256, policy=DROP_OLDEST):
+        if policy not in OVERFLOW_POLICIES:
+            raise ValueError(f"Unknown overflow policy: {policy}")
+        self.conn = conn
+        self.maxsize = maxsize
+        self.policy = policy
+        self._items = deque()
+        self._cond = threading.Condition()
+        self._closed = False
+        self._thread = None
+        self.sent = 0
+        self.dropped = 0
+        self.coalesced = 0
+        self.max_depth = 0
+
+    def __len__(self):
+        return len(self._items)
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='ws-writer', daemon=True)
+        self._thread.start()
+
+    def put(self, msg, coalesce_key=None):
+        """入队，返回 False 表示连接已关闭或因溢出被断开"""
+        with self._cond:
+            if self._closed:
+                return False
+            if coalesce_key is not None and self.policy == COALESCE and self._replace(coalesce_key, msg):
+                self.coalesced += 1
+                return True
+            if len(self._items) >= self.maxsize:
+                if self.policy == DISCONNECT:
+                    self.dropped += 1
+                    self._closed = True
+                    self._items.clear()
+                    self._cond.notify()
+                    overflow = True
+                else:
+                    self._items.popleft()
+                    self.dropped += 1
+                    overflow = False
+            else:
+                overflow = False
+            if not overflow:
+                self._items.append((coalesce_key, msg))
+                self.max_depth = max(self.max_depth, len(self._items))
+                self._cond.notify()
+        if overflow:
+            self.conn.close()
+            return False
+        return True
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+
+    def stats(self):
+        return {
+            'depth': len(self._items),
+            'max_depth': self.max_depth,
+            'sent': self.sent,
+            'dropped': self.dropped,
+            'coalesced': self.coalesced,
+        }
+
+    def _replace(self, key, msg):
+        for i, (k, _) in enumerate(self._items):
+            if k == key:
+                self._items[i] = (key, msg)
+                return True
+        return False
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._items and not self._closed:
+                    self._cond.wait()
+                if self._closed:
+                    return
+                _, msg = self._items.popleft()
+            try:
+                self.conn.ws.send(msg)
+                self.sent += 1
+            except Exception:
+                self.conn.close()
+                return
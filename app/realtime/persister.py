@@ -0,0 +1,258 @@
+import atexit
+import multiprocessing
+import os
+import threading
+import time
+from collections import deque
+from datetime import datetime
+
+from app.serving import on_shutdown
+
+SYNC = 'sync'
+GROUP = 'group'
+ASYNC = 'async'
+DURABILITY_MODES = (SYNC, GROUP, ASYNC)
+
+
+class PersistError(Exception):
+    """消息未能写入数据库（sync/group 模式下由 submit 抛出）"""
+
+
+class _Pending:
+    __slots__ = ('row', 'event', 'error')
+
+    def __init__(self, row, wait):
+        self.row = row
+        self.event = threading.Event() if wait else None
+        self.error = None
+
+
+class MessagePersister:
+    """聊天消息写入 (write-behind + group commit)
+
+    消息 ID 在入队时就分配好（跨 fork 出来的 worker 共享一个计数器，首次使用时从
+    messages 表的 max(id) 开始），所以广播不需要等数据库。按 durability 决定何时广播：
+    - sync: 每条消息单独一个事务，提交后才返回（原来的行为）
+    - group: 写线程把排队的消息（最多 flush_rows 条）合并成一个事务提交，submit 等到
+      所在批次提交后才返回；并发发送时多条消息共用一次提交，崩溃时不会丢已广播的消息
+    - async: submit 入队后立即返回并广播，写线程每 flush_ms 或满 flush_rows 条提交一次，
+      崩溃时最多丢失队列中尚未提交的消息
+    """
+
+    def __init__(self, durability=GROUP, flush_ms=10, flush_rows=200, max_queue=10000):
+        self.durability = durability
+        self.flush_ms = flush_ms
+        self.flush_rows = flush_rows
+        self.max_queue = max_queue
+        self.app = None
+        # 在 create_app 时（fork 之前）创建，worker 之间共享
+        self._next_id = multiprocessing.RawValue('q', 0)
+        self._id_lock = multiprocessing.Lock()
+        self._queue = deque()
+        self._cond = threading.Condition()
+        self._inflight = 0
+        self._thread = None
+        self._pid = None
+        self._closed = False
+        self.stats = {
+            'submitted': 0,
+            'committed': 0,
+            'failed': 0,
+            'batches': 0,
+            'max_depth': 0,
+            'max_batch': 0,
+            'commit_ms_last': 0,
+            'commit_ms_max': 0,
+            'commit_ms_total': 0,
+        }
+
+    def init_app(self, app):
+        self.app = app
+        self.durability = app.config.get('MESSAGE_DURABILITY', self.durability)
+        if self.durability not in DURABILITY_MODES:
+            raise ValueError(f"Unknown MESSAGE_DURABILITY: {self.durability}")
+        self.flush_ms = app.config.get('MESSAGE_FLUSH_MS', self.flush_ms)
+        self.flush_rows = app.config.get('MESSAGE_FLUSH_ROWS', self.flush_rows)
+        self.max_queue = app.config.get('MESSAGE_QUEUE_MAX', self.max_queue)
+        atexit.register(self.flush)
+        on_shutdown(self.flush)
+
+    # --- ids ---
+
+    def next_id(self):
+        with self._id_lock:
+            if self._next_id.value == 0:
+                self._next_id.value = self._max_message_id() + 1
+            value = self._next_id.value
+            self._next_id.value = value + 1
+        return value
+
+    def _max_message_id(self):
+        from app.extensions import db
+        from app.models import Message
+
+        with self.app.app_context():
+            return db.session.query(db.func.max(Message.id)).scalar() or 0
+
+    # --- write path ---
+
+    def submit(self, content, msg_type, user_id, room_id, timestamp=None):
+        """保存一条消息，返回分配的 id；sync/group 模式下失败抛出 PersistError"""
+        row = {
+            'id': self.next_id(),
+            'content': content,
+            'msg_type': msg_type,
+            'user_id': user_id,
+            'room_id': room_id,
+            'timestamp': timestamp or datetime.now(),
+        }
+        with self._cond:
+            self.stats['submitted'] += 1
+        if self.durability == SYNC:
+            self._commit([_Pending(row, False)], raise_errors=True)
+            return row['id']
+        item = _Pending(row, self.durability == GROUP)
+        self._ensure_started()
+        with self._cond:
+            # 写入跟不上时让发送方等待，而不是无限堆积
+            while len(self._queue) >= self.max_queue and not self._closed:
+                self._cond.wait(0.1)
+            self._queue.append(item)
+            self.stats['max_depth'] = max(self.stats['max_depth'], len(self._queue))
+            self._cond.notify_all()
+        if item.event is not None:
+            item.event.wait()
+            if item.error is not None:
+                raise PersistError(item.error)
+        return row['id']
+
+    def flush(self, timeout=10):
+        """等待队列中的消息全部提交（退出前调用）"""
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            self._cond.notify_all()
+            while (self._queue or self._inflight) and self._thread is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    print(f"Message flush timeout, {len(self._queue)} rows not committed")
+                    return False
+                self._cond.wait(min(remaining, 0.05))
+        return True
+
+    def close(self):
+        self.flush()
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+    def depth(self):
+        return len(self._queue)
+
+    def snapshot_stats(self):
+        with self._cond:
+            data = dict(self.stats)
+        data['durability'] = self.durability
+        data['depth'] = len(self._queue)
+        data['inflight'] = self._inflight
+        batches = data['batches']
+        data['commit_ms_avg'] = round(data.pop('commit_ms_total') / batches, 2) if batches else 0
+        data['rows_per_batch'] = round(data['committed'] / batches, 1) if batches else 0
+        return data
+
+    # --- internals ---
+
+    def _ensure_started(self):
+        if self._pid == os.getpid():
+            return
+        with self._cond:
+            if self._pid != os.getpid():
+                # fork 出来的 worker 里父进程的写线程不存在，需要重新启动
+                self._queue.clear()
+                self._inflight = 0
+                self._thread = threading.Thread(target=self._run, name='message-writer', daemon=True)
+                self._thread.start()
+                self._pid = os.getpid()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._queue and not self._closed:
+                    self._cond.wait()
+                if not self._queue:
+                    return
+                # async: 第一条到达后最多再等 flush_ms，凑够 flush_rows 条立即提交。
+                # group: 发送方在等待，不额外等；上一批提交期间到达的消息自然合成下一批
+                deadline = time.monotonic() + (self.flush_ms / 1000.0 if self.durability == ASYNC else 0)
+                while len(self._queue) < self.flush_rows and not self._closed:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                batch = [self._queue.popleft() for _ in range(min(len(self._queue), self.flush_rows))]
+                self._inflight = len(batch)
+                self._cond.notify_all()
+            try:
+                self._commit(batch)
+            except Exception as e:
+                print(f"Message writer error: {e}")
+                for item in batch:
+                    item.error = item.error or str(e)
+            finally:
+                for item in batch:
+                    if item.event is not None:
+                        item.event.set()
+                with self._cond:
+                    self._inflight = 0
+                    self._cond.notify_all()
+
+    def _commit(self, batch, raise_errors=False):
+        from app.extensions import db
+        from app.models import Message
+        from app.room_state import apply_ingest
+
+        with self.app.app_context():
+            start = time.perf_counter()
+            try:
+                rows = [item.row for item in batch]
+                db.session.execute(db.insert(Message), rows)
+                apply_ingest(rows)
+                db.session.commit()
+                failed = []
+            except Exception as e:
+                db.session.rollback()
+                if raise_errors:
+                    with self._cond:
+                        self.stats['failed'] += len(batch)
+                    raise PersistError(str(e))
+                # 整批失败时逐条重试，一条坏数据不影响同批的其他消息
+                failed = self._commit_one_by_one(batch)
+            finally:
+                db.session.remove()
+            elapsed = (time.perf_counter() - start) * 1000
+        with self._cond:
+            stats = self.stats
+            stats['batches'] += 1
+            stats['committed'] += len(batch) - len(failed)
+            stats['failed'] += len(failed)
+            stats['max_batch'] = max(stats['max_batch'], len(batch))
+            stats['commit_ms_last'] = round(elapsed, 2)
+            stats['commit_ms_max'] = max(stats['commit_ms_max'], round(elapsed, 2))
+            stats['commit_ms_total'] += elapsed
+
+    def _commit_one_by_one(self, batch):
+        from app.extensions import db
+        from app.models import Message
+        from app.room_state import apply_ingest
+
+        failed = []
+        for item in batch:
+            try:
+                db.session.execute(db.insert(Message), [item.row])
+                apply_ingest([item.row])
+                db.session.commit()
+            except Exception as e:
+                db.session.rollback()
+                item.error = str(e)
+                failed.append(item)
+                print(f"Message {item.row['id']} not saved: {e}")
+        return failed
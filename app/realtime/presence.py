@@ -0,0 +1,253 @@
+import threading
+from collections import deque
+
+from app.realtime.frames import Frame
+
+GLOBAL = 'global'
+ROOM = 'room'
+
+
+class PresenceScope:
+    """一个在线状态范围（全局或某个群）的版本化状态"""
+
+    def __init__(self, key, log_size=64):
+        self.key = key
+        self.version = 0
+        self.users = {}  # user_id -> {'id', 'nickname', 'avatar'}
+        self.log = deque(maxlen=log_size)  # (version, added{uid: card}, removed{uid})
+        self.pending_added = {}
+        self.pending_removed = set()
+
+    def stage_add(self, card):
+        self.pending_removed.discard(card['id'])
+        self.pending_added[card['id']] = card
+
+    def stage_remove(self, user_id):
+        if self.pending_added.pop(user_id, None) is None:
+            self.pending_removed.add(user_id)
+
+    def commit(self):
+        """把暂存的变化合成一个新版本，没有实际变化时返回 None"""
+        added = {uid: c for uid, c in self.pending_added.items() if self.users.get(uid) != c}
+        removed = {uid for uid in self.pending_removed if uid in self.users}
+        self.pending_added = {}
+        self.pending_removed = set()
+        if not added and not removed:
+            return None
+        since = self.version
+        self.version += 1
+        self.users.update(added)
+        for uid in removed:
+            self.users.pop(uid, None)
+        self.log.append((self.version, added, removed))
+        return since
+
+    def diff_since(self, since):
+        """返回 (added, removed)；since 太旧、日志已不覆盖时返回 None"""
+        if since == self.version:
+            return {}, set()
+        if since > self.version or not self.log or since < self.log[0][0] - 1:
+            return None
+        added, removed = {}, set()
+        for version, a, r in self.log:
+            if version <= since:
+                continue
+            for uid in r:
+                added.pop(uid, None)
+                removed.add(uid)
+            for uid, card in a.items():
+                removed.discard(uid)
+                added[uid] = card
+        return added, removed
+
+
+class PresenceService:
+    """增量在线状态
+
+    上线/下线先暂存，每 batch_ms 合并成一个版本，只向该范围内的在线连接推送
+    presence_diff (since -> version)。客户端发现版本不连续时发送 presence_sync，
+    服务端用日志补差量，日志不够旧则回一个完整 snapshot。
+
+    scope=global 时所有人共享一个范围；scope=room 时每个群一个范围，
+    成员数超过 max_room_size 的大群不主动推送，只响应 presence_sync。
+    """
+
+    def __init__(self, registry, scope=GLOBAL, batch_ms=200, max_room_size=500):
+        self.registry = registry
+        self.scope = scope
+        self.batch_ms = batch_ms
+        self.max_room_size = max_room_size
+        self._lock = threading.RLock()
+        self._scopes = {}
+        self._dirty = set()
+        self._timer = None
+        self._cards = {}  # 在线用户 user_id -> card
+        self._user_workers = {}  # user_id -> {worker}
+        self.app = None
+        self.stats = {'diffs': 0, 'snapshots': 0, 'syncs': 0}
+
+    def init_app(self, app):
+        self.app = app
+        self.scope = app.config.get('WS_PRESENCE_SCOPE', self.scope)
+        self.batch_ms = app.config.get('WS_PRESENCE_BATCH_MS', self.batch_ms)
+        self.max_room_size = app.config.get('WS_PRESENCE_MAX_ROOM_SIZE', self.max_room_size)
+
+    # --- events (delivered by the hub on every worker) ---
+
+    def send_initial(self, conn):
+        """新连接绑定用户后：global 模式直接下发快照，room 模式等客户端按群拉取"""
+        if self.scope == GLOBAL:
+            self.send_snapshot(conn, GLOBAL)
+
+    def apply_online(self, card, worker):
+        """同一用户多端/多 worker 在线时，提交版本会自动去重"""
+        with self._lock:
+            self._cards[card['id']] = card
+            self._user_workers.setdefault(card['id'], set()).add(worker)
+            for key in self._scope_keys(card['id']):
+                self._get(key).stage_add(card)
+                self._dirty.add(key)
+            self._schedule()
+
+    def apply_offline(self, user_id, worker):
+        """该用户在所有 worker 上都没有连接了才算下线"""
+        with self._lock:
+            workers = self._user_workers.get(user_id)
+            if workers is not None:
+                workers.discard(worker)
+                if workers:
+                    return
+                del self._user_workers[user_id]
+            self._cards.pop(user_id, None)
+            for key in self._scope_keys(user_id):
+                self._get(key).stage_remove(user_id)
+                self._dirty.add(key)
+            self._schedule()
+
+    def member_added(self, room_id, user_id):
+        if self.scope != ROOM:
+            return
+        with self._lock:
+            card = self._cards.get(user_id)
+            if card is not None:
+                self._get(room_id).stage_add(card)
+                self._dirty.add(room_id)
+                self._schedule()
+
+    def handle_sync(self, conn, msg_data):
+        """客户端请求补齐：{type: 'presence_sync', scope, since}"""
+        self.stats['syncs'] += 1
+        key = msg_data.get('scope') or GLOBAL
+        if self.scope == ROOM and key != GLOBAL:
+            key = int(key)
+            if not self.registry.is_room_member(key, conn.user_id):
+                return
+        elif self.scope == ROOM or key != GLOBAL:
+            return
+        since = msg_data.get('since')
+        with self._lock:
+            scope = self._get(key)
+            diff = scope.diff_since(since) if isinstance(since, int) else None
+            if diff is None:
+                payload = self._snapshot_payload(scope)
+            else:
+                payload = self._diff_payload(scope, since, *diff)
+        self.stats['snapshots' if diff is None else 'diffs'] += 1
+        # 快照可以被更新的快照替换，差量不行（否则版本会断）
+        conn.send(Frame(payload).data, f'presence:{key}' if diff is None else None)
+
+    def send_snapshot(self, conn, key):
+        with self._lock:
+            payload = self._snapshot_payload(self._get(key))
+        self.stats['snapshots'] += 1
+        conn.send(Frame(payload).data, f'presence:{key}')
+
+    def flush(self):
+        if self.app is not None:
+            # 定时器线程里执行，群成员缓存未命中时需要查库
+            with self.app.app_context():
+                self._flush()
+        else:
+            self._flush()
+
+    def _flush(self):
+        with self._lock:
+            self._timer = None
+            dirty, self._dirty = self._dirty, set()
+            out = []
+            for key in dirty:
+                scope = self._get(key)
+                since = scope.commit()
+                if since is None:
+                    continue
+                _, added, removed = scope.log[-1]
+                out.append((key, self._diff_payload(scope, since, added, removed)))
+        for key, payload in out:
+            conns = self._recipients(key)
+            if conns is None:
+                continue
+            frame = Frame(payload)
+            for conn in conns:
+                conn.send(frame.data)
+            self.stats['diffs'] += 1
+
+    def is_online(self, user_id):
+        return user_id in self._user_workers
+
+    def online_user_ids(self, key=GLOBAL):
+        with self._lock:
+            return set(self._get(key).users)
+
+    def snapshot_stats(self):
+        with self._lock:
+            data = dict(self.stats)
+            data['scope'] = self.scope
+            data['scopes'] = len(self._scopes)
+            data['global_version'] = self._scopes[GLOBAL].version if GLOBAL in self._scopes else 0
+        return data
+
+    # --- internals ---
+
+    def _scope_keys(self, user_id):
+        if self.scope == GLOBAL:
+            return [GLOBAL]
+        return list(self.registry.rooms_for_user(user_id))
+
+    def _get(self, key):
+        scope = self._scopes.get(key)
+        if scope is None:
+            scope = self._scopes[key] = PresenceScope(key)
+        return scope
+
+    def _recipients(self, key):
+        if key == GLOBAL:
+            return self.registry.connections()
+        if len(self.registry.room_members(key)) > self.max_room_size:
+            return None
+        return self.registry.connections_for_room(key)
+
+    def _schedule(self):
+        if self._timer is None:
+            self._timer = threading.Timer(self.batch_ms / 1000.0, self.flush)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def _snapshot_payload(self, scope):
+        return {
+            'type': 'presence_snapshot',
+            'mode': self.scope,
+            'scope': scope.key,
+            'version': scope.version,
+            'users': list(scope.users.values()),
+        }
+
+    def _diff_payload(self, scope, since, added, removed):
+        return {
+            'type': 'presence_diff',
+            'mode': self.scope,
+            'scope': scope.key,
+            'since': since,
+            'version': scope.version,
+            'added': list(added.values()),
+            'removed': sorted(removed),
+        }
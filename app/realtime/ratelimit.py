@@ -0,0 +1,128 @@
+import threading
+import time
+
+USER = 'user'
+ROOM = 'room'
+
+
+class RateLimiter:
+    """/ws 入站帧限流 (token bucket)
+
+    - 每个用户一个桶（未登录连接按连接计），每个群一个桶
+    - 桶按 rate 每秒补充令牌，最多攒 burst 个；一帧消耗一个，两个桶都有令牌才放行
+    - 补满的桶和新建的桶等价，定期清理掉，内存只和最近活跃的用户/群数量有关
+    - rate 为 0 表示不限制该维度
+
+    限流状态在进程内，多 worker 时每个 worker 各自计数。
+    """
+
+    def __init__(self, user_rate=5, user_burst=10, room_rate=50, room_burst=100, sweep_interval=60):
+        self.user_rate = user_rate
+        self.user_burst = user_burst
+        self.room_rate = room_rate
+        self.room_burst = room_burst
+        self.sweep_interval = sweep_interval
+        self._lock = threading.Lock()
+        # key -> [tokens, last_refill]
+        self._users = {}
+        self._rooms = {}
+        self._next_sweep = time.monotonic() + sweep_interval
+        self.stats = {
+            'allowed': 0,
+            'limited_user': 0,
+            'limited_room': 0,
+            'sweeps': 0,
+            'swept': 0,
+            'check_ns_total': 0,
+            'check_ns_max': 0,
+        }
+
+    def init_app(self, app):
+        self.user_rate = app.config.get('WS_RATE_USER_PER_SEC', self.user_rate)
+        self.user_burst = app.config.get('WS_RATE_USER_BURST', self.user_burst)
+        self.room_rate = app.config.get('WS_RATE_ROOM_PER_SEC', self.room_rate)
+        self.room_burst = app.config.get('WS_RATE_ROOM_BURST', self.room_burst)
+
+    def check(self, user_key, room_id=None):
+        """消耗一个令牌；放行返回 None，否则返回 (scope, retry_after_ms)"""
+        start = time.perf_counter_ns()
+        now = time.monotonic()
+        limited = None
+        with self._lock:
+            user = self._take(self._users, user_key, self.user_rate, self.user_burst, now)
+            room = None
+            if room_id is not None:
+                room = self._take(self._rooms, room_id, self.room_rate, self.room_burst, now)
+            if user is not None and user[0] < 1:
+                limited = (USER, self._retry_after_ms(user, self.user_rate))
+            elif room is not None and room[0] < 1:
+                limited = (ROOM, self._retry_after_ms(room, self.room_rate))
+            else:
+                if user is not None:
+                    user[0] -= 1
+                if room is not None:
+                    room[0] -= 1
+            if now >= self._next_sweep:
+                self._sweep(now)
+            elapsed = time.perf_counter_ns() - start
+            stats = self.stats
+            if limited is None:
+                stats['allowed'] += 1
+            else:
+                stats['limited_' + limited[0]] += 1
+            stats['check_ns_total'] += elapsed
+            if elapsed > stats['check_ns_max']:
+                stats['check_ns_max'] = elapsed
+        return limited
+
+    def forget(self, user_key):
+        """未登录连接断开时释放它的桶"""
+        with self._lock:
+            self._users.pop(user_key, None)
+
+    def snapshot_stats(self):
+        with self._lock:
+            data = dict(self.stats)
+            data['user_buckets'] = len(self._users)
+            data['room_buckets'] = len(self._rooms)
+        checks = data['allowed'] + data['limited_user'] + data['limited_room']
+        data['check_us_avg'] = round(data.pop('check_ns_total') / checks / 1000, 2) if checks else 0
+        data['check_us_max'] = round(data.pop('check_ns_max') / 1000, 2)
+        data['limits'] = {
+            'user_per_sec': self.user_rate,
+            'user_burst': self.user_burst,
+            'room_per_sec': self.room_rate,
+            'room_burst': self.room_burst,
+        }
+        return data
+
+    # --- internals (调用方持有 _lock) ---
+
+    @staticmethod
+    def _take(buckets, key, rate, burst, now):
+        if not rate:
+            return None
+        bucket = buckets.get(key)
+        if bucket is None:
+            bucket = buckets[key] = [float(burst), now]
+            return bucket
+        bucket[0] = min(burst, bucket[0] + (now - bucket[1]) * rate)
+        bucket[1] = now
+        return bucket
+
+    @staticmethod
+    def _retry_after_ms(bucket, rate):
+        return int((1 - bucket[0]) / rate * 1000) + 1
+
+    def _sweep(self, now):
+        swept = 0
+        for buckets, rate, burst in ((self._users, self.user_rate, self.user_burst),
+                                     (self._rooms, self.room_rate, self.room_burst)):
+            idle = [key for key, (tokens, last) in buckets.items()
+                    if tokens + (now - last) * rate >= burst]
+            for key in idle:
+                del buckets[key]
+            swept += len(idle)
+        self._next_sweep = now + self.sweep_interval
+        self.stats['sweeps'] += 1
+        self.stats['swept'] += swept
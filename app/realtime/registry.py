@@ -0,0 +1,204 @@
+import threading
+import time
+
+from app.models import RoomMember
+from app.realtime.outbound import OutboundQueue, DROP_OLDEST
+
+
+class Connection:
+    """一个 /ws 连接及其绑定的用户信息"""
+
+    def __init__(self, ws, queue_size=256, overflow=DROP_OLDEST):
+        self.ws = ws
+        self.user_id = None
+        self.nickname = "Anonymous"
+        self.avatar = None
+        self.connected_at = time.monotonic()
+        self.last_seen = self.connected_at
+        self.closed = False
+        self.outbox = OutboundQueue(self, queue_size, overflow)
+        self.outbox.start()
+
+    @property
+    def is_authenticated(self):
+        return self.user_id is not None
+
+    def touch(self):
+        self.last_seen = time.monotonic()
+
+    def idle_for(self, now=None):
+        return (now or time.monotonic()) - self.last_seen
+
+    def send(self, msg, coalesce_key=None):
+        """入队发送，实际写 socket 由该连接的写线程完成"""
+        return self.outbox.put(msg, coalesce_key)
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        self.outbox.close()
+        try:
+            self.ws.close()
+        except Exception:
+            pass
+        # simple_websocket 的 close() 不会唤醒阻塞在 receive() 里的处理线程
+        event = getattr(self.ws, 'event', None)
+        if event is not None:
+            event.set()
+
+
+class ConnectionRegistry:
+    """WebSocket 连接注册表
+
+    - ws -> Connection
+    - user_id -> set(Connection)，同一用户可多端在线
+    - room_id -> set(user_id)，群成员缓存，首次用到时从数据库加载，
+      之后由 join/leave/create 接口增量维护，消息扇出时不再查库
+    - user_id -> set(room_id)，反向索引，用于按群推送在线状态
+    """
+
+    def __init__(self, queue_size=256, overflow=DROP_OLDEST):
+        self.queue_size = queue_size
+        self.overflow = overflow
+        self._lock = threading.RLock()
+        self._conns = {}
+        self._by_user = {}
+        self._room_members = {}
+        self._user_rooms = {}
+
+    def init_app(self, app):
+        self.queue_size = app.config.get('WS_OUTBOUND_QUEUE_SIZE', self.queue_size)
+        self.overflow = app.config.get('WS_OUTBOUND_OVERFLOW', self.overflow)
+
+    # --- connections ---
+
+    def add(self, ws):
+        conn = Connection(ws, self.queue_size, self.overflow)
+        with self._lock:
+            self._conns[ws] = conn
+        return conn
+
+    def get(self, ws):
+        return self._conns.get(ws)
+
+    def bind(self, conn, user_id, nickname, avatar=None):
+        with self._lock:
+            if conn.user_id is not None and conn.user_id != user_id:
+                self._unbind(conn)
+            conn.user_id = user_id
+            conn.nickname = nickname
+            conn.avatar = avatar
+            self._by_user.setdefault(user_id, set()).add(conn)
+
+    def remove(self, ws):
+        with self._lock:
+            conn = self._conns.pop(ws, None)
+            if conn is not None:
+                self._unbind(conn)
+        return conn
+
+    def _unbind(self, conn):
+        conns = self._by_user.get(conn.user_id)
+        if conns is not None:
+            conns.discard(conn)
+            if not conns:
+                del self._by_user[conn.user_id]
+
+    def connections(self):
+        with self._lock:
+            return list(self._conns.values())
+
+    def connections_for_user(self, user_id):
+        with self._lock:
+            return list(self._by_user.get(user_id, ()))
+
+    def connections_for_room(self, room_id):
+        members = self.room_members(room_id)
+        with self._lock:
+            # 遍历较小的一侧：在线用户数 vs 群成员数
+            if len(members) < len(self._by_user):
+                online = [self._by_user[uid] for uid in members if uid in self._by_user]
+            else:
+                online = [conns for uid, conns in self._by_user.items() if uid in members]
+            return [c for conns in online for c in conns]
+
+    def is_online(self, user_id):
+        return user_id in self._by_user
+
+    def __len__(self):
+        return len(self._conns)
+
+    def outbound_stats(self, top=10):
+        conns = self.connections()
+        per_conn = []
+        totals = {'depth': 0, 'sent': 0, 'dropped': 0, 'coalesced': 0, 'max_depth': 0}
+        for c in conns:
+            st = c.outbox.stats()
+            for k in ('depth', 'sent', 'dropped', 'coalesced'):
+                totals[k] += st[k]
+            totals['max_depth'] = max(totals['max_depth'], st['max_depth'])
+            if st['depth'] or st['dropped']:
+                per_conn.append(dict(st, user_id=c.user_id, nickname=c.nickname))
+        per_conn.sort(key=lambda x: (x['depth'], x['dropped']), reverse=True)
+        return {
+            'queue_size': self.queue_size,
+            'overflow': self.overflow,
+            'totals': totals,
+            'slowest': per_conn[:top],
+        }
+
+    # --- room membership cache ---
+
+    def room_members(self, room_id):
+        members = self._room_members.get(room_id)
+        if members is None:
+            rows = RoomMember.query.with_entities(RoomMember.user_id).filter_by(room_id=room_id).all()
+            loaded = {r.user_id for r in rows}
+            with self._lock:
+                members = self._room_members.setdefault(room_id, loaded)
+        return members
+
+    def is_room_member(self, room_id, user_id):
+        return user_id in self.room_members(room_id)
+
+    def rooms_for_user(self, user_id):
+        rooms = self._user_rooms.get(user_id)
+        if rooms is None:
+            rows = RoomMember.query.with_entities(RoomMember.room_id).filter_by(user_id=user_id).all()
+            loaded = frozenset(r.room_id for r in rows)
+            with self._lock:
+                rooms = self._user_rooms.setdefault(user_id, loaded)
+        return rooms
+
+    def add_room_member(self, room_id, user_id):
+        with self._lock:
+            members = self._room_members.get(room_id)
+            if members is not None:
+                self._room_members[room_id] = members | {user_id}
+            rooms = self._user_rooms.get(user_id)
+            if rooms is not None:
+                self._user_rooms[user_id] = rooms | {room_id}
+
+    def remove_room_member(self, room_id, user_id):
+        with self._lock:
+            members = self._room_members.get(room_id)
+            if members is not None:
+                self._room_members[room_id] = members - {user_id}
+            rooms = self._user_rooms.get(user_id)
+            if rooms is not None:
+                self._user_rooms[user_id] = rooms - {room_id}
+
+    def forget_room(self, room_id):
+        with self._lock:
+            self._room_members.pop(room_id, None)
+            for user_id, rooms in list(self._user_rooms.items()):
+                if room_id in rooms:
+                    self._user_rooms[user_id] = rooms - {room_id}
+
+    def forget_user(self, user_id):
+        with self._lock:
+            self._user_rooms.pop(user_id, None)
+            for room_id, members in list(self._room_members.items()):
+                if user_id in members:
+                    self._room_members[room_id] = members - {user_id}
@@ -0,0 +1,97 @@
+import threading
+
+from app.realtime.frames import Frame
+
+
+class StreamStats:
+    """AI 流式回复统计：每个回答发送了多少帧、合并了多少个 delta"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.answers = 0
+        self.frames = 0
+        self.deltas = 0
+        self.last_frames = 0
+
+    def record(self, frames, deltas):
+        with self._lock:
+            self.answers += 1
+            self.frames += frames
+            self.deltas += deltas
+            self.last_frames = frames
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'answers': self.answers,
+                'frames': self.frames,
+                'deltas': self.deltas,
+                'last_frames_per_answer': self.last_frames,
+                'avg_frames_per_answer': round(self.frames / self.answers, 1) if self.answers else 0,
+                'avg_deltas_per_frame': round(self.deltas / self.frames, 1) if self.frames else 0,
+            }
+
+
+stream_stats = StreamStats()
+
+
+class StreamCoalescer:
+    """把模型吐出的小 delta 攒成较大的 chunk 再广播
+
+    缓冲区满 flush_chars 个字符立即发送，否则最多等待 flush_ms 毫秒。
+    sink 由 Hub.room_sink() 提供：单进程时接收者在流开始时解析一次，
+    整个回答期间不再查询房间成员。
+    """
+
+    def __init__(self, sink, template, flush_ms=50, flush_chars=64):
+        self.sink = sink
+        self.template = template
+        self.flush_ms = flush_ms
+        self.flush_chars = flush_chars
+        self.frames = 0
+        self.deltas = 0
+        self._buffer = []
+        self._buffered = 0
+        self._lock = threading.Lock()
+        self._timer = None
+
+    def send(self, data):
+        """直接发送一帧（start/done 等控制帧）"""
+        self.sink(Frame.of(data))
+        self.frames += 1
+
+    def push(self, delta):
+        if not delta:
+            return
+        with self._lock:
+            self._buffer.append(delta)
+            self._buffered += len(delta)
+            self.deltas += 1
+            if self._buffered >= self.flush_chars or self.flush_ms <= 0:
+                self._flush_locked()
+            elif self._timer is None:
+                # 模型停顿时由定时器兜底，保证缓冲不超过 flush_ms
+                self._timer = threading.Timer(self.flush_ms / 1000.0, self.flush)
+                self._timer.daemon = True
+                self._timer.start()
+
+    def flush(self):
+        with self._lock:
+            self._flush_locked()
+
+    def close(self):
+        """发送剩余内容并记录统计，返回本次回答的帧数"""
+        self.flush()
+        stream_stats.record(self.frames, self.deltas)
+        return self.frames
+
+    def _flush_locked(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if not self._buffer:
+            return
+        text = ''.join(self._buffer)
+        self._buffer = []
+        self._buffered = 0
+        self.send(self.template.render(text))
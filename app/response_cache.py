@@ -0,0 +1,163 @@
+import threading
+import time
+from collections import defaultdict
+
+
+class _Flight:
+    """正在计算中的一个 key，并发请求等待同一个结果"""
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.value = None
+        self.error = None
+
+
+class _Stream:
+    """流式结果的共享缓冲：后台线程追加，任意多个读者从头读"""
+
+    def __init__(self):
+        self.cond = threading.Condition()
+        self.chunks = []
+        self.done = False
+        self.error = None
+
+    def append(self, chunk):
+        with self.cond:
+            self.chunks.append(chunk)
+            self.cond.notify_all()
+
+    def finish(self, error=None):
+        with self.cond:
+            self.done = True
+            self.error = error
+            self.cond.notify_all()
+
+    def reader(self):
+        index = 0
+        while True:
+            with self.cond:
+                while index >= len(self.chunks) and not self.done:
+                    self.cond.wait()
+                chunks = self.chunks[index:]
+                done, error = self.done, self.error
+            yield from chunks
+            index += len(chunks)
+            if done and index >= len(self.chunks):
+                if error is not None:
+                    raise error
+                return
+
+
+class ResponseCache:
+    """进程内 TTL 响应缓存，带 single-flight：同一个 key 同时只计算一次，并发请求共享结果
+
+    给后台仪表盘这类多个管理员同时轮询、几秒内结果不变的接口用。出错的结果不缓存。
+    失效经 hub.cache_invalidated() 通知所有 worker；TTL 兜底。
+    """
+
+    def __init__(self, default_ttl=10):
+        self.default_ttl = default_ttl
+        self._lock = threading.Lock()
+        self._entries = {}  # key -> (expires, value | _Stream)
+        self._inflight = {}  # key -> _Flight
+        self.stats = {'hits': 0, 'misses': 0, 'coalesced': 0, 'errors': 0, 'invalidations': 0}
+        self._key_stats = defaultdict(lambda: {'hits': 0, 'misses': 0, 'coalesced': 0})
+
+    def init_app(self, app):
+        self.default_ttl = app.config.get('RESPONSE_CACHE_TTL', self.default_ttl)
+
+    def get_or_compute(self, key, compute, ttl=None):
+        """返回 key 的缓存值；过期或不存在时调用 compute()，并发请求等待这一次计算"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > time.monotonic():
+                self._count(key, 'hits')
+                return entry[1]
+            flight = self._inflight.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._inflight[key] = _Flight()
+                self._count(key, 'misses')
+            else:
+                self._count(key, 'coalesced')
+
+        if not leader:
+            flight.event.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.value
+
+        try:
+            flight.value = compute()
+        except Exception as e:
+            flight.error = e
+            with self._lock:
+                self.stats['errors'] += 1
+                self._inflight.pop(key, None)
+            flight.event.set()
+            raise
+        with self._lock:
+            # 计算期间被 invalidate 过的结果只给本轮等待的请求，不写入缓存
+            if self._inflight.get(key) is flight:
+                del self._inflight[key]
+                self._entries[key] = (time.monotonic() + self._ttl(ttl), flight.value)
+        flight.event.set()
+        return flight.value
+
+    def stream(self, key, produce, ttl=None):
+        """流式结果的 single-flight：返回一个迭代器
+
+        produce() 返回的迭代器在后台线程里跑完（客户端断开也不中断），每一块追加到共享缓冲；
+        并发请求和 TTL 内的后续请求都从头读同一份缓冲。produce 出错时读者收到异常，结果不缓存。
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > time.monotonic():
+                self._count(key, 'hits' if entry[1].done else 'coalesced')
+                return entry[1].reader()
+            stream = _Stream()
+            self._entries[key] = (time.monotonic() + self._ttl(ttl), stream)
+            self._count(key, 'misses')
+
+        def run():
+            try:
+                for chunk in produce():
+                    stream.append(chunk)
+            except Exception as e:
+                with self._lock:
+                    self.stats['errors'] += 1
+                    entry = self._entries.get(key)
+                    if entry is not None and entry[1] is stream:
+                        del self._entries[key]
+                stream.finish(e)
+                return
+            stream.finish()
+
+        threading.Thread(target=run, name=f'response-cache-{key}', daemon=True).start()
+        return stream.reader()
+
+    def invalidate(self, prefix=None):
+        """删除以 prefix 开头的缓存 (不传则全部)；正在计算的结果不会再写入缓存"""
+        with self._lock:
+            for store in (self._entries, self._inflight):
+                for key in [k for k in store if prefix is None or k.startswith(prefix)]:
+                    del store[key]
+            self.stats['invalidations'] += 1
+
+    def snapshot_stats(self):
+        with self._lock:
+            data = dict(self.stats)
+            data['size'] = len(self._entries)
+            data['keys'] = {key: dict(counts) for key, counts in self._key_stats.items()}
+        data['default_ttl'] = self.default_ttl
+        return data
+
+    def _ttl(self, ttl):
+        return self.default_ttl if ttl is None else ttl
+
+    def _count(self, key, name):
+        self.stats[name] += 1
+        self._key_stats[key][name] += 1
+
+
+response_cache = ResponseCache()
@@ -0,0 +1,132 @@
+import os
+import time
+from collections import Counter
+from datetime import timedelta
+
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from app.archive import ARCHIVE_SCHEMA, archive_path, attached
+from app.extensions import db
+from app.models import DailyActiveUser, Message, MessageHourlyStat, Room, StatCounter, User
+
+# 由触发器维护总数的表
+COUNTED_TABLES = ('users', 'rooms')
+
+
+def ensure_counters():
+    """建 users/rooms 的计数触发器，并在写锁内重新数一遍"""
+    with attached(None) as conn:
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            for table in COUNTED_TABLES:
+                conn.execute(
+                    f"CREATE TRIGGER IF NOT EXISTS stat_{table}_ai AFTER INSERT ON {table} BEGIN "
+                    f"UPDATE stat_counters SET value = value + 1 WHERE name = '{table}'; END")
+                conn.execute(
+                    f"CREATE TRIGGER IF NOT EXISTS stat_{table}_ad AFTER DELETE ON {table} BEGIN "
+                    f"UPDATE stat_counters SET value = value - 1 WHERE name = '{table}'; END")
+                conn.execute(
+                    f"INSERT OR REPLACE INTO stat_counters (name, value) SELECT '{table}', COUNT(*) FROM {table}")
+            # 消息总数在写入时按批累加 (record_ingest)，删除、归档不减；只在第一次建立时数一遍
+            conn.execute(
+                "INSERT OR IGNORE INTO stat_counters (name, value) SELECT 'messages', "
+                "(SELECT COUNT(*) FROM messages) + (SELECT COALESCE(SUM(message_count), 0) FROM message_archives)")
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+
+
+def record_ingest(rows):
+    """写入消息时累加每小时消息数、消息总数，记录当日活跃用户 (与消息同一事务)，每批各一条语句"""
+    db.session.execute(
+        db.update(StatCounter).where(StatCounter.name == 'messages').values(value=StatCounter.value + len(rows)))
+    hourly = Counter((row['timestamp'].replace(minute=0, second=0, microsecond=0), row['room_id']) for row in rows)
+    stmt = sqlite_insert(MessageHourlyStat).values([
+        {'hour': hour, 'room_id': room_id, 'message_count': count} for (hour, room_id), count in hourly.items()
+    ])
+    db.session.execute(stmt.on_conflict_do_update(
+        index_elements=['hour', 'room_id'],
+        set_={'message_count': MessageHourlyStat.message_count + stmt.excluded.message_count}))
+
+    active = {(row['timestamp'].date(), row['user_id']) for row in rows if row['user_id'] is not None}
+    if active:
+        db.session.execute(sqlite_insert(DailyActiveUser).values([
+            {'day': day, 'user_id': user_id} for day, user_id in active
+        ]).on_conflict_do_nothing())
+
+
+def totals():
+    """用户数、群数、消息总数：读计数器，计数器还没建 (未执行 update_db.py) 时现数"""
+    counters = dict(db.session.query(StatCounter.name, StatCounter.value).all())
+    users = counters.get('users')
+    rooms = counters.get('rooms')
+    messages = counters.get('messages')
+    return {
+        'users': User.query.count() if users is None else users,
+        'rooms': Room.query.count() if rooms is None else rooms,
+        'messages': Message.query.count() if messages is None else messages,
+    }
+
+
+def message_count(since):
+    return db.session.query(db.func.sum(MessageHourlyStat.message_count)).filter(
+        MessageHourlyStat.hour >= since).scalar() or 0
+
+
+def active_user_count(day):
+    return db.session.query(db.func.count()).select_from(DailyActiveUser).filter(DailyActiveUser.day == day).scalar()
+
+
+def hourly_counts(since):
+    """{整点: 消息数}，所有群合计"""
+    return dict(db.session.query(MessageHourlyStat.hour, db.func.sum(MessageHourlyStat.message_count)).filter(
+        MessageHourlyStat.hour >= since).group_by(MessageHourlyStat.hour).all())
+
+
+def top_rooms(since, limit=10):
+    """[(群名, 消息数)]，按消息数倒序"""
+    total = db.func.sum(MessageHourlyStat.message_count)
+    return db.session.query(Room.name, total).join(Room, Room.id == MessageHourlyStat.room_id).filter(
+        MessageHourlyStat.hour >= since).group_by(MessageHourlyStat.room_id).order_by(total.desc()).limit(limit).all()
+
+
+def rebuild(start_day, end_day, pause=0.05, progress=None):
+    """按消息重建 [start_day, end_day] 的统计：每天一个写事务，先删后汇总，热库和当月归档都算"""
+    day = start_day
+    while day <= end_day:
+        params = {
+            'day': day.isoformat(),
+            'begin': f'{day.isoformat()} 00:00:00.000000',
+            'end': f'{(day + timedelta(days=1)).isoformat()} 00:00:00.000000',
+        }
+        path = archive_path(day.strftime('%Y-%m'))
+        if not os.path.exists(path):
+            path = None
+        source = "SELECT id, timestamp, room_id, user_id FROM main.messages WHERE timestamp >= :begin AND timestamp < :end"
+        if path:
+            # UNION 去重：归档中途崩溃时同一条消息可能两边都有
+            source += " UNION SELECT id, timestamp, room_id, user_id FROM arc.messages WHERE timestamp >= :begin AND timestamp < :end"
+        with attached(path) as conn:
+            if path:
+                for statement in ARCHIVE_SCHEMA:
+                    conn.execute(statement)
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                conn.execute("DELETE FROM message_stats_hourly WHERE hour >= :begin AND hour < :end", params)
+                conn.execute("DELETE FROM daily_active_users WHERE day = :day", params)
+                conn.execute(
+                    "INSERT INTO message_stats_hourly (hour, room_id, message_count) "
+                    f"SELECT substr(timestamp, 1, 13) || ':00:00.000000', room_id, COUNT(*) FROM ({source}) "
+                    "GROUP BY 1, room_id", params)
+                conn.execute(
+                    "INSERT INTO daily_active_users (day, user_id) "
+                    f"SELECT DISTINCT :day, user_id FROM ({source}) WHERE user_id IS NOT NULL", params)
+                conn.execute('COMMIT')
+            except Exception:
+                conn.execute('ROLLBACK')
+                raise
+        if progress:
+            progress(day)
+        day += timedelta(days=1)
+        time.sleep(pause)
@@ -0,0 +1,93 @@
+from collections import Counter
+
+from app.extensions import db
+from app.models import Message, Room, RoomMember
+from app.moderation import flag_ingest
+from app.rollups import record_ingest
+
+# 已读回执最多重新数多少条消息，超过时直接读到最新
+READ_RECOUNT_LIMIT = 1000
+
+
+def apply_ingest(rows):
+    """消息写入时同步维护的群状态（与消息在同一事务中）：未读数、最后一条消息、后台统计、关键词审核"""
+    by_room = {}
+    for row in rows:
+        by_room.setdefault(row['room_id'], []).append(row)
+    bump_unread(by_room)
+    touch_rooms(by_room)
+    record_ingest(rows)
+    flag_ingest(rows)
+
+
+def bump_unread(by_room):
+    """累加群成员的未读数
+
+    每个群一条 UPDATE，不管这一批有多少条消息：成员未读数 += 本批该群消息数 - 其中自己发的条数。
+    已读位置已经超过本批消息的成员（其他端已读）不再累加。
+    """
+    for room_id, room_rows in by_room.items():
+        sent = Counter(row['user_id'] for row in room_rows if row['user_id'] is not None)
+        own = db.case(sent, value=RoomMember.user_id, else_=0) if sent else 0
+        db.session.execute(
+            db.update(RoomMember)
+            .where(RoomMember.room_id == room_id,
+                   RoomMember.last_read_message_id < max(row['id'] for row in room_rows))
+            .values(unread_count=RoomMember.unread_count + len(room_rows) - own)
+        )
+
+
+def touch_rooms(by_room):
+    """记录每个群的最后一条消息和活跃时间，侧边栏按活跃时间排序"""
+    for room_id, room_rows in by_room.items():
+        last = max(room_rows, key=lambda row: row['id'])
+        db.session.execute(
+            db.update(Room)
+            .where(Room.id == room_id,
+                   db.or_(Room.last_message_id.is_(None), Room.last_message_id < last['id']))
+            .values(last_message_id=last['id'], last_activity_at=last['timestamp'])
+        )
+
+
+def mark_read(user_id, room_id, message_id=None):
+    """已读回执：把已读位置推进到 message_id（默认该群最新一条），返回 (last_read_message_id, unread)
+
+    不是群成员返回 None；比当前已读位置旧的回执（其他端已读得更多）不会回退。
+    未读数在计数器上减去新读到的别人的消息数，只数 (原已读位置, message_id] 这一段，最多数
+    READ_RECOUNT_LIMIT 条；超过时直接读到最新、未读清零，不会因为回执数整个群。
+    """
+    member = RoomMember.query.filter_by(user_id=user_id, room_id=room_id).first()
+    if not member:
+        return None
+    latest = db.session.query(db.func.max(Message.id)).filter(Message.room_id == room_id).scalar() or 0
+    message_id = latest if message_id is None else min(message_id, latest)
+    last_read = member.last_read_message_id or 0
+    if message_id > last_read:
+        # 走 (room_id, id) 索引，最多取 READ_RECOUNT_LIMIT + 1 个 id
+        read = len(db.session.execute(db.select(Message.id).where(
+            Message.room_id == room_id,
+            Message.id > last_read,
+            Message.id <= message_id,
+            db.or_(Message.user_id.is_(None), Message.user_id != user_id)
+        ).limit(READ_RECOUNT_LIMIT + 1)).all())
+        if read > READ_RECOUNT_LIMIT:
+            message_id, unread = latest, 0
+        else:
+            unread = db.func.max(db.func.coalesce(RoomMember.unread_count, 0) - read, 0)
+        # 一条 UPDATE，与写入消息时的 bump_unread 都是原子增减；已读位置被其他端改过时不覆盖
+        db.session.execute(
+            db.update(RoomMember)
+            .where(RoomMember.id == member.id, db.func.coalesce(RoomMember.last_read_message_id, 0) == last_read)
+            .values(last_read_message_id=message_id, unread_count=unread)
+        )
+        db.session.commit()
+    return member.last_read_message_id or 0, member.unread_count or 0
+
+
+def refresh_last_message(room_id):
+    """删除消息后重新取该群最后一条消息"""
+    last = Message.query.filter(Message.room_id == room_id).order_by(Message.id.desc()).first()
+    db.session.execute(
+        db.update(Room).where(Room.id == room_id)
+        .values(last_message_id=last.id if last else None, last_activity_at=last.timestamp if last else None)
+    )
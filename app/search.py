@@ -0,0 +1,207 @@
+import re
+import time
+from contextlib import contextmanager
+
+from app.extensions import db
+from app.models import Message, RoomMember
+from app.serializers import serialize_messages
+
+# 图片/文件/语音的 content 是 URL，不建索引
+UNINDEXED_TYPES = ('image', 'file', 'audio')
+# trigram 分词要求每个词至少 3 个字符，更短的词用 LIKE 在最近的消息里查
+MIN_TERM_CHARS = 3
+SHORT_SCAN_WINDOW = 50000
+SNIPPET_TOKENS = 16
+# 摘要中的高亮标记，客户端转义后替换成 <mark>
+HIGHLIGHT_START = '\x02'
+HIGHLIGHT_END = '\x03'
+
+_TYPES_SQL = ', '.join(f"'{t}'" for t in UNINDEXED_TYPES)
+# 只处理已经进入索引的行：触发器建好之后写入的，或者已经回填过的
+_INDEXED = ("({row}.id >= (SELECT start_id FROM messages_fts_state) "
+            "OR {row}.id <= (SELECT backfilled_id FROM messages_fts_state))")
+
+SCHEMA = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5("
+    "content, content='messages', content_rowid='id', tokenize='trigram')",
+    "CREATE TABLE IF NOT EXISTS messages_fts_state ("
+    "id INTEGER PRIMARY KEY CHECK (id = 1), start_id INTEGER NOT NULL, backfilled_id INTEGER NOT NULL)",
+]
+
+TRIGGERS = [
+    f"""CREATE TRIGGER IF NOT EXISTS messages_fts_ai AFTER INSERT ON messages
+    WHEN new.msg_type NOT IN ({_TYPES_SQL}) AND {_INDEXED.format(row='new')}
+    BEGIN
+        INSERT INTO messages_fts(rowid, content) VALUES (new.id, new.content);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS messages_fts_ad AFTER DELETE ON messages
+    WHEN old.msg_type NOT IN ({_TYPES_SQL}) AND {_INDEXED.format(row='old')}
+    BEGIN
+        INSERT INTO messages_fts(messages_fts, rowid, content) VALUES ('delete', old.id, old.content);
+    END""",
+    # 同一事件的多个触发器执行顺序不保证，删旧、插新放在一个触发器里
+    f"""CREATE TRIGGER IF NOT EXISTS messages_fts_au AFTER UPDATE OF content, msg_type ON messages
+    BEGIN
+        INSERT INTO messages_fts(messages_fts, rowid, content) SELECT 'delete', old.id, old.content
+        WHERE old.msg_type NOT IN ({_TYPES_SQL}) AND {_INDEXED.format(row='old')};
+        INSERT INTO messages_fts(rowid, content) SELECT new.id, new.content
+        WHERE new.msg_type NOT IN ({_TYPES_SQL}) AND {_INDEXED.format(row='new')};
+    END""",
+]
+
+
+class SearchError(Exception):
+    """搜索参数不合法或索引未建立"""
+
+
+@contextmanager
+def _immediate():
+    """BEGIN IMMEDIATE 写事务：拿到写锁后再读 max(id)，建触发器期间不会漏掉新消息"""
+    raw = db.engine.raw_connection()
+    conn = raw.driver_connection
+    isolation = conn.isolation_level
+    conn.isolation_level = None
+    try:
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            yield conn
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+    finally:
+        conn.isolation_level = isolation
+        raw.close()
+
+
+def ensure_index():
+    """创建 FTS5 表、触发器；触发器生效前的历史消息由 backfill() 补建索引"""
+    with _immediate() as conn:
+        for statement in SCHEMA:
+            conn.execute(statement)
+        if conn.execute('SELECT 1 FROM messages_fts_state').fetchone() is None:
+            max_id = conn.execute('SELECT COALESCE(MAX(id), 0) FROM messages').fetchone()[0]
+            conn.execute('INSERT INTO messages_fts_state (id, start_id, backfilled_id) VALUES (1, ?, 0)', (max_id + 1,))
+        for statement in TRIGGERS:
+            conn.execute(statement)
+
+
+def drop_index():
+    with _immediate() as conn:
+        for name in ('messages_fts_ai', 'messages_fts_ad', 'messages_fts_au'):
+            conn.execute(f'DROP TRIGGER IF EXISTS {name}')
+        conn.execute('DROP TABLE IF EXISTS messages_fts')
+        conn.execute('DROP TABLE IF EXISTS messages_fts_state')
+
+
+def index_state():
+    """返回 {'start_id', 'backfilled_id'}，索引未建立时返回 None"""
+    try:
+        row = db.session.execute(db.text('SELECT start_id, backfilled_id FROM messages_fts_state')).first()
+    except Exception:
+        db.session.rollback()
+        return None
+    return {'start_id': row[0], 'backfilled_id': row[1]} if row else None
+
+
+def backfill(chunk=1000, pause=0.05, progress=None):
+    """按 id 分段给历史消息建索引，每段一个短事务，段之间让出写锁；可中断后重跑"""
+    total = 0
+    while True:
+        with _immediate() as conn:
+            start_id, done = conn.execute('SELECT start_id, backfilled_id FROM messages_fts_state').fetchone()
+            if done >= start_id - 1:
+                return total
+            upper = min(done + chunk, start_id - 1)
+            cursor = conn.execute(
+                f"INSERT INTO messages_fts(rowid, content) SELECT id, content FROM messages "
+                f"WHERE id > ? AND id <= ? AND msg_type NOT IN ({_TYPES_SQL})", (done, upper))
+            total += cursor.rowcount
+            conn.execute('UPDATE messages_fts_state SET backfilled_id = ?', (upper,))
+        if progress:
+            progress(upper, start_id - 1, total)
+        time.sleep(pause)
+
+
+def search_messages(user_id, query, room_id=None, before_id=None, limit=20):
+    """在用户所在的群里搜索消息，按 id 倒序，before_id 翻页
+
+    返回 {'data': [...], 'has_more': bool, 'next_before_id': int|None}，
+    每条结果是 serialize_messages 的格式加上 room_id、完整时间 time 和 snippet。
+    """
+    terms = (query or '').split()
+    if not terms:
+        raise SearchError('请输入搜索内容')
+    room_ids = [r for (r,) in db.session.query(RoomMember.room_id).filter(RoomMember.user_id == user_id)]
+    if room_id is not None:
+        if room_id not in room_ids:
+            raise SearchError('不是该群成员')
+        room_ids = [room_id]
+    if not room_ids:
+        return {'data': [], 'has_more': False, 'next_before_id': None}
+    if index_state() is None:
+        raise SearchError('搜索索引未建立')
+
+    if all(len(term) >= MIN_TERM_CHARS for term in terms):
+        hits, has_more, next_before = _search_fts(terms, room_ids, before_id, limit)
+    else:
+        hits, has_more, next_before = _search_recent(terms, room_ids, before_id, limit)
+
+    messages = {m.id: m for m in Message.query.filter(Message.id.in_([h[0] for h in hits]))}
+    ordered = [messages[msg_id] for msg_id, _ in hits if msg_id in messages]
+    data = serialize_messages(ordered)
+    snippets = dict(hits)
+    for item in data:
+        message = messages[item['id']]
+        item['room_id'] = message.room_id
+        item['time'] = message.timestamp.strftime('%Y-%m-%d %H:%M')
+        item['snippet'] = snippets[item['id']]
+    return {'data': data, 'has_more': has_more, 'next_before_id': next_before}
+
+
+def _search_fts(terms, room_ids, before_id, limit):
+    # 每个词作为一个短语，词之间 AND
+    match = ' AND '.join('"%s"' % term.replace('"', '""') for term in terms)
+    params = {'match': match, 'before': before_id or (1 << 62), 'limit': limit + 1}
+    params.update({f'r{i}': r for i, r in enumerate(room_ids)})
+    rooms_sql = ', '.join(f':r{i}' for i in range(len(room_ids)))
+    rows = db.session.execute(db.text(
+        f"SELECT messages_fts.rowid, snippet(messages_fts, 0, char(2), char(3), '…', {SNIPPET_TOKENS}) "
+        f"FROM messages_fts JOIN messages ON messages.id = messages_fts.rowid "
+        f"WHERE messages_fts MATCH :match AND messages_fts.rowid < :before AND messages.room_id IN ({rooms_sql}) "
+        f"ORDER BY messages_fts.rowid DESC LIMIT :limit"
+    ), params).all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    return [tuple(row) for row in rows], has_more, rows[-1][0] if has_more else None
+
+
+def _search_recent(terms, room_ids, before_id, limit):
+    """短词 (不足 3 个字) 不能走 trigram 索引：每页最多扫描 SHORT_SCAN_WINDOW 条最近的消息"""
+    upper = before_id or (db.session.query(db.func.max(Message.id)).scalar() or 0) + 1
+    lower = max(upper - SHORT_SCAN_WINDOW, 0)
+    query = Message.query.with_entities(Message.id, Message.content).filter(
+        Message.id < upper, Message.id >= lower,
+        Message.room_id.in_(room_ids),
+        Message.msg_type.notin_(UNINDEXED_TYPES))
+    for term in terms:
+        query = query.filter(Message.content.contains(term, autoescape=True))
+    rows = query.order_by(Message.id.desc()).limit(limit + 1).all()
+    if len(rows) > limit:
+        rows = rows[:limit]
+        has_more, next_before = True, rows[-1][0]
+    else:
+        # 本页扫描窗口内已经没有更多结果，下一页从窗口下沿继续
+        has_more, next_before = lower > 0, (lower if lower > 0 else None)
+    return [(msg_id, _snippet(content, terms)) for msg_id, content in rows], has_more, next_before
+
+
+def _snippet(content, terms, width=24):
+    pattern = re.compile('|'.join(re.escape(term) for term in terms), re.IGNORECASE)
+    found = pattern.search(content)
+    if not found:
+        return content[:width * 2]
+    start = max(found.start() - width, 0)
+    end = min(found.end() + width, len(content))
+    text = pattern.sub(lambda m: HIGHLIGHT_START + m.group(0) + HIGHLIGHT_END, content[start:end])
+    return ('…' if start > 0 else '') + text + ('…' if end < len(content) else '')
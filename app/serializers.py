@@ -0,0 +1,113 @@
+import threading
+import time
+from collections import OrderedDict
+
+from app.extensions import db
+from app.models import User, Room
+from app.previews import previews
+
+DEFAULT_AVATAR = '/static/images/default_avatar.svg'
+
+
+class UserCardCache:
+    """用户名片缓存 (id -> 昵称/头像)，给消息列表批量序列化用
+
+    LRU + TTL，未命中的 id 合并成一次 IN 查询。昵称、头像修改或删除用户时
+    经 hub.user_changed() 通知所有 worker 失效；TTL 兜底其他途径的修改。
+    """
+
+    def __init__(self, max_size=5000, ttl=300):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._cards = OrderedDict()
+        self.stats = {'hits': 0, 'misses': 0, 'loads': 0, 'invalidations': 0}
+
+    def init_app(self, app):
+        self.max_size = app.config.get('USER_CARD_CACHE_SIZE', self.max_size)
+        self.ttl = app.config.get('USER_CARD_CACHE_TTL', self.ttl)
+
+    def get_many(self, user_ids):
+        """返回 {user_id: card}；不存在的用户不在结果里"""
+        now = time.monotonic()
+        found = {}
+        missing = []
+        with self._lock:
+            for user_id in user_ids:
+                entry = self._cards.get(user_id)
+                if entry is not None and entry[0] > now:
+                    self._cards.move_to_end(user_id)
+                    found[user_id] = entry[1]
+                else:
+                    missing.append(user_id)
+            self.stats['hits'] += len(found)
+            self.stats['misses'] += len(missing)
+        if not missing:
+            return found
+        rows = db.session.query(User.id, User.username, User.nickname, User.avatar).filter(User.id.in_(missing)).all()
+        expires = now + self.ttl
+        with self._lock:
+            self.stats['loads'] += 1
+            for user_id, username, nickname, avatar in rows:
+                card = {'name': nickname or username, 'avatar': avatar}
+                found[user_id] = card
+                self._cards[user_id] = (expires, card)
+                self._cards.move_to_end(user_id)
+            while len(self._cards) > self.max_size:
+                self._cards.popitem(last=False)
+        return found
+
+    def invalidate(self, user_id=None):
+        with self._lock:
+            if user_id is None:
+                self._cards.clear()
+            else:
+                self._cards.pop(user_id, None)
+            self.stats['invalidations'] += 1
+
+    def snapshot_stats(self):
+        with self._lock:
+            data = dict(self.stats)
+            data['size'] = len(self._cards)
+        data['max_size'] = self.max_size
+        data['ttl'] = self.ttl
+        return data
+
+
+user_cards = UserCardCache()
+
+
+def serialize_messages(messages):
+    """批量序列化消息：用户名片走缓存，群名一次查询，与消息条数无关"""
+    if not messages:
+        return []
+    cards = user_cards.get_many({m.user_id for m in messages if m.user_id is not None})
+    room_ids = {m.room_id for m in messages}
+    room_names = dict(db.session.query(Room.id, Room.name).filter(Room.id.in_(room_ids)).all())
+    return [message_dict(m, cards.get(m.user_id), room_names.get(m.room_id)) for m in messages]
+
+
+def message_dict(message, card, room_name):
+    if card:
+        user_name = card['name']
+        avatar = card['avatar']
+    elif message.msg_type == 'ai':
+        user_name = '趣唠AI'
+        avatar = DEFAULT_AVATAR
+    else:
+        user_name = 'System'
+        avatar = ''
+
+    data = {
+        'id': message.id,
+        'content': message.content,
+        'msg_type': message.msg_type,
+        'timestamp': message.timestamp.strftime('%H:%M'), # 简化时间格式
+        'user': user_name,
+        'avatar': avatar,
+        'room': room_name
+    }
+    if message.msg_type == 'image':
+        # 缩略图/中图 URL (thumb / medium)，由原图路径推出，不查库
+        data.update(previews.urls(message.content))
+    return data
@@ -0,0 +1,329 @@
+"""生产模式服务器 (config.json 中 "mode": "production")
+
+开发模式仍然是 app.run(debug=True)：自动重载 + 调试器，每个连接一个线程且不设上限。
+生产模式使用同一个 Werkzeug WSGI 服务器，但是：
+- 可选 fork 多个 worker 共享一个监听 socket（多 worker 时 /ws 广播自动切到 unix broker）
+- 每个 worker 限制并发连接数，超出直接回 503，不再无限创建线程
+- keep-alive 空闲超时，只作用于等待下一个 HTTP 请求的阶段，不影响 WebSocket 长连接
+- 关闭访问日志、调试器和重载器
+- 收到 SIGTERM 时优雅退出：停止 accept，向 WebSocket 客户端发送 server_restart，
+  等待发送队列和进行中的请求结束，执行 on_shutdown 注册的钩子（如落盘待写入的消息），然后退出
+"""
+import io
+import logging
+import os
+import signal
+import socket
+import sys
+import threading
+import time
+
+from werkzeug.serving import ThreadedWSGIServer, WSGIRequestHandler
+
+DEFAULT_PROFILE = {
+    'workers': 1,  # 进程数，'auto' 为 CPU 核数；snake 游戏房间状态是进程内的，多 worker 时需要粘性会话
+    'max_connections': 1000,  # 每个 worker 的并发连接（=线程）上限，WebSocket 长连接也占一个
+    'backlog': 1024,  # 监听队列长度
+    'keepalive_timeout': 5,  # HTTP keep-alive 空闲秒数
+    'drain_timeout': 10,  # SIGTERM 后最多等待多少秒
+    'reconnect_ms': 1000,  # server_restart 帧建议客户端多久后重连
+    'reconnect_jitter_ms': 4000,  # 随机抖动，避免所有客户端同时重连
+    'access_log': False,
+}
+
+_shutdown_hooks = []
+
+
+def on_shutdown(fn):
+    """注册退出前要执行的钩子（在 app context 中调用）"""
+    _shutdown_hooks.append(fn)
+    return fn
+
+
+def run_shutdown_hooks(app):
+    from app.extensions import db
+
+    with app.app_context():
+        for fn in _shutdown_hooks:
+            try:
+                fn()
+            except Exception as e:
+                print(f"Shutdown hook {fn.__name__} failed: {e}")
+        db.session.remove()
+        db.engine.dispose()
+
+
+def load_profile(config):
+    profile = dict(DEFAULT_PROFILE)
+    profile.update(config.get('production') or {})
+    if profile['workers'] == 'auto':
+        profile['workers'] = os.cpu_count() or 1
+    profile['workers'] = max(1, int(profile['workers']))
+    if profile['workers'] > 1 and not hasattr(os, 'fork'):
+        print("Multiple workers need os.fork(), falling back to 1 worker")
+        profile['workers'] = 1
+    return profile
+
+
+class ChatRequestHandler(WSGIRequestHandler):
+    """在 Werkzeug 的请求处理上加 keep-alive
+
+    Werkzeug 每个响应都带 Connection: close，并在响应后把 socket 里剩下的数据读空
+    （会吞掉下一个请求）。这里只对没有请求体、不是 WebSocket 升级、响应带 Content-Length
+    的请求保持连接（页面、静态文件和大部分 GET 接口），并让这一步读一个空流；其余仍然关闭。
+    """
+
+    def handle_one_request(self):
+        # 等待请求行时使用 keep-alive 超时，空闲连接不会一直占着线程
+        self.connection.settimeout(self.server.profile['keepalive_timeout'])
+        self._chunked = False
+        self.server.idle.add(self.connection)
+        try:
+            super().handle_one_request()
+        finally:
+            self.server.idle.discard(self.connection)
+
+    def parse_request(self):
+        # 请求行已读到，取消超时（WebSocket 升级后由心跳负责回收）
+        self.server.idle.discard(self.connection)
+        self.connection.settimeout(None)
+        if not super().parse_request():
+            return False
+        self._keep_alive = (
+            self.server.profile['keepalive_timeout'] > 0
+            and not self.close_connection
+            and not self.server.draining
+            and not self.headers.get('Content-Length', '0').strip('0')
+            and 'Transfer-Encoding' not in self.headers
+            and 'Upgrade' not in self.headers
+        )
+        return True
+
+    def make_environ(self):
+        environ = super().make_environ()
+        if self._keep_alive:
+            self._saved = (self.connection, self.rfile)
+            self.connection = self.server.eof_fd
+            self.rfile = io.BytesIO()
+        return environ
+
+    def run_wsgi(self):
+        self._saved = None
+        try:
+            super().run_wsgi()
+        finally:
+            if self._saved is not None:
+                self.connection, self.rfile = self._saved
+
+    def send_header(self, keyword, value):
+        if keyword == 'Transfer-Encoding':
+            self._chunked = True
+        elif keyword == 'Connection' and value == 'close' and self._keep_alive and not self._chunked:
+            value = 'keep-alive'
+        super().send_header(keyword, value)
+
+    def log_request(self, code='-', size='-'):
+        if self.server.profile['access_log']:
+            super().log_request(code, size)
+
+    def log_error(self, format, *args):
+        # keep-alive 超时属于正常关闭
+        if format.startswith('Request timed out'):
+            return
+        super().log_error(format, *args)
+
+
+class ChatServer(ThreadedWSGIServer):
+    """带连接上限的多线程 WSGI 服务器"""
+
+    def __init__(self, host, port, app, profile, fd=None):
+        self.profile = profile
+        self.request_queue_size = profile['backlog']
+        self.active = 0
+        self.rejected = 0
+        self.draining = False
+        self.idle = set()  # 正在等待下一个请求的 keep-alive 连接
+        # 一个永远可读且只返回 EOF 的 fd，见 ChatRequestHandler
+        self.eof_fd, write_fd = os.pipe()
+        os.close(write_fd)
+        self._active_lock = threading.Lock()
+        super().__init__(host, port, app, handler=ChatRequestHandler, fd=fd)
+        if fd is not None:
+            # 多个 worker 共享监听 socket 时 select 会同时唤醒所有进程，
+            # 没抢到连接的进程不能阻塞在 accept() 里（否则收不到 shutdown）
+            self.socket.setblocking(False)
+
+    def process_request(self, request, client_address):
+        with self._active_lock:
+            accept = not self.draining and self.active < self.profile['max_connections']
+            if accept:
+                self.active += 1
+            else:
+                self.rejected += 1
+        if not accept:
+            self._reject(request)
+            return
+        try:
+            super().process_request(request, client_address)
+        except Exception:
+            self._release()
+            raise
+
+    def process_request_thread(self, request, client_address):
+        try:
+            super().process_request_thread(request, client_address)
+        finally:
+            self._release()
+
+    def close_idle(self):
+        for sock in list(self.idle):
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+    def _release(self):
+        with self._active_lock:
+            self.active -= 1
+
+    def _reject(self, request):
+        try:
+            request.settimeout(1)
+            request.sendall(b"HTTP/1.1 503 Service Unavailable\r\nRetry-After: 1\r\n"
+                            b"Content-Length: 0\r\nConnection: close\r\n\r\n")
+        except OSError:
+            pass
+        self.shutdown_request(request)
+
+
+def drain(app, server):
+    """停止接收新连接后调用：通知 WebSocket 客户端重连，等待进行中的请求结束"""
+    from app.realtime import registry, hub
+    from app.realtime.frames import Frame
+
+    profile = server.profile
+    server.draining = True
+    deadline = time.monotonic() + profile['drain_timeout']
+    conns = registry.connections()
+    frame = Frame.of({
+        'type': 'server_restart',
+        'reconnect_ms': profile['reconnect_ms'],
+        'jitter_ms': profile['reconnect_jitter_ms'],
+    })
+    for conn in conns:
+        conn.send(frame.data)
+    # 先让写线程把队列里的消息（包括 server_restart）发完再断开
+    while time.monotonic() < deadline and any(len(c.outbox) for c in conns if not c.closed):
+        time.sleep(0.05)
+    for conn in conns:
+        conn.close()
+    server.close_idle()
+    while server.active and time.monotonic() < deadline:
+        time.sleep(0.05)
+    if server.active:
+        print(f"Drain timeout, {server.active} connections still open")
+    run_shutdown_hooks(app)
+    hub.close()
+
+
+def serve(app, host, port, profile, fd=None):
+    """单个 worker：服务直到收到 SIGTERM/SIGINT，然后优雅退出"""
+    server = ChatServer(host, port, app, profile, fd=fd)
+    stopping = threading.Event()
+
+    def on_signal(signum, frame):
+        if not stopping.is_set():
+            stopping.set()
+            # shutdown() 会等待 serve_forever 返回，不能在主线程里直接调用
+            threading.Thread(target=server.shutdown, daemon=True).start()
+
+    signal.signal(signal.SIGTERM, on_signal)
+    signal.signal(signal.SIGINT, on_signal)
+    print(f"Worker {os.getpid()} serving on {host}:{server.port} "
+          f"(max_connections={profile['max_connections']})")
+    server.serve_forever()  # 返回时监听 socket 已关闭
+    drain(app, server)
+    print(f"Worker {os.getpid()} stopped")
+
+
+def run_production(app, host, port, profile):
+    if not profile['access_log']:
+        logging.getLogger('werkzeug').setLevel(logging.WARNING)
+
+    if profile['workers'] == 1:
+        serve(app, host, port, profile)
+        return
+
+    if app.config.get('WS_BROKER') == 'inprocess':
+        # 多个 worker 之间的 /ws 广播需要跨进程总线
+        from app.realtime import hub
+        app.config['WS_BROKER'] = 'unix'
+        hub.init_app(app)
+
+    family = socket.AF_INET6 if ':' in host else socket.AF_INET
+    listener = socket.create_server((host, port), family=family, backlog=profile['backlog'])
+    listener.set_inheritable(True)
+    fd = listener.fileno()
+    children = {}
+    stopping = []
+
+    def spawn(index):
+        pid = os.fork()
+        if pid == 0:
+            code = 0
+            try:
+                _worker_main(app, host, port, profile, fd)
+            except BaseException:
+                import traceback
+                traceback.print_exc()
+                code = 1
+            finally:
+                os._exit(code)
+        children[pid] = index
+
+    def on_signal(signum, frame):
+        if not stopping:
+            stopping.append(time.monotonic())
+            for pid in list(children):
+                _kill(pid, signal.SIGTERM)
+
+    signal.signal(signal.SIGTERM, on_signal)
+    signal.signal(signal.SIGINT, on_signal)
+    print(f"Master {os.getpid()} starting {profile['workers']} workers on {host}:{port}")
+    for i in range(profile['workers']):
+        spawn(i)
+
+    while children:
+        pid, status = os.waitpid(-1, os.WNOHANG)
+        if pid == 0:
+            if stopping and time.monotonic() - stopping[0] > profile['drain_timeout'] + 5:
+                for pid in list(children):
+                    _kill(pid, signal.SIGKILL)
+            time.sleep(0.2)
+            continue
+        index = children.pop(pid, None)
+        if index is not None and not stopping:
+            print(f"Worker {pid} exited with status {status}, restarting")
+            time.sleep(1)
+            spawn(index)
+    listener.close()
+    print("All workers stopped")
+
+
+def _worker_main(app, host, port, profile, fd):
+    from app.extensions import db
+
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    # 不复用父进程连接池里的 SQLite 连接
+    with app.app_context():
+        db.engine.dispose(close=False)
+    sys.stdout.flush()
+    serve(app, host, port, profile, fd=fd)
+
+
+def _kill(pid, sig):
+    try:
+        os.kill(pid, sig)
+    except ProcessLookupError:
+        pass
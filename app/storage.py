@@ -0,0 +1,206 @@
+import hashlib
+import os
+import re
+import tempfile
+from urllib.parse import unquote
+
+from flask import current_app
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from app.archive import attached
+from app.attachments import CHUNK_SIZE, image_size, kind_of, sniff_mime
+from app.extensions import db
+from app.models import Attachment, UploadBlob
+
+URL_PREFIX = '/static/uploads/'
+_EXTENSION = re.compile(r'^\.[a-z0-9]{1,10}$')
+
+
+def upload_dir():
+    return current_app.config['UPLOAD_FOLDER']
+
+
+def blob_path(sha256, filename):
+    """按内容寻址的相对路径：ab/cd/<sha256>.<扩展名>，两级 256 个目录，单个目录不会堆太多文件"""
+    ext = os.path.splitext(filename or '')[1].lower()
+    return f"{sha256[:2]}/{sha256[2:4]}/{sha256}{ext if _EXTENSION.match(ext) else ''}"
+
+
+def url_for_path(path):
+    return URL_PREFIX + path
+
+
+def path_of(url):
+    """URL 对应的相对上传目录的路径"""
+    return url[len(URL_PREFIX):] if url and url.startswith(URL_PREFIX) else None
+
+
+def save_upload(file, original_name, uploader_id, room_id=None, kind=None):
+    """边写临时文件边算 sha256，内容已存在时复用 (引用计数 +1)，返回 Attachment (由调用方提交)
+
+    相同内容只存一份，URL 由内容决定，重复上传得到同一个 URL。
+    """
+    root = upload_dir()
+    tmp_dir = os.path.join(root, 'tmp')
+    os.makedirs(tmp_dir, exist_ok=True)
+    digest = hashlib.sha256()
+    size = 0
+    head = b''
+    fd, tmp_path = tempfile.mkstemp(dir=tmp_dir)
+    try:
+        with os.fdopen(fd, 'wb') as out:
+            while True:
+                chunk = file.stream.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                if not head:
+                    head = chunk[:32]
+                digest.update(chunk)
+                size += len(chunk)
+                out.write(chunk)
+        sha256 = digest.hexdigest()
+        mime = sniff_mime(head, original_name)
+        existing = UploadBlob.query.filter_by(sha256=sha256).first()
+        path = existing.path if existing else blob_path(sha256, original_name)
+        # 先登记 (拿到写锁，持有到调用方提交)，再检查文件是否存在：release 在写锁内确认没有登记才删文件，
+        # 不会在这之后删掉这份内容
+        stmt = sqlite_insert(UploadBlob).values(sha256=sha256, path=path, size=size, mime=mime, ref_count=1)
+        db.session.execute(stmt.on_conflict_do_update(
+            index_elements=['sha256'], set_={'ref_count': UploadBlob.ref_count + 1}))
+        full_path = os.path.join(root, path)
+        if os.path.exists(full_path):
+            os.unlink(tmp_path)
+        else:
+            os.makedirs(os.path.dirname(full_path), exist_ok=True)
+            os.replace(tmp_path, full_path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+
+    width, height = image_size(full_path, mime) if mime.startswith('image/') else (None, None)
+    attachment = Attachment(url=url_for_path(path), original_name=original_name, kind=kind or kind_of(mime),
+                            mime=mime, size=size, sha256=sha256, width=width, height=height,
+                            uploader_id=uploader_id, room_id=room_id)
+    db.session.add(attachment)
+    return attachment
+
+
+def release(attachment):
+    """删除一个附件记录，内容没有其他引用时删除文件 (提交后)"""
+    sha256, url = attachment.sha256, attachment.url
+    db.session.delete(attachment)
+    db.session.execute(db.update(UploadBlob).where(UploadBlob.sha256 == sha256)
+                       .values(ref_count=UploadBlob.ref_count - 1))
+    blob = UploadBlob.query.filter(UploadBlob.sha256 == sha256, UploadBlob.ref_count <= 0).first()
+    path = blob.path if blob else None
+    if blob:
+        db.session.delete(blob)
+    # 旧的平铺文件 (迁移后是指向内容的硬链接)，没有其他附件用这个 URL 时一起删除
+    legacy = _legacy_path(url)
+    if legacy and Attachment.query.filter(Attachment.url == url).count():
+        legacy = None
+    db.session.commit()
+    if path:
+        _remove_unreferenced(sha256, path)
+    if legacy and os.path.exists(os.path.join(upload_dir(), legacy)):
+        os.unlink(os.path.join(upload_dir(), legacy))
+
+
+def _remove_unreferenced(sha256, path):
+    # 在写锁内确认这份内容没有重新登记再删文件：同时上传同样内容的 save_upload 要等写锁才能登记，
+    # 登记后发现文件不在会把自己的临时文件放进去
+    root = upload_dir()
+    directory = os.path.dirname(path)
+    with attached(None) as conn:
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            if conn.execute('SELECT 1 FROM upload_blobs WHERE sha256 = ?', (sha256,)).fetchone() is None \
+                    and os.path.isdir(os.path.join(root, directory)):
+                # 内容文件和它的预览图 (<sha256>.thumb.webp 等) 都以 <sha256>. 开头
+                for name in os.listdir(os.path.join(root, directory)):
+                    if name.startswith(sha256 + '.'):
+                        os.unlink(os.path.join(root, directory, name))
+        finally:
+            conn.execute('ROLLBACK')
+
+
+def _legacy_path(url):
+    if not url or not url.startswith(URL_PREFIX):
+        return None
+    name = unquote(url[len(URL_PREFIX):])
+    return name if '/' not in name and '\\' not in name else None
+
+
+def recount():
+    """按 attachments 重新计算引用数"""
+    db.session.execute(db.update(UploadBlob).values(ref_count=db.select(db.func.count(Attachment.id))
+                                                    .where(Attachment.sha256 == UploadBlob.sha256)
+                                                    .scalar_subquery()))
+    db.session.commit()
+
+
+def dedup_stats():
+    """去重效果：附件总字节数、实际存储字节数、节省的字节数"""
+    blobs, stored, saved = db.session.query(
+        db.func.count(UploadBlob.id),
+        db.func.coalesce(db.func.sum(UploadBlob.size), 0),
+        db.func.coalesce(db.func.sum((UploadBlob.ref_count - 1) * UploadBlob.size), 0),
+    ).filter(UploadBlob.ref_count > 0).one()
+    return {'blobs': blobs, 'stored_bytes': stored, 'saved_bytes': saved, 'logical_bytes': stored + saved}
+
+
+def migrate_legacy(progress=None):
+    """把已登记的旧平铺文件 (时间戳_文件名) 收进内容寻址目录，URL 不变
+
+    平铺文件与内容文件互为硬链接 (同一份数据)；内容已存在时把平铺文件换成指向已有内容的硬链接，
+    重复的文件只占一份空间。不支持硬链接的文件系统上只复制、不去重。返回 (处理的文件数, 节省的字节数)。
+    """
+    root = upload_dir()
+    moved = saved = 0
+    legacy = [a for a in Attachment.query.filter(Attachment.url.like(URL_PREFIX + '%')).order_by(Attachment.id)
+              if _legacy_path(a.url)]
+    for attachment in legacy:
+        flat = os.path.join(root, _legacy_path(attachment.url))
+        if not attachment.sha256 or not os.path.isfile(flat):
+            continue
+        blob = UploadBlob.query.filter_by(sha256=attachment.sha256).first()
+        if blob is None:
+            blob = UploadBlob(sha256=attachment.sha256, path=blob_path(attachment.sha256, attachment.original_name),
+                              size=attachment.size, mime=attachment.mime, ref_count=0)
+            db.session.add(blob)
+            target = os.path.join(root, blob.path)
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            if not os.path.exists(target):
+                _link_or_copy(flat, target)
+        else:
+            target = os.path.join(root, blob.path)
+            if not os.path.exists(target):
+                _link_or_copy(flat, target)
+            elif not os.path.samefile(flat, target) and _relink(target, flat):
+                saved += attachment.size
+        db.session.commit()
+        moved += 1
+        if progress:
+            progress(moved)
+    recount()
+    return moved, saved
+
+
+def _link_or_copy(src, dst):
+    try:
+        os.link(src, dst)
+    except OSError:
+        import shutil
+        shutil.copy2(src, dst)
+
+
+def _relink(target, flat):
+    # 临时名建硬链接再原子替换，替换过程中 URL 始终可读
+    tmp = flat + '.dedup'
+    try:
+        os.link(target, tmp)
+    except OSError:
+        return False
+    os.replace(tmp, flat)
+    return True
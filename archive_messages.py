@@ -0,0 +1,51 @@
+"""消息冷热分层与保留期清理
+
+1. 把超过 MESSAGE_ARCHIVE_AFTER_DAYS 天的消息移到按月的归档库
+   (MESSAGE_ARCHIVE_DIR/messages_YYYY-MM.db)，热库只保留近期消息；
+   聊天记录接口翻到热库之外时按需 ATTACH 对应月份的归档库。
+2. 按群的保留天数 (rooms.retention_days，空则用 MESSAGE_RETENTION_DAYS) 删除过期消息，
+   热库和归档库都会清理。
+
+两步都按批执行，每批一个短事务，批之间暂停让出写锁，服务运行中也可以执行；
+中断后重跑即可继续。建议每天定时运行一次。
+
+用法: python archive_messages.py [--days 180] [--batch 500] [--pause 0.05] [--skip-archive] [--skip-purge]
+"""
+import argparse
+import time
+
+from app import create_app
+from app import archive
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--days', type=int, help='归档多少天前的消息，默认 MESSAGE_ARCHIVE_AFTER_DAYS')
+    parser.add_argument('--batch', type=int, help='每个事务处理的条数，默认 MESSAGE_TIERING_BATCH')
+    parser.add_argument('--pause', type=float, default=0.05, help='每批之间暂停的秒数，让出写锁')
+    parser.add_argument('--skip-archive', action='store_true', help='不做归档，只清理过期消息')
+    parser.add_argument('--skip-purge', action='store_true', help='不清理过期消息，只做归档')
+    args = parser.parse_args()
+
+    app = create_app()
+    with app.app_context():
+        days = app.config['MESSAGE_ARCHIVE_AFTER_DAYS'] if args.days is None else args.days
+        batch = args.batch or app.config['MESSAGE_TIERING_BATCH']
+
+        if not args.skip_archive and days > 0:
+            start = time.monotonic()
+            moved = archive.archive_messages(
+                days, batch=batch, pause=args.pause,
+                progress=lambda n: print(f"\r{n} messages archived", end='', flush=True))
+            print(f"\nArchived {moved} messages older than {days} days in {time.monotonic() - start:.1f}s")
+
+        if not args.skip_purge:
+            start = time.monotonic()
+            purged = archive.purge_expired(
+                app.config['MESSAGE_RETENTION_DAYS'], batch=batch, pause=args.pause,
+                progress=lambda room_id, n: print(f"room {room_id}: {n} expired messages deleted"))
+            print(f"Purged {purged} expired messages in {time.monotonic() - start:.1f}s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,29 @@
+"""把 static/uploads 里已有的文件登记到 attachments 表（只需执行一次，可重复执行）
+
+新上传的文件在 /api/upload、/api/user/avatar 中实时登记；本脚本用于上线 attachments 表之前的文件。
+逐个读取文件计算大小、sha256、MIME 和图片宽高，上传者、群、时间按引用该文件的消息推断，
+头像按 users.avatar。已登记的 URL 跳过，每 200 个提交一次，服务运行中也可以执行。
+
+用法: python backfill_attachments.py
+"""
+import os
+
+from app import create_app
+from app import attachments
+from app.extensions import db
+
+
+def main():
+    app = create_app()
+    with app.app_context():
+        db.create_all()
+        upload_dir = app.config['UPLOAD_FOLDER']
+        if not os.path.isdir(upload_dir):
+            print(f"{upload_dir} does not exist, nothing to backfill.")
+            return
+        added = attachments.backfill(upload_dir, progress=lambda n: print(f"\rregistered {n}", end='', flush=True))
+        print(f"\nRegistered {added} files from {upload_dir}.")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,33 @@
+"""为已有的聊天图片生成缩略图和中图（可重复执行，已生成的跳过）
+
+新上传的图片在 /api/upload 后由后台线程池生成 (app/previews.py)；本脚本补齐上线前的图片、
+排队满时被丢弃的图片，以及修改 PREVIEW_* 尺寸/格式之后的图片 (先删掉旧的 *.thumb.* / *.medium.*)。
+只处理按内容存储的图片，旧的 时间戳_文件名 文件先执行 dedupe_uploads.py。需要安装 Pillow。
+
+用法: python backfill_previews.py
+"""
+from app import create_app
+from app.models import UploadBlob
+from app.previews import previews
+
+
+def main():
+    app = create_app()
+    with app.app_context():
+        if not previews.enabled:
+            print("Pillow is not installed (or PREVIEW_WORKERS = 0), nothing to do.")
+            return
+        done = generated = failed = 0
+        for blob in UploadBlob.query.filter(UploadBlob.mime.like('image/%')).order_by(UploadBlob.id).yield_per(500):
+            try:
+                generated += previews.generate(blob.path)
+            except Exception as e:
+                failed += 1
+                print(f"\n{blob.path}: {e}")
+            done += 1
+            print(f"\rchecked {done}", end='', flush=True)
+        print(f"\nGenerated {generated} previews ({previews.format}), {failed} failed.")
+
+
+if __name__ == '__main__':
+    main()
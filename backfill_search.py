@@ -0,0 +1,34 @@
+"""给已有消息补建全文搜索索引 (messages_fts)
+
+索引建立（update_db.py）之后的新消息由触发器实时写入；之前的历史消息用本脚本按 id
+分段回填。每段一个短事务，段之间暂停，服务运行中也可以执行；中断后重跑会从上次的位置继续。
+
+用法: python backfill_search.py [--chunk 1000] [--pause 0.05]
+"""
+import argparse
+import time
+
+from app import create_app
+from app import search
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--chunk', type=int, default=1000, help='每个事务处理的消息 id 范围')
+    parser.add_argument('--pause', type=float, default=0.05, help='每段之间暂停的秒数，让出写锁')
+    args = parser.parse_args()
+
+    app = create_app()
+    with app.app_context():
+        search.ensure_index()
+        start = time.monotonic()
+
+        def progress(done, target, indexed):
+            print(f"\r{done}/{target} ids, {indexed} rows indexed, {time.monotonic() - start:.1f}s", end='', flush=True)
+
+        indexed = search.backfill(chunk=args.chunk, pause=args.pause, progress=progress)
+        print(f"\nBackfill finished: {indexed} rows indexed in {time.monotonic() - start:.1f}s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,111 @@
+"""后台列表分页基准：OFFSET + COUNT(*) (原 .paginate()) vs keyset 分页 + 总数缓存 (app/listing.py)
+
+在临时数据库里造一个有 --messages 条消息的群（其中每 20 条一个图片），通过后台接口
+/admin/api/room/messages 和 /admin/api/files 测：
+- paginate: 同样的查询直接 .paginate()，即每页 COUNT(*) + OFFSET，逐个深度取一页
+- jump: 没有已知页时直接跳到第 N 页 (SQL OFFSET，文件列表为各 msg_type 的 UNION ALL 归并)
+- keyset: 先取第 N-1 页 (记住排序键)，再测第 N 页 (下一页) 和第 N-1 页 (上一页) 的耗时
+深度越大 paginate 越慢，jump 与 paginate 同一量级 (不取出跳过的行)，keyset 应保持不变。
+
+用法: python bench_admin_pages.py [--messages 2000000] [--limit 20] [--depths 1,100,10000,50000]
+"""
+import argparse
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+
+def seed(path, count):
+    conn = sqlite3.connect(path)
+    conn.execute('BEGIN')
+    start = datetime(2024, 1, 1)
+    batch = []
+    for i in range(1, count + 1):
+        image = i % 20 == 0
+        batch.append((i, f'/static/uploads/{i}.png' if image else f'message {i}', 'image' if image else 'text',
+                      (start + timedelta(seconds=i)).strftime('%Y-%m-%d %H:%M:%S.%f'), 1, 1))
+        if len(batch) == 50000:
+            conn.executemany('INSERT INTO messages (id, content, msg_type, timestamp, user_id, room_id) '
+                             'VALUES (?, ?, ?, ?, ?, ?)', batch)
+            batch = []
+    if batch:
+        conn.executemany('INSERT INTO messages (id, content, msg_type, timestamp, user_id, room_id) '
+                         'VALUES (?, ?, ?, ?, ?, ?)', batch)
+    conn.execute('COMMIT')
+    conn.execute('ANALYZE')
+    conn.close()
+
+
+def timed(fn, repeat=3):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        elapsed = (time.perf_counter() - start) * 1000
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--messages', type=int, default=2000000)
+    parser.add_argument('--limit', type=int, default=20)
+    parser.add_argument('--depths', default='1,100,10000,50000')
+    args = parser.parse_args()
+
+    from app.config import AppConfig
+    tmp = tempfile.mkdtemp(prefix='teamchat-pages-')
+    path = os.path.join(tmp, 'pages.db')
+    AppConfig.SQLALCHEMY_DATABASE_URI = f'sqlite:///{path}'
+    from app import create_app
+    from app.extensions import db
+    from app.models import User, Room, Message
+
+    app = create_app()
+    with app.app_context():
+        db.create_all()
+        db.session.add(Room(name='公共聊天室', code='100000'))
+        user = User(username='u0', nickname='n0', user_code='100')
+        user.set_password('x')
+        db.session.add(user)
+        db.session.commit()
+    start = time.perf_counter()
+    seed(path, args.messages)
+    print(f'seeded {args.messages} messages in {time.perf_counter() - start:.1f}s')
+
+    client = app.test_client()
+    with client.session_transaction() as sess:
+        sess['admin_id'] = 1
+    limit = args.limit
+    files = args.messages // 20
+    print(f"{'list':<14} {'page':>7} {'paginate ms':>12} {'jump ms':>9} {'next ms':>9} {'prev ms':>9}")
+    for name, url, total in (('room messages', '/admin/api/room/messages?room_id=1', args.messages),
+                             ('files', '/admin/api/files?', files)):
+        for depth in (int(d) for d in args.depths.split(',')):
+            if depth * limit > total:
+                continue
+            with app.app_context():
+                if name == 'files':
+                    query = Message.query.filter(Message.msg_type.in_(['image', 'file', 'audio'])).order_by(
+                        Message.timestamp.desc())
+                else:
+                    query = Message.query.filter_by(room_id=1).order_by(Message.timestamp.desc())
+                old = timed(lambda: query.paginate(page=depth, per_page=limit, error_out=False).items)
+            # 每页条数不同，没有已知页，只能从头 OFFSET
+            jump = timed(lambda: client.get(f'{url}&page={depth}&limit={limit + 1}').get_json(), repeat=1)
+            # 记住第 depth-1 页的排序键（跳页本身按 OFFSET，不计时），再测相邻页
+            if depth > 1:
+                client.get(f'{url}&page={depth - 1}&limit={limit}')
+            nxt = timed(lambda: client.get(f'{url}&page={depth}&limit={limit}').get_json())
+            if depth > 2:
+                prev = timed(lambda: client.get(f'{url}&page={depth - 1}&limit={limit}').get_json())
+            else:
+                prev = float('nan')
+            print(f'{name:<14} {depth:>7} {old:>12.1f} {jump:>9.1f} {nxt:>9.1f} {prev:>9.1f}')
+
+
+if __name__ == '__main__':
+    sys.exit(main())
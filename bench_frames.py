@@ -0,0 +1,105 @@
+"""广播序列化开销基准
+
+对比两种扇出方式在不同接收者数量下的耗时：
+- per-recipient: 每个接收者各自 json.dumps 一次（旧的 AI 流式写法的最坏情况）
+- frame: 使用 Frame，整条广播只编码一次
+
+用法: python bench_frames.py [--encoder json|orjson]
+"""
+import argparse
+import json
+import time
+
+from app.realtime import frames
+from app.realtime.frames import Frame, FrameTemplate
+
+
+class StubConnection:
+    """只记录入队内容，不开写线程，避免线程开销干扰测量"""
+
+    def __init__(self):
+        self.last = None
+
+    def send(self, msg, coalesce_key=None):
+        self.last = msg
+        return True
+
+
+def make_payload():
+    return {
+        'type': 'message',
+        'user': '测试用户',
+        'nickname': '测试用户',
+        'avatar': '/static/images/default_avatar.svg',
+        'content': '今天下午三点开会，记得带上周报和测试数据。' * 4,
+        'room_id': 1,
+        'time': '15:00',
+    }
+
+
+def fanout_per_recipient(conns, payload):
+    for c in conns:
+        c.send(json.dumps(payload))
+
+
+def fanout_frame(conns, payload):
+    frame = Frame(payload)
+    for c in conns:
+        c.send(frame.data, frame.coalesce_key)
+
+
+def measure(fn, conns, rounds):
+    payload = make_payload()
+    start = time.perf_counter()
+    for _ in range(rounds):
+        fn(conns, payload)
+    return (time.perf_counter() - start) / rounds * 1e6
+
+
+def measure_encode_only(rounds):
+    payload = make_payload()
+    start = time.perf_counter()
+    for _ in range(rounds):
+        Frame(payload).data
+    return (time.perf_counter() - start) / rounds * 1e6
+
+
+def measure_template(rounds):
+    template = FrameTemplate({'type': 'ai_stream_chunk', 'id': 'ai-msg-1', 'content': '', 'room_id': 1}, 'content')
+    start = time.perf_counter()
+    for _ in range(rounds):
+        template.render('你好').data
+    tpl = (time.perf_counter() - start) / rounds * 1e6
+    start = time.perf_counter()
+    for _ in range(rounds):
+        Frame({'type': 'ai_stream_chunk', 'id': 'ai-msg-1', 'content': '你好', 'room_id': 1}).data
+    full = (time.perf_counter() - start) / rounds * 1e6
+    return tpl, full
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--encoder', default='auto', choices=['auto', 'json', 'orjson'])
+    parser.add_argument('--rounds', type=int, default=200)
+    args = parser.parse_args()
+    frames.configure(args.encoder)
+
+    print(f"encoder: {frames.encoder_name()}")
+    print(f"single encode: {measure_encode_only(args.rounds * 10):.2f} us")
+    print()
+    print(f"{'recipients':>10} | {'per-recipient us':>16} | {'encodes':>7} | {'frame us':>10} | {'encodes':>7}")
+    print('-' * 64)
+    for n in (1, 10, 100, 1000, 5000):
+        conns = [StubConnection() for _ in range(n)]
+        rounds = max(args.rounds * 10 // n, 5)
+        old = measure(fanout_per_recipient, conns, rounds)
+        new = measure(fanout_frame, conns, rounds)
+        print(f"{n:>10} | {old:>16.1f} | {n:>7} | {new:>10.1f} | {1:>7}")
+
+    tpl, full = measure_template(args.rounds * 50)
+    print()
+    print(f"ai_stream_chunk: template render {tpl:.2f} us vs full encode {full:.2f} us")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,254 @@
+"""开发服务器 vs 生产模式 (app/serving.py) 基准
+
+每种配置单独启动一个服务器子进程（临时数据库，不碰 database/quliao.db），
+先打开一批空闲 WebSocket 连接模拟在线用户，再用多个客户端进程通过 keep-alive
+连接压测 GET 请求，输出吞吐和延迟分位数。生产模式额外测一次 SIGTERM 优雅退出：
+所有 WebSocket 客户端是否收到 server_restart、进程多久退出。
+
+配置:
+- dev: app.run(debug=True) 的行为（调试器 + 访问日志），为了只测一个进程关闭了重载器
+- production: serving.run_production，workers=1
+- production-N: workers=N（--workers），多 worker 时 /ws 走 unix broker
+
+用法: python bench_serving.py [--duration 5] [--clients 32] [--idle-ws 200] [--workers 4] [--path /login]
+"""
+import argparse
+import http.client
+import http.cookiejar
+import json
+import multiprocessing
+import os
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.parse
+import urllib.request
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+
+def run_server(mode, port, db_path, workers):
+    """子进程入口"""
+    from app.config import AppConfig
+    AppConfig.SQLALCHEMY_DATABASE_URI = f'sqlite:///{db_path}'
+    AppConfig.WS_BROKER_PATH = os.path.join(os.path.dirname(db_path), 'bus')
+    from app import create_app, serving
+    from app.extensions import db
+    from app.models import User, Room, RoomMember
+
+    app = create_app()
+    with app.app_context():
+        db.create_all()
+        if not Room.query.first():
+            room = Room(name='公共聊天室', code='100000')
+            db.session.add(room)
+            for i in range(50):
+                user = User(username=f'bench{i}', user_code=str(200000 + i), nickname=f'bench{i}')
+                user.set_password('bench')
+                db.session.add(user)
+            db.session.commit()
+            for user in User.query.all():
+                db.session.add(RoomMember(user_id=user.id, room_id=room.id))
+            db.session.commit()
+
+    if mode == 'dev':
+        app.run(host='127.0.0.1', port=port, debug=True, use_reloader=False)
+    else:
+        profile = serving.load_profile({'production': {'workers': workers, 'drain_timeout': 10}})
+        serving.run_production(app, '127.0.0.1', port, profile)
+
+
+def wait_port(port, timeout=15):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=0.5).close()
+            return True
+        except OSError:
+            time.sleep(0.1)
+    return False
+
+
+def login_cookie(port, username):
+    jar = http.cookiejar.CookieJar()
+    opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(jar))
+    data = urllib.parse.urlencode({'nickname': username, 'password': 'bench'}).encode()
+    opener.open(f'http://127.0.0.1:{port}/login', data, timeout=10).read()
+    return '; '.join(f'{c.name}={c.value}' for c in jar)
+
+
+def open_websockets(port, count):
+    import simple_websocket
+
+    clients = []
+    for i in range(count):
+        cookie = login_cookie(port, f'bench{i % 50}')
+        ws = simple_websocket.Client.connect(f'ws://127.0.0.1:{port}/ws', headers={'Cookie': cookie})
+        ws.send(json.dumps({'type': 'join'}))
+        clients.append(ws)
+    return clients
+
+
+def client_worker(port, path, threads, duration, out):
+    """一个压测进程：threads 个线程各自持有一个 keep-alive 连接"""
+    latencies = []
+    errors = [0]
+    lock = threading.Lock()
+    stop_at = time.perf_counter() + duration
+
+    def loop():
+        local, errs = [], 0
+        conn = http.client.HTTPConnection('127.0.0.1', port, timeout=10)
+        while time.perf_counter() < stop_at:
+            start = time.perf_counter()
+            try:
+                conn.request('GET', path, headers={'Accept-Encoding': 'gzip'})
+                resp = conn.getresponse()
+                resp.read()
+                if resp.status != 200:
+                    errs += 1
+                if resp.getheader('Connection', '').lower() == 'close':
+                    conn.close()
+                    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=10)
+            except (OSError, http.client.HTTPException):
+                errs += 1
+                conn.close()
+                conn = http.client.HTTPConnection('127.0.0.1', port, timeout=10)
+                continue
+            local.append(time.perf_counter() - start)
+        conn.close()
+        with lock:
+            latencies.extend(local)
+            errors[0] += errs
+
+    ts = [threading.Thread(target=loop) for _ in range(threads)]
+    for t in ts:
+        t.start()
+    for t in ts:
+        t.join()
+    out.put((latencies, errors[0]))
+
+
+def load_test(port, path, clients, duration):
+    procs_n = min(clients, os.cpu_count() or 1, 8)
+    per_proc = max(1, clients // procs_n)
+    out = multiprocessing.Queue()
+    procs = [multiprocessing.Process(target=client_worker, args=(port, path, per_proc, duration, out))
+             for _ in range(procs_n)]
+    for p in procs:
+        p.start()
+    latencies, errors = [], 0
+    for _ in procs:
+        lat, err = out.get()
+        latencies.extend(lat)
+        errors += err
+    for p in procs:
+        p.join()
+    latencies.sort()
+
+    def pct(q):
+        if not latencies:
+            return 0
+        return latencies[min(len(latencies) - 1, int(len(latencies) * q))] * 1000
+
+    return {
+        'requests': len(latencies),
+        'rps': len(latencies) / duration,
+        'p50': pct(0.50),
+        'p99': pct(0.99),
+        'errors': errors,
+    }
+
+
+def drain_test(proc, ws_clients):
+    """发送 SIGTERM，统计收到 server_restart 的客户端数和进程退出耗时"""
+    got = [0]
+    lock = threading.Lock()
+
+    def watch(ws):
+        try:
+            while True:
+                msg = ws.receive(timeout=15)
+                if msg is None:
+                    return
+                if json.loads(msg).get('type') == 'server_restart':
+                    with lock:
+                        got[0] += 1
+                    return
+        except Exception:
+            return
+
+    ts = [threading.Thread(target=watch, args=(ws,), daemon=True) for ws in ws_clients]
+    for t in ts:
+        t.start()
+    start = time.perf_counter()
+    proc.send_signal(signal.SIGTERM)
+    try:
+        proc.wait(timeout=30)
+    except subprocess.TimeoutExpired:
+        proc.kill()
+    elapsed = time.perf_counter() - start
+    for t in ts:
+        t.join(timeout=5)
+    return got[0], elapsed
+
+
+def bench(name, mode, workers, args, port):
+    tmp = tempfile.mkdtemp(prefix='teamchat-bench-')
+    db_path = os.path.join(tmp, 'bench.db')
+    proc = subprocess.Popen(
+        [sys.executable, __file__, '--serve', mode, '--port', str(port), '--db', db_path, '--workers', str(workers)],
+        cwd=ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        if not wait_port(port):
+            print(f"{name}: server did not start")
+            return
+        time.sleep(0.5 if workers == 1 else 1.5)
+        ws_clients = open_websockets(port, args.idle_ws)
+        load_test(port, args.path, args.clients, 1)  # 预热
+        result = load_test(port, args.path, args.clients, args.duration)
+        line = (f"{name:<16} {result['rps']:>9.0f} {result['p50']:>9.2f} {result['p99']:>9.2f} "
+                f"{result['errors']:>7}")
+        if mode == 'production':
+            got, elapsed = drain_test(proc, ws_clients)
+            line += f"   {got}/{len(ws_clients)} server_restart, exit in {elapsed:.2f}s"
+        else:
+            for ws in ws_clients:
+                ws.close()
+        print(line)
+    finally:
+        if proc.poll() is None:
+            proc.kill()
+            proc.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--serve', choices=['dev', 'production'], help=argparse.SUPPRESS)
+    parser.add_argument('--db', help=argparse.SUPPRESS)
+    parser.add_argument('--port', type=int, default=5090)
+    parser.add_argument('--duration', type=float, default=5)
+    parser.add_argument('--clients', type=int, default=32, help='并发 keep-alive 连接数')
+    parser.add_argument('--idle-ws', type=int, default=200, help='压测期间保持的空闲 WebSocket 连接数')
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--path', default='/login')
+    args = parser.parse_args()
+
+    if args.serve:
+        run_server(args.serve, args.port, args.db, args.workers)
+        return
+
+    print(f"GET {args.path}, {args.clients} clients, {args.idle_ws} idle websockets, {args.duration}s")
+    print(f"{'server':<16} {'req/s':>9} {'p50 ms':>9} {'p99 ms':>9} {'errors':>7}")
+    bench('dev', 'dev', 1, args, args.port)
+    bench('production', 'production', 1, args, args.port + 1)
+    if args.workers > 1:
+        bench(f'production-{args.workers}', 'production', args.workers, args, args.port + 2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,98 @@
+"""消息列表 SQL 次数回归检查
+
+在临时数据库里造 300 个用户、3 个群、3000 条消息（含 AI/系统消息），分别用不同的
+每页条数请求聊天记录和后台消息/文件列表，统计每个请求执行的 SQL 条数。
+每页条数从 10 增加到 200，SQL 条数必须保持不变（不能随消息条数增长，即没有 N+1）。
+
+用法: python check_message_sql.py
+"""
+import os
+import sys
+import tempfile
+from datetime import datetime, timedelta
+
+from sqlalchemy import event
+
+PAGE_SIZES = (10, 50, 200)
+
+
+def main():
+    from app.config import AppConfig
+    tmp = tempfile.mkdtemp(prefix='teamchat-sql-')
+    AppConfig.SQLALCHEMY_DATABASE_URI = f"sqlite:///{os.path.join(tmp, 'sql.db')}"
+    from app import create_app
+    from app.extensions import db
+    from app.models import User, Room, RoomMember, Message
+    from app.serializers import user_cards
+    from app.listing import count_cache
+
+    app = create_app()
+    with app.app_context():
+        db.create_all()
+        for i in range(3):
+            db.session.add(Room(name=f'room{i}', code=str(200000 + i)))
+        for i in range(300):
+            user = User(username=f'user{i}', user_code=str(100000 + i), nickname=f'用户{i}')
+            user.password_hash = 'x'
+            db.session.add(user)
+        db.session.commit()
+        db.session.add(RoomMember(user_id=1, room_id=1))
+        start = datetime(2024, 1, 1)
+        rows = []
+        for i in range(3000):
+            kind = i % 10
+            rows.append({
+                'content': f'/static/uploads/{i}.png' if kind == 1 else f'msg {i}',
+                'msg_type': 'image' if kind == 1 else ('ai' if kind == 2 else 'message'),
+                'user_id': None if kind == 2 else i % 300 + 1,
+                'room_id': i % 3 + 1,
+                'timestamp': start + timedelta(seconds=i),
+            })
+        db.session.execute(db.insert(Message), rows)
+        db.session.commit()
+
+        statements = []
+        # 后台接口走只读引擎，所有引擎都要记录
+        for engine in db.engines.values():
+            event.listen(engine, 'before_cursor_execute',
+                         lambda conn, cursor, statement, *args: statements.append(statement))
+
+    client = app.test_client()
+    with client.session_transaction() as sess:
+        sess['user_id'] = 1
+        sess['admin_id'] = 1
+
+    endpoints = {
+        'history': lambda n: f'/api/room/1/messages?limit={n}',
+        'admin_room': lambda n: f'/admin/api/room/messages?room_id=1&limit={n}',
+        'admin_files': lambda n: f'/admin/api/files?limit={n}',
+    }
+    ok = True
+    print(f"{'endpoint':<12} {'cache':<6} " + ' '.join(f'{n:>6}' for n in PAGE_SIZES))
+    for name, url in endpoints.items():
+        for cache in ('cold', 'warm'):
+            counts = []
+            for n in PAGE_SIZES:
+                if cache == 'cold':
+                    user_cards.invalidate()
+                    count_cache.clear()
+                else:
+                    client.get(url(n))
+                statements.clear()
+                resp = client.get(url(n))
+                data = resp.get_json()
+                rows = data['data']
+                if resp.status_code != 200 or len(rows) != min(n, 1000):
+                    print(f"FAIL: {name} limit={n} returned {resp.status_code} with {len(rows)} rows")
+                    ok = False
+                counts.append(len(statements))
+            print(f"{name:<12} {cache:<6} " + ' '.join(f'{c:>6}' for c in counts))
+            if len(set(counts)) != 1:
+                print(f"FAIL: {name} ({cache}) SQL count grows with page size")
+                ok = False
+    print(user_cards.snapshot_stats())
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,138 @@
+"""消息写入崩溃一致性检查 (MESSAGE_DURABILITY = sync / group / async)
+
+对每种模式启动一个子进程（临时数据库），多个线程不停地通过 persister.submit()
+写消息，submit 返回（即原本要广播的时刻）就把消息 id 写到 stdout。父进程在随机时刻
+用 SIGKILL 杀掉子进程，然后对比“已广播的 id”和数据库里实际保存的 id：
+
+- lost: 已广播但没有保存（客户端看到了，刷新后消失）
+- unacked: 已保存但还没来得及广播（发送方会以为没发出去）
+
+预期：sync / group 的 lost 必须为 0；async 的 lost 不超过崩溃时的队列深度加上正在提交的一批，
+即最多 MESSAGE_QUEUE_MAX + MESSAGE_FLUSH_ROWS 条。这里的写入线程不限速，队列总是满的，
+所以 async 会接近这个上限；正常聊天速率下队列里只有最近 MESSAGE_FLUSH_MS 毫秒内的消息。
+SIGKILL 模拟的是进程崩溃；已提交的事务在操作系统页缓存里，不会丢。断电场景还取决于
+SQLite 的 synchronous 设置，这里测不到。
+
+用法: python check_persister_crash.py [--rounds 5] [--threads 4]
+"""
+import argparse
+import os
+import random
+import signal
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+
+def run_child(mode, db_path, threads):
+    from app.config import AppConfig
+    AppConfig.SQLALCHEMY_DATABASE_URI = f'sqlite:///{db_path}'
+    AppConfig.MESSAGE_DURABILITY = mode
+    from app import create_app
+    from app.extensions import db
+    from app.models import User, Room
+    from app.realtime import persister
+
+    app = create_app()
+    with app.app_context():
+        db.create_all()
+        db.session.add(Room(name='公共聊天室', code='100000'))
+        user = User(username='crash', user_code='100001', nickname='crash')
+        user.set_password('x')
+        db.session.add(user)
+        db.session.commit()
+
+    os.write(1, b'ready\n')
+
+    def writer(k):
+        i = 0
+        while True:
+            msg_id = persister.submit(content=f'{k}-{i}', msg_type='message', user_id=1, room_id=1)
+            # 广播点：stdout 不经过 Python 缓冲，被 SIGKILL 时已写出的内容不会丢
+            os.write(1, f'{msg_id}\n'.encode())
+            i += 1
+
+    for k in range(threads):
+        threading.Thread(target=writer, args=(k,), daemon=True).start()
+    while True:
+        time.sleep(1)
+
+
+def one_round(mode, threads):
+    tmp = tempfile.mkdtemp(prefix='teamchat-crash-')
+    db_path = os.path.join(tmp, 'crash.db')
+    proc = subprocess.Popen(
+        [sys.executable, __file__, '--child', mode, '--db', db_path, '--threads', str(threads)],
+        cwd=ROOT, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+    broadcast = set()
+    lines = []
+
+    def reader():
+        for line in proc.stdout:
+            lines.append(line)
+
+    t = threading.Thread(target=reader, daemon=True)
+    t.start()
+    while not lines:
+        if proc.poll() is not None:
+            raise RuntimeError(f'{mode}: child exited before ready')
+        time.sleep(0.05)
+    time.sleep(random.uniform(0.3, 1.5))
+    proc.send_signal(signal.SIGKILL)
+    proc.wait()
+    t.join()
+    for line in lines[1:]:
+        line = line.strip()
+        if line.isdigit():
+            broadcast.add(int(line))
+
+    conn = sqlite3.connect(db_path)
+    saved = {row[0] for row in conn.execute('SELECT id FROM messages')}
+    conn.close()
+    return {
+        'broadcast': len(broadcast),
+        'saved': len(saved),
+        'lost': len(broadcast - saved),
+        'unacked': len(saved - broadcast),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--child', choices=['sync', 'group', 'async'], help=argparse.SUPPRESS)
+    parser.add_argument('--db', help=argparse.SUPPRESS)
+    parser.add_argument('--rounds', type=int, default=5)
+    parser.add_argument('--threads', type=int, default=4)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(args.child, args.db, args.threads)
+        return
+
+    from app.config import AppConfig
+    async_bound = AppConfig.MESSAGE_QUEUE_MAX + AppConfig.MESSAGE_FLUSH_ROWS
+    ok = True
+    print(f"{'mode':<6} {'round':>5} {'broadcast':>10} {'saved':>8} {'lost':>6} {'unacked':>8}")
+    for mode in ('sync', 'group', 'async'):
+        worst = 0
+        for i in range(args.rounds):
+            r = one_round(mode, args.threads)
+            worst = max(worst, r['lost'])
+            print(f"{mode:<6} {i + 1:>5} {r['broadcast']:>10} {r['saved']:>8} {r['lost']:>6} {r['unacked']:>8}")
+        if mode != 'async' and worst:
+            print(f"FAIL: {mode} lost {worst} broadcast messages")
+            ok = False
+        if mode == 'async' and worst > async_bound:
+            print(f"FAIL: async lost {worst} broadcast messages, more than {async_bound}")
+            ok = False
+        print(f"{mode}: max lost after broadcast = {worst}")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,201 @@
+"""热点查询执行计划检查 (EXPLAIN QUERY PLAN)
+
+在临时数据库里造一批用户、群、好友关系和消息并 ANALYZE，然后：
+- 用 test client 请求聊天/好友/后台消息列表等热点接口，记录每条执行的 SQL
+- 直接执行 /ws、群成员缓存、消息写入等不经过 HTTP 的查询
+
+对记录到的每条 SELECT 执行 EXPLAIN QUERY PLAN，出现不走索引的全表扫描
+（"SCAN <table>" 且没有 "USING ... INDEX"）就报告并以退出码 1 结束。
+新增热点查询时把对应的接口加到 HTTP_CHECKS，或把语句加到 direct_checks()。
+
+用法: python check_query_plans.py [-v]
+"""
+import os
+import re
+import sys
+import tempfile
+from datetime import datetime, timedelta
+
+from sqlalchemy import event
+
+USERS = 2000
+ROOMS = 50
+MESSAGES = 30000
+FRIENDSHIPS = 6000
+
+# (说明, method, url, json)
+HTTP_CHECKS = [
+    ('login', 'POST', '/login', None),
+    ('room list', 'GET', '/api/rooms', None),
+    ('read ack', 'POST', '/api/room/1/read', {'message_id': 20000}),
+    ('friend list', 'GET', '/api/friends', None),
+    ('friend requests', 'GET', '/api/friend/requests', None),
+    ('send friend request', 'POST', '/api/friend/request', {'user_code': '101999'}),
+    ('join group', 'POST', '/api/group/join', {'code': '200049'}),
+    ('history latest', 'GET', '/api/room/1/messages', None),
+    ('history older', 'GET', '/api/room/1/messages?before_id=5000', None),
+    ('history newer', 'GET', '/api/room/1/messages?after_id=5000', None),
+    ('search', 'GET', '/api/search/messages?q=msg%20123', None),
+    ('search short term', 'GET', '/api/search/messages?q=12&room_id=1', None),
+    ('admin users', 'GET', '/admin/api/users', None),
+    ('admin users next page', 'GET', '/admin/api/users?page=2', None),
+    ('admin rooms', 'GET', '/admin/api/rooms', None),
+    ('admin rooms next page', 'GET', '/admin/api/rooms?page=2', None),
+    ('admin dashboard', 'GET', '/admin/api/dashboard/data', None),
+    ('admin flags', 'GET', '/admin/api/moderation/flags?before_id=100', None),
+    ('admin flags by room', 'GET', '/admin/api/moderation/flags?room_id=1&before_id=100', None),
+    ('admin room messages', 'GET', '/admin/api/room/messages?room_id=1', None),
+    ('admin room messages next page', 'GET', '/admin/api/room/messages?room_id=1&page=2', None),
+    ('admin room messages prev page', 'GET', '/admin/api/room/messages?room_id=1&page=1&before=29000', None),
+    ('admin room messages cursor', 'GET', '/admin/api/room/messages?room_id=1&after=5000', None),
+    ('admin files', 'GET', '/admin/api/files', None),
+    ('admin files next page', 'GET', '/admin/api/files?page=2', None),
+    ('admin attachments', 'GET', '/admin/api/attachments?kind=image', None),
+    ('admin attachments by user', 'GET', '/admin/api/attachments?user_id=1', None),
+    ('admin storage by user', 'GET', '/admin/api/attachments/usage?group=user', None),
+    ('admin storage by room', 'GET', '/admin/api/attachments/usage?group=room', None),
+    ('snake leaderboard', 'GET', '/game/api/snake/leaderboard', None),
+]
+
+
+def direct_checks(db, models):
+    """与路由/实时模块中一致的、不经过 HTTP 的查询"""
+    User, Room, RoomMember, Message = models
+    from app.models import MessageArchive, Attachment, UploadBlob
+    return [
+        ('ws join by nickname', User.query.filter((User.nickname == 'nick7') | (User.username == 'nick7'))),
+        ('public room lookup', Room.query.filter_by(name='公共聊天室')),
+        ('room member cache', RoomMember.query.with_entities(RoomMember.user_id).filter_by(room_id=1)),
+        ('user room cache', RoomMember.query.with_entities(RoomMember.room_id).filter_by(user_id=1)),
+        ('membership check', RoomMember.query.filter_by(user_id=1, room_id=1)),
+        ('message max id', db.session.query(db.func.max(Message.id))),
+        ('user cards', db.session.query(User.id, User.username, User.nickname, User.avatar).filter(User.id.in_([1, 2, 3]))),
+        ('room names', db.session.query(Room.id, Room.name).filter(Room.id.in_([1, 2]))),
+        ('archive lookup', MessageArchive.query.filter(MessageArchive.room_id == 1, MessageArchive.min_id < 100)
+            .order_by(MessageArchive.max_id.desc())),
+        ('upload blob by hash', UploadBlob.query.filter_by(sha256='0' * 64)),
+        ('attachment by url', Attachment.query.filter_by(url='/static/uploads/1.png', room_id=1).order_by(Attachment.id)),
+        ('attachment url refs', db.session.query(db.func.count(Attachment.id)).filter(Attachment.url == '/static/uploads/1.png')),
+    ]
+
+
+# 虚拟表 (FTS5) 的 "VIRTUAL TABLE INDEX" 是 MATCH 查询，不算全表扫描
+FULL_SCAN = re.compile(r'^SCAN (?!CONSTANT ROW)(\S+)(?!.*USING .*INDEX)(?!.*VIRTUAL TABLE INDEX)')
+# 只有几行的状态/计数表，扫描无妨
+SMALL_TABLES = {'messages_fts_state', 'stat_counters'}
+
+
+def rowid_limit_scan(table, plan, statement):
+    # 按主键倒序取前 N 行 (最新一页) 是从表尾开始读，读够就停，不算全表扫描
+    return (not any('USE TEMP B-TREE' in line for line in plan)
+            and re.search(rf'ORDER BY {table}\.id DESC\s+LIMIT', statement) is not None)
+
+
+def seed(db, models):
+    User, Room, RoomMember, Message = models
+    from app.models import Friendship, Admin
+
+    now = datetime(2024, 6, 1)
+    db.session.execute(db.insert(User), [{
+        'username': f'user{i}', 'nickname': f'nick{i}', 'user_code': str(100000 + i),
+        'password_hash': 'x', 'is_banned': False, 'created_at': now - timedelta(minutes=i),
+    } for i in range(USERS)])
+    db.session.execute(db.insert(Room), [{
+        'name': '公共聊天室' if i == 0 else f'room{i}', 'code': str(200000 + i),
+        'created_at': now, 'is_banned': False,
+    } for i in range(ROOMS)])
+    db.session.execute(db.insert(RoomMember), [
+        {'user_id': u, 'room_id': r, 'joined_at': now}
+        for u in range(1, USERS + 1) for r in {1, u % ROOMS + 1}
+    ])
+    db.session.execute(db.insert(Friendship), [{
+        'user_id': i % USERS + 1, 'friend_id': (i * 7 + 3) % USERS + 1,
+        'status': 'accepted' if i % 3 else 'pending', 'created_at': now,
+    } for i in range(FRIENDSHIPS)])
+    db.session.execute(db.insert(Message), [{
+        'content': f'/static/uploads/{i}.png' if i % 20 == 0 else f'msg {i}',
+        'msg_type': 'image' if i % 20 == 0 else 'message',
+        'user_id': i % USERS + 1, 'room_id': i % ROOMS + 1,
+        'timestamp': now + timedelta(seconds=i),
+    } for i in range(MESSAGES)])
+    admin = Admin(username='admin')
+    admin.set_password('x')
+    db.session.add(admin)
+    user = db.session.get(User, 1)
+    user.set_password('x')
+    db.session.commit()
+    db.session.execute(db.text('ANALYZE'))
+    db.session.commit()
+
+
+def explain(db, statement, params):
+    rows = db.session.connection().exec_driver_sql('EXPLAIN QUERY PLAN ' + statement, params).fetchall()
+    return [row[-1] for row in rows]
+
+
+def main():
+    verbose = '-v' in sys.argv
+    from app.config import AppConfig
+    tmp = tempfile.mkdtemp(prefix='teamchat-plan-')
+    AppConfig.SQLALCHEMY_DATABASE_URI = f"sqlite:///{os.path.join(tmp, 'plan.db')}"
+    from app import create_app
+    from app.extensions import db
+    from app.models import User, Room, RoomMember, Message
+    from app import search, rollups
+    models = (User, Room, RoomMember, Message)
+
+    app = create_app()
+    checks = []
+    failures = 0
+    with app.app_context():
+        db.create_all()
+        search.ensure_index()
+        seed(db, models)
+        rollups.ensure_counters()
+
+        captured = []
+        # 后台接口走只读引擎，所有引擎都要记录
+        for engine in db.engines.values():
+            event.listen(engine, 'before_cursor_execute',
+                         lambda conn, cursor, statement, params, *args: captured.append((statement, params)))
+
+        client = app.test_client()
+        with client.session_transaction() as sess:
+            sess['user_id'] = 1
+            sess['admin_id'] = 1
+        for label, method, url, body in HTTP_CHECKS:
+            captured.clear()
+            if url == '/login':
+                resp = client.post(url, data={'nickname': 'user0', 'password': 'x'})
+            else:
+                resp = client.open(url, method=method, json=body)
+            if resp.status_code >= 400:
+                print(f"FAIL  {label}: HTTP {resp.status_code}")
+                failures += 1
+            for statement, params in list(captured):
+                if statement.lstrip().upper().startswith('SELECT'):
+                    checks.append((label, statement, params))
+
+        for label, query in direct_checks(db, models):
+            captured.clear()
+            query.all()
+            for statement, params in list(captured):
+                checks.append((label, statement, params))
+
+        for label, statement, params in checks:
+            plan = explain(db, statement, params)
+            scans = [line for line in plan
+                     if FULL_SCAN.match(line) and FULL_SCAN.match(line).group(1) not in SMALL_TABLES
+                     and not rowid_limit_scan(FULL_SCAN.match(line).group(1), plan, statement)]
+            if scans:
+                failures += 1
+                print(f"FAIL  {label}: {' | '.join(scans)}")
+                print(f"      {' '.join(statement.split())[:200]}")
+            elif verbose:
+                print(f"ok    {label}: {' | '.join(plan)}")
+        print(f"{len(checks)} statements checked, {failures} failures")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
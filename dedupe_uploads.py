@@ -0,0 +1,42 @@
+"""把 static/uploads 里的旧文件 (时间戳_文件名) 收进按内容存储的目录并去重（可重复执行）
+
+新上传的文件由 /api/upload、/api/user/avatar 直接按 sha256 存到 ab/cd/<sha256>.<扩展名> (app/storage.py)。
+本脚本先登记还没进 attachments 的文件 (同 backfill_attachments.py)，再逐个把旧文件硬链接到内容目录：
+内容重复的旧文件换成指向同一份内容的硬链接，原 URL 不变，消息和头像不用改。最后按 attachments 重算引用数。
+先执行 update_db.py 建表。
+
+用法: python dedupe_uploads.py
+"""
+import os
+
+from app import create_app
+from app import attachments, storage
+from app.extensions import db
+
+
+def format_size(size):
+    for unit in ('B', 'KB', 'MB', 'GB'):
+        if size < 1024 or unit == 'GB':
+            return f'{size:.0f} {unit}' if unit == 'B' else f'{size:.1f} {unit}'
+        size /= 1024
+
+
+def main():
+    app = create_app()
+    with app.app_context():
+        db.create_all()
+        upload_dir = app.config['UPLOAD_FOLDER']
+        if not os.path.isdir(upload_dir):
+            print(f"{upload_dir} does not exist, nothing to do.")
+            return
+        added = attachments.backfill(upload_dir)
+        print(f"Registered {added} new files.")
+        moved, saved = storage.migrate_legacy(progress=lambda n: print(f"\rmigrated {n}", end='', flush=True))
+        print(f"\nMigrated {moved} files, freed {format_size(saved)} by linking duplicates.")
+        stats = storage.dedup_stats()
+        print(f"{stats['blobs']} unique blobs, stored {format_size(stats['stored_bytes'])}, "
+              f"saved {format_size(stats['saved_bytes'])} of {format_size(stats['logical_bytes'])}.")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,12 +1,16 @@
 from app import create_app
 from app.extensions import db
 from app.models import User, Room
+from app import search, rollups
 
 app = create_app()
 
 with app.app_context():
+    search.drop_index()
     db.drop_all() # 重置数据库以应用模型更改
     db.create_all()
+    search.ensure_index()
+    rollups.ensure_counters()
     # Create default room if not exists
     if not Room.query.filter_by(name='公共聊天室').first():
         default_room = Room(name='公共聊天室', code='100000')
@@ -1,6 +1,8 @@
+import argparse
 import json
 import os
 from app import create_app
+from app import serving
 
 
 app = create_app()
@@ -8,7 +10,7 @@ app = create_app()
 
 def load_config():
     config_path = os.path.join(os.path.dirname(__file__), 'config.json')
-    default_config = {"host": "0.0.0.0", "port": 5000, "debug": True}
+    default_config = {"host": "0.0.0.0", "port": 5000, "debug": True, "mode": "dev"}
     
     if os.path.exists(config_path):
         try:
@@ -21,10 +23,23 @@ def load_config():
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--mode", choices=["dev", "production"], help="覆盖 config.json 中的 mode")
+    args = parser.parse_args()
+
     config = load_config()
-    print(f"Starting server with config: {config}")
-    app.run(
-        host=config.get("host", "0.0.0.0"), 
-        port=config.get("port", 5000), 
-        debug=config.get("debug", True)
-    )
+    mode = args.mode or config.get("mode", "dev")
+    print(f"Starting server ({mode}) with config: {config}")
+    if mode == "production":
+        serving.run_production(
+            app,
+            config.get("host", "0.0.0.0"),
+            config.get("port", 5000),
+            serving.load_profile(config)
+        )
+    else:
+        app.run(
+            host=config.get("host", "0.0.0.0"), 
+            port=config.get("port", 5000), 
+            debug=config.get("debug", True)
+        )
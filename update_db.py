@@ -1,6 +1,7 @@
 from app import create_app
 from app.extensions import db
-from app.models import User, Admin
+from app.models import User, Admin, Attachment
+from app import search, rollups
 import sqlite3
 
 app = create_app()
@@ -25,6 +26,44 @@ with app.app_context():
         except Exception as e:
             print(f"Column is_banned for rooms might already exist: {e}")
 
+        # 未读数：已有成员从当前最新消息开始计，不把历史消息算作未读
+        try:
+            conn.execute(db.text("ALTER TABLE room_members ADD COLUMN last_read_message_id INTEGER DEFAULT 0"))
+            conn.execute(db.text("ALTER TABLE room_members ADD COLUMN unread_count INTEGER DEFAULT 0"))
+            conn.execute(db.text(
+                "UPDATE room_members SET last_read_message_id = "
+                "(SELECT COALESCE(MAX(id), 0) FROM messages WHERE messages.room_id = room_members.room_id)"
+            ))
+            conn.commit()
+            print("Added unread columns to room_members table.")
+        except Exception as e:
+            print(f"Unread columns for room_members might already exist: {e}")
+
+        # 侧边栏：群的最后一条消息和活跃时间，从已有消息回填
+        try:
+            conn.execute(db.text("ALTER TABLE rooms ADD COLUMN last_message_id INTEGER"))
+            conn.execute(db.text("ALTER TABLE rooms ADD COLUMN last_activity_at DATETIME"))
+            conn.execute(db.text(
+                "UPDATE rooms SET last_message_id = "
+                "(SELECT MAX(id) FROM messages WHERE messages.room_id = rooms.id)"
+            ))
+            conn.execute(db.text(
+                "UPDATE rooms SET last_activity_at = "
+                "(SELECT timestamp FROM messages WHERE messages.id = rooms.last_message_id)"
+            ))
+            conn.commit()
+            print("Added last message columns to rooms table.")
+        except Exception as e:
+            print(f"Last message columns for rooms might already exist: {e}")
+
+        # 每个群的消息保留天数，空表示使用全局配置
+        try:
+            conn.execute(db.text("ALTER TABLE rooms ADD COLUMN retention_days INTEGER"))
+            conn.commit()
+            print("Added retention_days column to rooms table.")
+        except Exception as e:
+            print(f"Column retention_days for rooms might already exist: {e}")
+
     # 3. Create Indexes for High Performance
     with db.engine.connect() as conn:
         indexes = [
@@ -41,6 +80,37 @@ with app.app_context():
             except Exception as e:
                 print(f"Error creating index {idx_name}: {e}")
 
+    # 3.0 attachments.url 去掉唯一约束 (按内容去重后，相同内容的上传共用一个 URL)；SQLite 只能重建表
+    with db.engine.connect() as conn:
+        unique = conn.execute(db.text(
+            "SELECT 1 FROM sqlite_master WHERE type = 'index' AND name = 'sqlite_autoindex_attachments_1'"
+        )).first()
+        if unique:
+            columns = ', '.join(c.name for c in Attachment.__table__.columns)
+            for index in Attachment.__table__.indexes:
+                conn.execute(db.text(f"DROP INDEX IF EXISTS {index.name}"))
+            conn.execute(db.text("ALTER TABLE attachments RENAME TO attachments_old"))
+            Attachment.__table__.create(bind=conn)
+            conn.execute(db.text(f"INSERT INTO attachments ({columns}) SELECT {columns} FROM attachments_old"))
+            conn.execute(db.text("DROP TABLE attachments_old"))
+            conn.commit()
+            print("Rebuilt attachments table without unique url.")
+
+    # 3.1 models.py 中声明的索引 (__table_args__)，create_all 不会给已存在的表补建
+    for table in db.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=db.engine, checkfirst=True)
+            print(f"Ensured index {index.name} on {table.name}")
+
+    # 3.2 消息全文搜索 (FTS5 trigram)，历史消息用 backfill_search.py 分批建索引
+    search.ensure_index()
+    state = search.index_state()
+    print(f"Search index ready, backfilled {state['backfilled_id']} / {state['start_id'] - 1}")
+
+    # 3.3 后台统计：用户/群计数触发器；已有消息的小时/日统计用 backfill_rollups.py 重建
+    rollups.ensure_counters()
+    print("Stat counters ready.")
+
     # 4. Create default admin
     admin = Admin.query.filter_by(username='admin').first()
     if not admin: